@@ -1,12 +1,15 @@
 import argparse
+import asyncio
 import json
-from typing import Any
+import time
+from dataclasses import dataclass
+from typing import Any, Sequence
 
 import tiktoken
 from beartype import beartype
 
 from agent.prompts import *
-from browser_env import Trajectory
+from browser_env import TaskConfig, Trajectory, load_task_config
 from browser_env.actions import (
     Action,
     ActionParsingError,
@@ -16,6 +19,8 @@ from browser_env.actions import (
 )
 from browser_env.utils import Observation, StateInfo
 from llms import (
+    LLMGateway,
+    PromptCache,
     call_llm,
     generate_from_huggingface_completion,
     generate_from_openai_chat_completion,
@@ -23,6 +28,7 @@ from llms import (
     lm_config,
 )
 from llms.tokenizers import Tokenizer
+from llms.utils import APIInput
 
 
 class Agent:
@@ -37,12 +43,24 @@ class Agent:
         """Predict the next action given the observation"""
         raise NotImplementedError
 
+    async def anext_action(
+        self, trajectory: Trajectory, intent: str, meta_data: Any
+    ) -> Action:
+        """Predict the next action without blocking the event loop"""
+        return await asyncio.to_thread(
+            self.next_action, trajectory, intent, meta_data
+        )
+
     def reset(
         self,
-        test_config_file: str,
+        test_config_file: str | TaskConfig,
     ) -> None:
         raise NotImplementedError
 
+    def close(self) -> None:
+        """Release the resources of the agent"""
+        pass
+
 
 class TeacherForcingAgent(Agent):
     """Agent that follows a pre-defined action sequence"""
@@ -53,11 +71,11 @@ class TeacherForcingAgent(Agent):
     def set_action_set_tag(self, tag: str) -> None:
         self.action_set_tag = tag
 
-    def set_actions(self, action_seq: str | list[str]) -> None:
+    def set_actions(self, action_seq: str | Sequence[str]) -> None:
         if isinstance(action_seq, str):
             action_strs = action_seq.strip().split("\n")
         else:
-            action_strs = action_seq
+            action_strs = list(action_seq)
         action_strs = [a.strip() for a in action_strs]
 
         actions = []
@@ -87,14 +105,39 @@ class TeacherForcingAgent(Agent):
 
     def reset(
         self,
-        test_config_file: str,
+        test_config_file: str | TaskConfig,
     ) -> None:
-        with open(test_config_file) as f:
-            ref_actions = json.load(f)["reference_action_sequence"]
-            tag = ref_actions["action_set_tag"]
-            action_seq = ref_actions["action_sequence"]
-            self.set_action_set_tag(tag)
-            self.set_actions(action_seq)
+        ref_actions = load_task_config(test_config_file)[
+            "reference_action_sequence"
+        ]
+        tag = ref_actions["action_set_tag"]
+        action_seq = ref_actions["action_sequence"]
+        self.set_action_set_tag(tag)
+        self.set_actions(action_seq)
+
+
+@dataclass
+class StreamStats:
+    """what the early exit of the streamed responses saved
+
+    the tokens that were not generated are counted up to the completion
+    budget, the model may have stopped earlier, and the time is estimated
+    at the decoding rate of the stream
+    """
+
+    requests: int = 0
+    early_exits: int = 0
+    tokens: int = 0
+    seconds: float = 0.0
+    tokens_saved: int = 0
+    seconds_saved: float = 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.early_exits}/{self.requests} responses cut after the "
+            f"action, {self.tokens} tokens in {self.seconds:.1f}s, saved up "
+            f"to {self.tokens_saved} tokens and {self.seconds_saved:.1f}s"
+        )
 
 
 class PromptAgent(Agent):
@@ -106,11 +149,25 @@ class PromptAgent(Agent):
         action_set_tag: str,
         lm_config: lm_config.LMConfig,
         prompt_constructor: PromptConstructor,
+        stream_action: bool = False,
     ) -> None:
+        """
+        :param stream_action: stream the responses and cancel them as soon
+            as they contain a valid action
+        """
         super().__init__()
         self.lm_config = lm_config
         self.prompt_constructor = prompt_constructor
         self.action_set_tag = action_set_tag
+        # shared by the concurrent episodes, used by `anext_action`
+        self.gateway: LLMGateway | None = None
+        self.stream_action = stream_action
+        self.stream_stats = StreamStats()
+        # the event loop and the gateway of the sync streaming calls
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.owns_gateway = False
+        # replays the responses at temperature 0, opt-in
+        self.cache: PromptCache | None = None
 
     def set_action_set_tag(self, tag: str) -> None:
         self.action_set_tag = tag
@@ -119,42 +176,157 @@ class PromptAgent(Agent):
     def next_action(
         self, trajectory: Trajectory, intent: str, meta_data: dict[str, Any]
     ) -> Action:
+        if self.stream_action:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+            return self.loop.run_until_complete(
+                self.anext_action(trajectory, intent, meta_data)
+            )
         prompt = self.prompt_constructor.construct(
             trajectory, intent, meta_data
         )
         lm_config = self.lm_config
         n = 0
         while True:
-            response = call_llm(lm_config, prompt)
-            force_prefix = self.prompt_constructor.instruction[
-                "meta_data"
-            ].get("force_prefix", "")
-            response = f"{force_prefix}{response}"
+            response = call_llm(lm_config, prompt, self.cache)
             n += 1
-            try:
-                parsed_response = self.prompt_constructor.extract_action(
-                    response
+            action = self.response_to_action(
+                response, n >= lm_config.gen_config["max_retry"]
+            )
+            if action is not None:
+                return action
+
+    async def anext_action(
+        self, trajectory: Trajectory, intent: str, meta_data: dict[str, Any]
+    ) -> Action:
+        if self.gateway is None:
+            if not self.stream_action:
+                return await super().anext_action(
+                    trajectory, intent, meta_data
                 )
-                if self.action_set_tag == "id_accessibility_tree":
-                    action = create_id_based_action(parsed_response)
-                elif self.action_set_tag == "playwright":
-                    action = create_playwright_action(parsed_response)
-                else:
-                    raise ValueError(
-                        f"Unknown action type {self.action_set_tag}"
-                    )
-                action["raw_prediction"] = response
+            self.gateway = LLMGateway(
+                self.lm_config, self.prompt_constructor.tokenizer
+            )
+            self.owns_gateway = True
+        prompt = self.prompt_constructor.construct(
+            trajectory, intent, meta_data
+        )
+        n = 0
+        while True:
+            response = await self.agenerate_response(prompt)
+            n += 1
+            action = self.response_to_action(
+                response, n >= self.lm_config.gen_config["max_retry"]
+            )
+            if action is not None:
+                return action
+
+    async def agenerate_response(self, prompt: APIInput) -> str:
+        assert self.gateway is not None
+        if self.cache is not None:
+            cached = await asyncio.to_thread(
+                self.cache.get, self.lm_config, prompt
+            )
+            if cached is not None:
+                return cached
+        if self.stream_action:
+            response = await self.astream_until_action(prompt)
+        else:
+            response = await self.gateway.agenerate(prompt)
+        if self.cache is not None:
+            await asyncio.to_thread(
+                self.cache.put, self.lm_config, prompt, response
+            )
+        return response
+
+    async def astream_until_action(self, prompt: APIInput) -> str:
+        """Stream the response and cancel it once it has a valid action"""
+        assert self.gateway is not None
+        tokenizer = self.prompt_constructor.tokenizer
+        splitter = self.prompt_constructor.instruction["meta_data"].get(
+            "action_splitter", ""
+        )
+        force_prefix = self.prompt_constructor.instruction["meta_data"].get(
+            "force_prefix", ""
+        )
+        stats = self.stream_stats
+        stats.requests += 1
+        start = time.perf_counter()
+        first_chunk_time = 0.0
+        response = ""
+        stream = self.gateway.astream(prompt)
+        try:
+            async for chunk in stream:
+                if not response:
+                    first_chunk_time = time.perf_counter()
+                response += chunk
+                # the action is complete once its closing splitter arrives
+                if splitter and splitter[-1] not in chunk:
+                    continue
+                try:
+                    self.parse_action(f"{force_prefix}{response}")
+                except ActionParsingError:
+                    continue
                 break
-            except ActionParsingError as e:
-                if n >= lm_config.gen_config["max_retry"]:
-                    action = create_none_action()
-                    action["raw_prediction"] = response
-                    break
+            else:
+                return response
+        finally:
+            await stream.aclose()
+            end = time.perf_counter()
+            num_tokens = len(tokenizer.encode(response))
+            stats.tokens += num_tokens
+            stats.seconds += end - start
+        # cut short, the model may have written more after the action
+        stats.early_exits += 1
+        tokens_saved = max(0, self.gateway.max_tokens - num_tokens)
+        stats.tokens_saved += tokens_saved
+        if num_tokens > 1 and end > first_chunk_time:
+            tokens_per_second = (num_tokens - 1) / (end - first_chunk_time)
+            stats.seconds_saved += tokens_saved / tokens_per_second
+        return response
+
+    def parse_action(self, response: str) -> Action:
+        """Parse the action of the response with its force prefix"""
+        parsed_response = self.prompt_constructor.extract_action(response)
+        if self.action_set_tag == "id_accessibility_tree":
+            action = create_id_based_action(parsed_response)
+        elif self.action_set_tag == "playwright":
+            action = create_playwright_action(parsed_response)
+        else:
+            raise ValueError(f"Unknown action type {self.action_set_tag}")
+        return action
 
+    def response_to_action(
+        self, response: str, last_try: bool
+    ) -> Action | None:
+        """Parse the action of the response, None to ask the model again"""
+        force_prefix = self.prompt_constructor.instruction["meta_data"].get(
+            "force_prefix", ""
+        )
+        response = f"{force_prefix}{response}"
+        try:
+            action = self.parse_action(response)
+        except ActionParsingError as e:
+            if not last_try:
+                return None
+            action = create_none_action()
+        action["raw_prediction"] = response
         return action
 
-    def reset(self, test_config_file: str) -> None:
-        pass
+    def reset(self, test_config_file: str | TaskConfig) -> None:
+        self.stream_stats = StreamStats()
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+        if self.owns_gateway and self.loop is not None:
+            assert self.gateway is not None
+            self.loop.run_until_complete(self.gateway.aclose())
+            self.gateway = None
+            self.owns_gateway = False
+        if self.loop is not None:
+            self.loop.close()
+            self.loop = None
 
 
 def construct_agent(args: argparse.Namespace) -> Agent:
@@ -206,7 +378,12 @@ def construct_agent_from_config(config: WebArenaConfig) -> Agent:
             action_set_tag=config.action_set_tag,
             lm_config=llm_config,
             prompt_constructor=prompt_constructor,
+            stream_action=config.agent.stream_action,
         )
+        if config.lm.cache_path:
+            agent.cache = PromptCache(
+                config.lm.cache_path, config.lm.cache_max_mb
+            )
     else:
         raise NotImplementedError(
             f"agent type {agent_type} not implemented"
@@ -226,6 +403,7 @@ def _construct_llm_config_from_config(config: WebArenaConfig) -> LMConfig:
         llm_config.gen_config["max_tokens"] = args.max_tokens
         llm_config.gen_config["stop_token"] = args.stop_token
         llm_config.gen_config["max_obs_length"] = args.max_obs_length
+        llm_config.gen_config["obs_truncation"] = args.obs_truncation
         llm_config.gen_config["max_retry"] = args.max_retry
     elif args.provider == "huggingface":
         llm_config.gen_config["temperature"] = args.temperature
@@ -235,6 +413,7 @@ def _construct_llm_config_from_config(config: WebArenaConfig) -> LMConfig:
             [args.stop_token] if args.stop_token else None
         )
         llm_config.gen_config["max_obs_length"] = args.max_obs_length
+        llm_config.gen_config["obs_truncation"] = args.obs_truncation
         llm_config.gen_config["model_endpoint"] = args.model_endpoint
         llm_config.gen_config["max_retry"] = args.max_retry
     else:
@@ -10,6 +10,8 @@ from llms import lm_config
 from llms.tokenizers import Tokenizer
 from llms.utils import APIInput
 
+from .truncation import ObservationTruncator, TreeBudgeter
+
 
 class Instruction(TypedDict):
     """Instruction for constructing prompt"""
@@ -34,6 +36,8 @@ class PromptConstructor(object):
         instruction["examples"] = [tuple(e) for e in instruction["examples"]]
         self.instruction: Instruction = instruction
         self.tokenizer = tokenizer
+        self.truncator = ObservationTruncator(tokenizer)
+        self.budgeter = TreeBudgeter(self.truncator)
 
     def get_lm_api_input(
         self, intro: str, examples: list[tuple[str, str]], current: str
@@ -119,6 +123,25 @@ class PromptConstructor(object):
     ) -> APIInput:
         raise NotImplementedError
 
+    def fit_observation(
+        self,
+        obs: str,
+        max_obs_length: int,
+        intent: str,
+        state_info: StateInfo,
+    ) -> str:
+        """Cut the observation to `max_obs_length` tokens, either keeping
+        its beginning or, with the "structure" truncation, its most
+        relevant nodes"""
+        truncation = self.lm_config.gen_config.get("obs_truncation", "head")
+        if truncation == "structure":
+            metadata = state_info["info"].get("observation_metadata", {})
+            obs_nodes_info = metadata.get("text", {}).get("obs_nodes_info", {})
+            return self.budgeter.pack(
+                obs, max_obs_length, intent, obs_nodes_info
+            )
+        return self.truncator.truncate(obs, max_obs_length)
+
     def map_url_to_real(self, url: str) -> str:
         """Map the urls to their real world counterparts"""
         for i, j in URL_MAPPINGS.items():
@@ -172,7 +195,7 @@ class DirectPromptConstructor(PromptConstructor):
         obs = state_info["observation"][self.obs_modality]
         max_obs_length = self.lm_config.gen_config["max_obs_length"]
         if max_obs_length:
-            obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+            obs = self.fit_observation(obs, max_obs_length, intent, state_info)  # type: ignore[arg-type]
 
         page = state_info["info"]["page"]
         url = page.url
@@ -230,7 +253,7 @@ class CoTPromptConstructor(PromptConstructor):
         obs = state_info["observation"][self.obs_modality]
         max_obs_length = self.lm_config.gen_config["max_obs_length"]
         if max_obs_length:
-            obs = self.tokenizer.decode(self.tokenizer.encode(obs)[:max_obs_length])  # type: ignore[arg-type]
+            obs = self.fit_observation(obs, max_obs_length, intent, state_info)  # type: ignore[arg-type]
 
         page = state_info["info"]["page"]
         url = page.url
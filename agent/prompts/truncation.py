@@ -0,0 +1,214 @@
+import math
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any
+
+from llms.tokenizers import Tokenizer
+
+
+class ObservationTruncator:
+    """Cut an observation to a token budget, one line at a time
+
+    The lines are tokenized on their own until the budget is used up, the
+    rest of the observation is not tokenized at all. Their token counts
+    are kept across the steps, since most lines of a page are still there
+    after an action. At the line boundaries, the count of a line on its
+    own may differ by a token from its count within the whole text.
+    """
+
+    def __init__(
+        self, tokenizer: Tokenizer, max_cached_lines: int = 100_000
+    ) -> None:
+        self.tokenizer = tokenizer
+        self.max_cached_lines = max_cached_lines
+        self.line_lengths: OrderedDict[str, int] = OrderedDict()
+
+    def count(self, line: str) -> int:
+        length = self.line_lengths.get(line)
+        if length is None:
+            length = len(self.tokenizer.encode(line))
+            self.line_lengths[line] = length
+            if len(self.line_lengths) > self.max_cached_lines:
+                self.line_lengths.popitem(last=False)
+        else:
+            self.line_lengths.move_to_end(line)
+        return length
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        budget = max_tokens
+        end = 0
+        for line in text.splitlines(keepends=True):
+            length = self.count(line)
+            if length > budget:
+                # the beginning of the line that still fits
+                tokens = self.tokenizer.encode(line)[:budget]
+                return text[:end] + self.tokenizer.decode(tokens)
+            budget -= length
+            end += len(line)
+        return text
+
+
+# the roles the agent can act on
+INTERACTIVE_ROLES = frozenset(
+    [
+        "button",
+        "checkbox",
+        "combobox",
+        "link",
+        "listbox",
+        "menuitem",
+        "option",
+        "radio",
+        "searchbox",
+        "slider",
+        "spinbutton",
+        "switch",
+        "tab",
+        "textbox",
+        "treeitem",
+    ]
+)
+
+STOP_WORDS = frozenset(
+    "the and for with that this from what which how are was were has have "
+    "not all any can you your their them its into about over under there "
+    "then than show tell find give list get".split()
+)
+
+NODE_LINE = re.compile(r"(\t*)\[(\d+)\] (\S+)(.*)")
+
+
+@dataclass
+class TreeLine:
+    text: str
+    depth: int
+    # index of the closest line above that is less indented, -1 if none
+    parent: int
+    node_id: str = ""
+    role: str = ""
+    content: str = ""
+
+
+def intent_keywords(intent: str) -> set[str]:
+    words = re.findall(r"[a-z0-9]+", intent.lower())
+    return {w for w in words if len(w) > 2 and w not in STOP_WORDS}
+
+
+def parse_tree_lines(tree: str) -> list[TreeLine]:
+    lines: list[TreeLine] = []
+    # the lines that can still be the parent of the next ones
+    ancestors: list[int] = []
+    for text in tree.splitlines(keepends=True):
+        match = NODE_LINE.match(text)
+        if match is None:
+            # the tab titles and the blank line before the tree
+            lines.append(TreeLine(text, -1, -1))
+            continue
+        indent, node_id, role, content = match.groups()
+        depth = len(indent)
+        while ancestors and lines[ancestors[-1]].depth >= depth:
+            ancestors.pop()
+        parent = ancestors[-1] if ancestors else -1
+        lines.append(
+            TreeLine(text, depth, parent, node_id, role, content.lower())
+        )
+        ancestors.append(len(lines) - 1)
+    return lines
+
+
+class TreeBudgeter:
+    """Pack the most relevant nodes of an accessibility tree into a token
+    budget, instead of keeping its beginning
+
+    A node scores for an interactive role, for the keywords of the intent
+    in its text or in the text of its ancestors, and for its closeness to
+    the focused node on the page. The nodes are taken from the best one
+    down, each with the ancestors it needs to keep its place in the tree,
+    while they fit. The kept lines stay in the order of the tree, with
+    their ids, so the actions on them work as before.
+    """
+
+    def __init__(self, truncator: ObservationTruncator) -> None:
+        self.truncator = truncator
+
+    def score(
+        self,
+        lines: list[TreeLine],
+        intent: str,
+        obs_nodes_info: dict[str, Any],
+    ) -> list[float]:
+        keywords = intent_keywords(intent)
+        focus = next(
+            (
+                self.center(obs_nodes_info, line.node_id)
+                for line in lines
+                if "focused: true" in line.content
+            ),
+            None,
+        )
+        scores: list[float] = []
+        # the keyword score of a section is shared with its content
+        inherited: list[float] = []
+        for line in lines:
+            if not line.node_id:
+                scores.append(0.0)
+                inherited.append(0.0)
+                continue
+            score = 2.0 if line.role in INTERACTIVE_ROLES else 0.0
+            matched = 3.0 * sum(k in line.content for k in keywords)
+            if line.parent >= 0:
+                matched += 0.5 * inherited[line.parent]
+            inherited.append(matched)
+            score += matched
+            center = self.center(obs_nodes_info, line.node_id)
+            if focus is not None and center is not None:
+                distance = math.dist(focus, center)
+                score += 2.0 / (1.0 + distance / 200)
+            scores.append(score)
+        return scores
+
+    @staticmethod
+    def center(
+        obs_nodes_info: dict[str, Any], node_id: str
+    ) -> tuple[float, float] | None:
+        info = obs_nodes_info.get(node_id)
+        if not info or not info.get("union_bound"):
+            return None
+        x, y, width, height = info["union_bound"]
+        return (x + width / 2, y + height / 2)
+
+    def pack(
+        self,
+        tree: str,
+        max_tokens: int,
+        intent: str,
+        obs_nodes_info: dict[str, Any],
+    ) -> str:
+        lines = parse_tree_lines(tree)
+        lengths = [self.truncator.count(line.text) for line in lines]
+        if sum(lengths) <= max_tokens:
+            return tree
+        if not any(line.node_id for line in lines):
+            return self.truncator.truncate(tree, max_tokens)
+
+        kept = [not line.node_id for line in lines]
+        budget = max_tokens - sum(
+            length for length, keep in zip(lengths, kept) if keep
+        )
+        scores = self.score(lines, intent, obs_nodes_info)
+        # the earlier node first among equals, as with head truncation
+        order = sorted(range(len(lines)), key=lambda idx: (-scores[idx], idx))
+        for idx in order:
+            if budget <= 0:
+                break
+            chain = []
+            while idx >= 0 and not kept[idx]:
+                chain.append(idx)
+                idx = lines[idx].parent
+            cost = sum(lengths[idx] for idx in chain)
+            if cost <= budget:
+                budget -= cost
+                for idx in chain:
+                    kept[idx] = True
+        return "".join(line.text for line, keep in zip(lines, kept) if keep)
@@ -34,6 +34,12 @@ from .actions import (
 from .async_envs import AsyncScriptBrowserEnv
 from .envs import ScriptBrowserEnv
 from .processors import ObservationMetadata
+from .task_config import (
+    TaskCatalog,
+    TaskConfig,
+    load_task_config,
+    open_catalog,
+)
 from .trajectory import Trajectory
 from .utils import DetachedPage, StateInfo
 
@@ -73,4 +79,8 @@ __all__ = [
     "create_stop_action",
     "ActionParsingError",
     "Trajectory",
+    "TaskConfig",
+    "TaskCatalog",
+    "open_catalog",
+    "load_task_config",
 ]
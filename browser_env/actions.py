@@ -1230,7 +1230,10 @@ def execute_action(
 
 
 async def aexecute_action(
-    action: Action, page: APage, browser_ctx: ABrowserContext
+    action: Action,
+    page: APage,
+    browser_ctx: ABrowserContext,
+    obseration_processor: ObservationProcessor,
 ) -> APage:
     """Execute the async action on the ChromeDriver."""
     action_type = action["action_type"]
@@ -1259,7 +1262,11 @@ async def aexecute_action(
             # check each kind of locator in order
             # TODO[shuyanzh]: order is temp now
             if action["element_id"]:
-                raise NotImplementedError
+                element_id = action["element_id"]
+                element_center = obseration_processor.get_element_center(element_id)  # type: ignore[attr-defined]
+                await aexecute_mouse_click(
+                    element_center[0], element_center[1], page
+                )
             elif action["element_role"] and action["element_name"]:
                 element_role = int(action["element_role"])
                 element_name = action["element_name"]
@@ -1277,7 +1284,11 @@ async def aexecute_action(
                 raise ValueError("No proper locator found for click action")
         case ActionTypes.HOVER:
             if action["element_id"]:
-                raise NotImplementedError
+                element_id = action["element_id"]
+                element_center = obseration_processor.get_element_center(element_id)  # type: ignore[attr-defined]
+                await aexecute_mouse_hover(
+                    element_center[0], element_center[1], page
+                )
             elif action["element_role"] and action["element_name"]:
                 element_role = int(action["element_role"])
                 element_name = action["element_name"]
@@ -1296,7 +1307,12 @@ async def aexecute_action(
                 )
         case ActionTypes.TYPE:
             if action["element_id"]:
-                raise NotImplementedError
+                element_id = action["element_id"]
+                element_center = obseration_processor.get_element_center(element_id)  # type: ignore[attr-defined]
+                await aexecute_mouse_click(
+                    element_center[0], element_center[1], page
+                )
+                await aexecute_type(action["text"], page)
             elif action["element_role"] and action["element_name"]:
                 element_role = int(action["element_role"])
                 element_name = action["element_name"]
@@ -1321,6 +1337,7 @@ async def aexecute_action(
             await page.bring_to_front()
         case ActionTypes.NEW_TAB:
             page = await browser_ctx.new_page()
+            page.client = await page.context.new_cdp_session(page)  # type: ignore[attr-defined]
         case ActionTypes.GO_BACK:
             await page.go_back()
         case ActionTypes.GO_FORWARD:
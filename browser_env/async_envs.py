@@ -1,25 +1,36 @@
 import asyncio
-import json
-from dataclasses import dataclass
+import time
 from pathlib import Path
+from typing import Any, Coroutine, TypeVar
 
-import numpy as np
-import numpy.typing as npt
 from gymnasium import Env
-from gymnasium.spaces import Box, Text
-from playwright.async_api import Page, ViewportSize, async_playwright
+from playwright.async_api import (
+    Browser,
+    CDPSession,
+    Page,
+    Playwright,
+    ViewportSize,
+    async_playwright,
+)
 
 from .actions import Action, aexecute_action, get_action_space
-from .utils import DetachedPage, png_bytes_to_numpy
+from .processors import ObservationHandler, ObservationMetadata
+from .settle import (
+    NetworkTracker,
+    SettleTimings,
+    async_wait_for_settled,
+)
+from .task_config import TaskConfig, load_task_config
+from .utils import DetachedPage, Observation
 
+T = TypeVar("T")
 
-class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
+
+class AsyncScriptBrowserEnv(Env[dict[str, Observation], Action]):
     """
-    The goal of this environment is to produce a prototype of a browser environment.
-    In the end, we want to support a fully configurable browser environment with wide
-    range of action spaces and observation spaces, both structured and unstructured.
-    But in this prototype, we just support action space specified by Playwright script,
-    and observation space is the html content of the page.
+    The async counterpart of `ScriptBrowserEnv`, with the same observations,
+    actions and info. Many environments can share one browser and one event
+    loop, each of them works in its own context.
     """
 
     def __init__(
@@ -29,36 +40,108 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
         slow_mo: int = 0,
         timeout: int = 30000,
         viewport_size: ViewportSize = {"width": 1280, "height": 720},
-    ):
-        self.observation_space = Box(
-            0,
-            255,
-            (viewport_size["height"], viewport_size["width"], 4),
-            np.uint8,
-        )
+        observation_type: str = "html",
+        current_viewport_only: bool = False,
+        save_trace_enabled: bool = False,
+        sleep_after_execution: float = 0.0,
+        settle_timeout: float = 0.0,
+        settle_quiet_window: float = 0.5,
+        incremental_observation: bool = False,
+        capture_screenshot: bool = True,
+        screenshot_format: str = "png",
+        decode_screenshot: bool = True,
+        browser: Browser | None = None,
+    ) -> None:
+        """
+        :param browser: a browser shared with other environments, which is
+            not closed with the environment, one is launched if not given
+        """
         # TODO: make Space[Action] = ActionSpace
         self.action_space = get_action_space()  # type: ignore[assignment]
         self.headless = headless
         self.slow_mo = slow_mo
+        self.current_viewport_only = current_viewport_only
         self.reset_finished = False
         self.timeout = timeout
         self.viewport_size = viewport_size
+        self.save_trace_enabled = save_trace_enabled
+        self.sleep_after_execution = sleep_after_execution
+        self.settle_timeout = settle_timeout
+        self.settle_quiet_window = settle_quiet_window
+
+        self.browser = browser
+        self.owns_browser = browser is None
+        self.context_manager: Any = None
+        self.playwright: Playwright | None = None
+        # the event loop of the sync wrappers, the playwright objects are
+        # bound to the loop they were created in
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+        match observation_type:
+            case "html" | "accessibility_tree":
+                self.text_observation_type = observation_type
+                self.image_observation_type = ""
+                self.main_observation_type = "text"
+            case "image":
+                self.image_observation_type = observation_type
+                self.text_observation_type = ""  # type: ignore[assignment]
+                self.main_observation_type = "image"
+            case _:
+                raise ValueError(
+                    f"Unsupported observation type: {observation_type}"
+                )
 
-    async def setup(self, config_file: Path | None = None) -> None:
+        self.observation_handler = ObservationHandler(
+            self.main_observation_type,
+            self.text_observation_type,
+            self.image_observation_type,
+            self.current_viewport_only,
+            self.viewport_size,
+            incremental_observation=incremental_observation,
+            capture_screenshot=capture_screenshot,
+            screenshot_format=screenshot_format,
+            decode_screenshot=decode_screenshot,
+        )
+
+        self.observation_space = (
+            self.observation_handler.get_observation_space()  # type: ignore[assignment]
+        )
+
+    async def launch(self) -> Browser:
         self.context_manager = async_playwright()
         self.playwright = await self.context_manager.__aenter__()
+        assert self.playwright is not None
         self.browser = await self.playwright.chromium.launch(
             headless=self.headless, slow_mo=self.slow_mo
         )
-        if config_file:
-            with open(config_file, "r") as f:
-                instance_config = json.load(f)
-        else:
-            instance_config = {}
+        return self.browser
 
-        storage_state = instance_config.get("storage_state", None)
-        start_url = instance_config.get("start_url", None)
-        geolocation = instance_config.get("geolocation", None)
+    async def new_page(self) -> Page:
+        page = await self.context.new_page()
+        client = await page.context.new_cdp_session(page)
+        if self.text_observation_type == "accessibility_tree":
+            await client.send("Accessibility.enable")
+        page.client = client  # type: ignore
+        return page
+
+    async def setup(
+        self, config_file: Path | TaskConfig | None = None
+    ) -> None:
+        if self.browser is None or not self.browser.is_connected():
+            # also when the shared browser is gone
+            await self.launch()
+            self.owns_browser = True
+        assert self.browser is not None
+
+        storage_state: str | None = None
+        start_url: str | None = None
+        geolocation: Any = None
+        if config_file:
+            task_config = load_task_config(config_file)
+            storage_state = task_config.storage_state
+            start_url = task_config.start_url
+            if task_config.geolocation is not None:
+                geolocation = dict(task_config.geolocation)
 
         self.context = await self.browser.new_context(
             viewport=self.viewport_size,
@@ -66,88 +149,166 @@ class AsyncScriptBrowserEnv(Env[npt.NDArray[np.uint8], Action]):
             geolocation=geolocation,
             device_scale_factor=1,
         )
-        self.page = await self.context.new_page()
+        self.context.set_default_timeout(self.timeout)
+        if self.save_trace_enabled:
+            await self.context.tracing.start(screenshots=True, snapshots=True)
+        self.network_tracker = NetworkTracker(self.context)
         if start_url:
-            await self.page.goto(start_url)
+            start_urls = start_url.split(" |AND| ")
+            for url in start_urls:
+                page = await self.new_page()
+                await page.goto(url)
+            # set the first page as the current page
+            self.page = self.context.pages[0]
+            await self.page.bring_to_front()
+        else:
+            self.page = await self.new_page()
+
+    def get_page_client(self, page: Page) -> CDPSession:
+        return page.client  # type: ignore
+
+    async def _wait_after_execution(self) -> SettleTimings:
+        if self.settle_timeout > 0:
+            return await async_wait_for_settled(
+                self.page,
+                self.network_tracker,
+                self.settle_timeout,
+                self.settle_quiet_window,
+            )
+        start = time.perf_counter()
+        if self.sleep_after_execution > 0:
+            await asyncio.sleep(self.sleep_after_execution)
+        total = time.perf_counter() - start
+        return {"load": 0.0, "network": 0.0, "dom": 0.0, "total": total}
+
+    async def _get_obs(self) -> dict[str, Observation]:
+        obs = await self.observation_handler.aget_observation(
+            self.page, self.get_page_client(self.page)
+        )
+        return obs
+
+    def _get_obs_metadata(self) -> dict[str, ObservationMetadata]:
+        metadata = self.observation_handler.get_observation_metadata()
+        return metadata
 
     async def areset(
         self,
         *,
         seed: int | None = None,
-        options: dict[str, str] | None = None,
-    ) -> tuple[npt.NDArray[np.uint8], dict[str, object]]:
+        options: dict[str, str | TaskConfig] | None = None,
+    ) -> tuple[dict[str, Observation], dict[str, Any]]:
         """
         Reset the environment.
-        :param options: options for the environment. The options are:
-            - storage_state: the path to the storage state file
+        :param options: options for the environment. The current supported options are:
+            - "config_file": the path to the config file of the task, or its TaskConfig
         """
         super().reset(seed=seed, options=options)
         if self.reset_finished:
-            await self.context_manager.__aexit__()
+            await self.context.close()
+
         if options is not None and "config_file" in options:
-            config_file = Path(options["config_file"])
-            if config_file.exists():
+            config_file = options["config_file"]
+            if isinstance(config_file, TaskConfig):
+                # already parsed, e.g., looked up in a catalog
                 await self.setup(config_file=config_file)
+            elif Path(config_file).exists():
+                await self.setup(config_file=Path(config_file))
             else:
-                raise ValueError(f"Config state {config_file} does not exist.")
+                raise ValueError(f"Config file {config_file} does not exist.")
         else:
             await self.setup()
         self.reset_finished = True
-        content = await self.page.content()
-        screenshot = png_bytes_to_numpy(await self.page.screenshot())
-        return (
-            screenshot,
-            {"page": DetachedPage(self.page.url, content)},
-        )
 
-    def reset(
-        self,
-        *,
-        seed: int | None = None,
-        options: dict[str, str] | None = None,
-    ) -> tuple[npt.NDArray[np.uint8], dict[str, object]]:
-        return asyncio.run(self.areset(seed=seed, options=options))
+        settle_timings = await self._wait_after_execution()
+
+        observation = await self._get_obs()
+        observation_metadata = self._get_obs_metadata()
+        info = {
+            "page": DetachedPage(self.page.url, ""),
+            "fail_error": "",
+            "observation_metadata": observation_metadata,
+            "settle_timings": settle_timings,
+        }
+
+        return (observation, info)
+
+    async def asave_trace(self, trace_path: str | Path) -> None:
+        if self.save_trace_enabled:
+            await self.context.tracing.stop(path=trace_path)
 
     async def aclose(self) -> None:
         if self.reset_finished:
+            await self.context.close()
+            self.reset_finished = False
+        if self.owns_browser and self.context_manager is not None:
             await self.context_manager.__aexit__()
-
-    def close(self) -> None:
-        asyncio.run(self.aclose())
+            self.context_manager = None
+            self.playwright = None
+            self.browser = None
 
     async def astep(
         self, action: Action
-    ) -> tuple[npt.NDArray[np.uint8], float, bool, bool, dict[str, object]]:
+    ) -> tuple[dict[str, Observation], float, bool, bool, dict[str, Any]]:
         if not self.reset_finished:
             raise RuntimeError("Call reset first before calling step.")
+
         success = False
         fail_error = ""
         try:
-            self.page = await aexecute_action(action, self.page, self.context)
+            self.page = await aexecute_action(
+                action,
+                self.page,
+                self.context,
+                self.observation_handler.action_processor,
+            )
             success = True
         except Exception as e:
             fail_error = str(e)
 
-        try:
-            content = await self.page.content()
-            screenshot = png_bytes_to_numpy(await self.page.screenshot())
-        except:
-            await self.page.wait_for_load_state("load")
-            content = await self.page.content()
-            screenshot = png_bytes_to_numpy(await self.page.screenshot())
-
-        return (
-            screenshot,
-            float(success),
-            False,
-            False,
-            {
-                "page": DetachedPage(self.page.url, content),
-                "fail_error": fail_error,
-            },
+        settle_timings = await self._wait_after_execution()
+
+        observation = await self._get_obs()
+        observation_metadata = self._get_obs_metadata()
+
+        info = {
+            "page": DetachedPage(self.page.url, await self.page.content()),
+            "fail_error": fail_error,
+            "observation_metadata": observation_metadata,
+            "settle_timings": settle_timings,
+        }
+        msg = (
+            observation,
+            float(success),  # reward
+            False,  # terminated
+            False,  # truncated
+            info,
         )
+        return msg
+
+    def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """Run a coroutine of the env outside of an event loop, always in
+        the same loop"""
+        if self.loop is None or self.loop.is_closed():
+            self.loop = asyncio.new_event_loop()
+        return self.loop.run_until_complete(coroutine)
+
+    def reset(
+        self,
+        *,
+        seed: int | None = None,
+        options: dict[str, str | TaskConfig] | None = None,
+    ) -> tuple[dict[str, Observation], dict[str, Any]]:
+        return self.run(self.areset(seed=seed, options=options))
 
     def step(
         self, action: Action
-    ) -> tuple[npt.NDArray[np.uint8], float, bool, bool, dict[str, object]]:
-        return asyncio.run(self.astep(action), debug=True)
+    ) -> tuple[dict[str, Observation], float, bool, bool, dict[str, Any]]:
+        return self.run(self.astep(action))
+
+    def save_trace(self, trace_path: str | Path) -> None:
+        self.run(self.asave_trace(trace_path))
+
+    def close(self) -> None:
+        self.run(self.aclose())
+        assert self.loop is not None
+        self.loop.close()
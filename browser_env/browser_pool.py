@@ -0,0 +1,159 @@
+"""A persistent browser that hands out a fresh context to every task.
+
+Launching Chromium often takes longer than the task itself. The browser is
+kept across tasks and each task gets its own `BrowserContext`, which does
+not share cookies, storage or cache with the other contexts. The browser is
+relaunched after a number of tasks or once its memory grew too much.
+"""
+import json
+import os
+from typing import Any
+
+from playwright.sync_api import (
+    Browser,
+    BrowserContext,
+    Playwright,
+    ViewportSize,
+    sync_playwright,
+)
+
+
+def get_browser_memory(browser: Browser) -> float | None:
+    """Resident memory of all the browser processes in MB, None if it cannot
+    be measured on this platform"""
+    try:
+        client = browser.new_browser_cdp_session()
+        process_info = client.send("SystemInfo.getProcessInfo")["processInfo"]
+        client.detach()
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        rss = 0
+        for process in process_info:
+            with open(f"/proc/{process['id']}/statm", "r") as f:
+                rss += int(f.read().split()[1]) * page_size
+        return rss / 2**20
+    except Exception:
+        return None
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        headless: bool = True,
+        slow_mo: int = 0,
+        viewport_size: ViewportSize = {"width": 1280, "height": 720},
+        pool_size: int = 0,
+        recycle_after: int = 1,
+        recycle_memory_growth: float = 0.0,
+    ) -> None:
+        """
+        :param pool_size: number of contexts created ahead of time
+        :param recycle_after: relaunch the browser after this many tasks,
+            0 to never relaunch, 1 relaunches for every task
+        :param recycle_memory_growth: relaunch the browser once its memory
+            grew by more than this many MB since the launch, 0 to disable
+        """
+        self.headless = headless
+        self.slow_mo = slow_mo
+        self.viewport_size = viewport_size
+        self.pool_size = pool_size
+        self.recycle_after = recycle_after
+        self.recycle_memory_growth = recycle_memory_growth
+
+        self.context_manager: Any = None
+        self.playwright: Playwright | None = None
+        self.browser: Browser | None = None
+        self.warm_contexts: list[BrowserContext] = []
+        self.served_tasks = 0
+        self.launch_memory: float | None = None
+
+    def launch(self) -> Browser:
+        self.context_manager = sync_playwright()
+        self.playwright = self.context_manager.__enter__()
+        self.browser = self.playwright.chromium.launch(
+            headless=self.headless, slow_mo=self.slow_mo
+        )
+        self.served_tasks = 0
+        if self.recycle_memory_growth > 0:
+            self.launch_memory = get_browser_memory(self.browser)
+        self.fill()
+        return self.browser
+
+    def fill(self) -> None:
+        assert self.browser is not None
+        while len(self.warm_contexts) < self.pool_size:
+            self.warm_contexts.append(self.create_context())
+
+    def create_context(self, **kwargs: Any) -> BrowserContext:
+        assert self.browser is not None
+        return self.browser.new_context(
+            viewport=self.viewport_size,
+            device_scale_factor=1,
+            **kwargs,
+        )
+
+    def new_context(
+        self,
+        storage_state: str | None = None,
+        geolocation: dict[str, float] | None = None,
+    ) -> BrowserContext:
+        """Return an unused context set up for the task"""
+        if self.browser is None or not self.browser.is_connected():
+            self.close()
+            self.launch()
+
+        storage: dict[str, Any] = {}
+        if storage_state:
+            with open(storage_state, "r") as f:
+                storage = json.load(f)
+        # the local storage can only be set when the context is created
+        if not self.warm_contexts or storage.get("origins"):
+            return self.create_context(
+                storage_state=storage_state, geolocation=geolocation
+            )
+
+        context = self.warm_contexts.pop(0)
+        if storage.get("cookies"):
+            context.add_cookies(storage["cookies"])
+        if geolocation:
+            context.set_geolocation(geolocation)  # type: ignore[arg-type]
+        return context
+
+    def should_recycle(self) -> bool:
+        if self.recycle_after > 0 and self.served_tasks >= self.recycle_after:
+            return True
+        if (
+            self.recycle_memory_growth > 0
+            and self.launch_memory is not None
+            and self.browser is not None
+        ):
+            memory = get_browser_memory(self.browser)
+            if (
+                memory is not None
+                and memory - self.launch_memory > self.recycle_memory_growth
+            ):
+                return True
+        return False
+
+    def release(self, context: BrowserContext) -> None:
+        """Close the context of a finished task, relaunch the browser if it
+        is due, otherwise top up the warm contexts"""
+        try:
+            context.close()
+        except Exception:
+            pass
+        self.served_tasks += 1
+        if self.should_recycle():
+            self.close()
+        elif self.browser is not None and self.browser.is_connected():
+            self.fill()
+
+    def close(self) -> None:
+        self.warm_contexts = []
+        if self.context_manager is not None:
+            try:
+                self.context_manager.__exit__()
+            except Exception:
+                pass
+        self.context_manager = None
+        self.playwright = None
+        self.browser = None
@@ -0,0 +1,139 @@
+"""Store texts by content, in chunks of lines shared across the texts.
+
+A text is cut after the lines whose hash ends with a few zero bits, so the
+cuts only depend on the nearby lines: an accessibility tree that changed
+in one place since the previous step still has its other chunks in common
+with it, and so do the start pages that many tasks open. The chunks are
+compressed and kept once, under the SHA-256 of their content, in a SQLite
+file that several processes can write.
+"""
+import hashlib
+import os
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Iterable
+
+# one cut every 32 lines on average
+CUT_MASK = 31
+MAX_CHUNK_SIZE = 16 * 1024
+# the number of parameters of a query stays under the limit of SQLite
+BATCH_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+"""
+
+
+def split_chunks(text: str) -> list[str]:
+    chunks: list[str] = []
+    start = end = 0
+    for line in text.splitlines(keepends=True):
+        end += len(line)
+        if (
+            zlib.crc32(line.encode("utf-8")) & CUT_MASK == 0
+            or end - start >= MAX_CHUNK_SIZE
+        ):
+            chunks.append(text[start:end])
+            start = end
+    if start < len(text):
+        chunks.append(text[start:])
+    return chunks
+
+
+def chunk_hash(chunk: str) -> str:
+    return hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+
+
+class ChunkStore:
+    """The chunks of the texts, by their hash"""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        self.connection: sqlite3.Connection | None = None
+        self.pid = 0
+
+    def connect(self) -> sqlite3.Connection:
+        # a connection inherited from the parent process is not used
+        if self.connection is None or self.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def put_many(self, texts: list[str]) -> list[list[str]]:
+        """Store the texts, returns the hashes of the chunks of each"""
+        hashes: list[list[str]] = []
+        new_chunks: dict[str, str] = {}
+        for text in texts:
+            text_hashes = []
+            for chunk in split_chunks(text):
+                key = chunk_hash(chunk)
+                new_chunks[key] = chunk
+                text_hashes.append(key)
+            hashes.append(text_hashes)
+
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO chunks VALUES (?, ?)",
+                (
+                    (key, zlib.compress(chunk.encode("utf-8")))
+                    for key, chunk in new_chunks.items()
+                ),
+            )
+        return hashes
+
+    def get_many(self, hashes: Iterable[str]) -> dict[str, str]:
+        """The chunks of the hashes, each read and decompressed once"""
+        keys = list(set(hashes))
+        chunks: dict[str, str] = {}
+        connection = self.connect()
+        for idx in range(0, len(keys), BATCH_SIZE):
+            batch = keys[idx : idx + BATCH_SIZE]
+            rows = connection.execute(
+                "SELECT hash, data FROM chunks WHERE hash IN "
+                f"({', '.join('?' * len(batch))})",
+                batch,
+            )
+            for key, data in rows:
+                chunks[key] = zlib.decompress(data).decode("utf-8")
+        missing = set(keys) - set(chunks)
+        if missing:
+            raise KeyError(f"Missing chunks: {sorted(missing)[:3]}")
+        return chunks
+
+    def join(self, hashes: list[str]) -> str:
+        chunks = self.get_many(hashes)
+        return "".join(chunks[key] for key in hashes)
+
+    def find(self, substrings: list[str]) -> set[str]:
+        """The hashes of the chunks that contain any of the substrings, a
+        substring is found as long as it does not span several lines"""
+        found: set[str] = set()
+        for key, data in self.connect().execute(
+            "SELECT hash, data FROM chunks"
+        ):
+            chunk = zlib.decompress(data).decode("utf-8")
+            if any(substring in chunk for substring in substrings):
+                found.add(key)
+        return found
+
+    def size(self) -> int:
+        """The compressed size of the chunks, in bytes"""
+        (size,) = (
+            self.connect()
+            .execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM chunks")
+            .fetchone()
+        )
+        return int(size)
+
+    def close(self) -> None:
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
@@ -1,4 +1,3 @@
-import json
 import re
 import time
 from collections import defaultdict
@@ -18,11 +17,13 @@ from playwright.sync_api import (
     Playwright,
     ViewportSize,
     expect,
-    sync_playwright,
 )
 
 from .actions import Action, execute_action, get_action_space
+from .browser_pool import BrowserPool
 from .processors import ObservationHandler, ObservationMetadata
+from .settle import NetworkTracker, SettleTimings, wait_for_settled
+from .task_config import TaskConfig, load_task_config
 from .utils import (
     AccessibilityTree,
     DetachedPage,
@@ -83,6 +84,16 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         viewport_size: ViewportSize = {"width": 1280, "height": 720},
         save_trace_enabled: bool = False,
         sleep_after_execution: float = 0.0,
+        settle_timeout: float = 0.0,
+        settle_quiet_window: float = 0.5,
+        incremental_observation: bool = False,
+        observation_record_dir: str | None = None,
+        capture_screenshot: bool = True,
+        screenshot_format: str = "png",
+        decode_screenshot: bool = True,
+        context_pool_size: int = 0,
+        browser_recycle_after: int = 1,
+        browser_recycle_memory_growth: float = 0.0,
     ) -> None:
         # TODO: make Space[Action] = ActionSpace
         self.action_space = get_action_space()  # type: ignore[assignment]
@@ -90,9 +101,21 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         self.slow_mo = slow_mo
         self.current_viewport_only = current_viewport_only
         self.reset_finished = False
+        # the browser is shared by the tasks, each task gets a new context
+        self.browser_pool = BrowserPool(
+            headless=headless,
+            slow_mo=slow_mo,
+            viewport_size=viewport_size,
+            pool_size=context_pool_size,
+            recycle_after=browser_recycle_after,
+            recycle_memory_growth=browser_recycle_memory_growth,
+        )
         self.viewport_size = viewport_size
         self.save_trace_enabled = save_trace_enabled
         self.sleep_after_execution = sleep_after_execution
+        # when set, wait for the page to settle instead of the fixed sleep
+        self.settle_timeout = settle_timeout
+        self.settle_quiet_window = settle_quiet_window
 
         match observation_type:
             case "html" | "accessibility_tree":
@@ -114,6 +137,11 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             self.image_observation_type,
             self.current_viewport_only,
             self.viewport_size,
+            incremental_observation=incremental_observation,
+            record_dir=observation_record_dir,
+            capture_screenshot=capture_screenshot,
+            screenshot_format=screenshot_format,
+            decode_screenshot=decode_screenshot,
         )
 
         self.observation_space = (
@@ -121,31 +149,24 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         )
 
     @beartype
-    def setup(self, config_file: Path | None = None) -> None:
-        self.context_manager = sync_playwright()
-        self.playwright = self.context_manager.__enter__()
-        self.browser = self.playwright.chromium.launch(
-            headless=self.headless, slow_mo=self.slow_mo
-        )
-
+    def setup(self, config_file: Path | TaskConfig | None = None) -> None:
+        storage_state: str | None = None
+        start_url: str | None = None
+        geolocation: Any = None
         if config_file:
-            with open(config_file, "r") as f:
-                instance_config = json.load(f)
-        else:
-            instance_config = {}
+            task_config = load_task_config(config_file)
+            storage_state = task_config.storage_state
+            start_url = task_config.start_url
+            if task_config.geolocation is not None:
+                geolocation = dict(task_config.geolocation)
 
-        storage_state = instance_config.get("storage_state", None)
-        start_url = instance_config.get("start_url", None)
-        geolocation = instance_config.get("geolocation", None)
-
-        self.context = self.browser.new_context(
-            viewport=self.viewport_size,
-            storage_state=storage_state,
-            geolocation=geolocation,
-            device_scale_factor=1,
+        self.context = self.browser_pool.new_context(
+            storage_state=storage_state, geolocation=geolocation
         )
+        self.browser = self.browser_pool.browser
         if self.save_trace_enabled:
             self.context.tracing.start(screenshots=True, snapshots=True)
+        self.network_tracker = NetworkTracker(self.context)
         if start_url:
             start_urls = start_url.split(" |AND| ")
             for url in start_urls:
@@ -170,6 +191,20 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
     def get_page_client(self, page: Page) -> CDPSession:
         return page.client  # type: ignore
 
+    def _wait_after_execution(self) -> SettleTimings:
+        if self.settle_timeout > 0:
+            return wait_for_settled(
+                self.page,
+                self.network_tracker,
+                self.settle_timeout,
+                self.settle_quiet_window,
+            )
+        start = time.perf_counter()
+        if self.sleep_after_execution > 0:
+            time.sleep(self.sleep_after_execution)
+        total = time.perf_counter() - start
+        return {"load": 0.0, "network": 0.0, "dom": 0.0, "total": total}
+
     def _get_obs(self) -> dict[str, Observation]:
         obs = self.observation_handler.get_observation(
             self.page, self.get_page_client(self.page)
@@ -185,7 +220,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         self,
         *,
         seed: int | None = None,
-        options: dict[str, str] | None = None,
+        options: dict[str, str | TaskConfig] | None = None,
     ) -> tuple[dict[str, Observation], dict[str, Any]]:
         """
         Reset the environment.
@@ -194,20 +229,22 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         """
         super().reset(seed=seed, options=options)
         if self.reset_finished:
-            self.context_manager.__exit__()
+            self.browser_pool.release(self.context)
 
         if options is not None and "config_file" in options:
-            config_file = Path(options["config_file"])
-            if config_file.exists():
+            config_file = options["config_file"]
+            if isinstance(config_file, TaskConfig):
+                # already parsed, e.g., looked up in a catalog
                 self.setup(config_file=config_file)
+            elif Path(config_file).exists():
+                self.setup(config_file=Path(config_file))
             else:
                 raise ValueError(f"Config file {config_file} does not exist.")
         else:
             self.setup()
         self.reset_finished = True
 
-        if self.sleep_after_execution > 0:
-            time.sleep(self.sleep_after_execution)
+        settle_timings = self._wait_after_execution()
 
         observation = self._get_obs()
         observation_metadata = self._get_obs_metadata()
@@ -215,6 +252,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             "page": DetachedPage(self.page.url, ""),
             "fail_error": "",
             "observation_metadata": observation_metadata,
+            "settle_timings": settle_timings,
         }
 
         return (observation, info)
@@ -225,7 +263,9 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
 
     def close(self) -> None:
         if self.reset_finished:
-            self.context_manager.__exit__()
+            self.browser_pool.release(self.context)
+            self.reset_finished = False
+        self.browser_pool.close()
 
     def step(
         self, action: Action
@@ -246,9 +286,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
         except Exception as e:
             fail_error = str(e)
 
-        # hard sleep TODO[shuyanzh] suboptimal, may need to check network
-        if self.sleep_after_execution > 0:
-            time.sleep(self.sleep_after_execution)
+        settle_timings = self._wait_after_execution()
 
         observation = self._get_obs()
         observation_metadata = self._get_obs_metadata()
@@ -257,6 +295,7 @@ class ScriptBrowserEnv(Env[dict[str, Observation], Action]):
             "page": DetachedPage(self.page.url, self.page.content()),
             "fail_error": fail_error,
             "observation_metadata": observation_metadata,
+            "settle_timings": settle_timings,
         }
         msg = (
             observation,
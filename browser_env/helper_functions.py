@@ -1,7 +1,5 @@
 import base64
 import io
-import json
-import re
 from pathlib import Path
 from typing import Any
 
@@ -13,7 +11,9 @@ from browser_env import (
     ActionTypes,
     ObservationMetadata,
     StateInfo,
+    TaskConfig,
     action2str,
+    load_task_config,
 )
 
 HTML_TEMPLATE = """
@@ -32,6 +32,7 @@ HTML_TEMPLATE = """
     </body>
 </html>
 """
+HTML_HEADER, HTML_FOOTER = HTML_TEMPLATE.format(body="\0").split("\0")
 
 
 def get_render_action(
@@ -111,38 +112,81 @@ def get_action_description(
 
 
 class RenderHelper(object):
-    """Helper class to render text and image observations and meta data in the trajectory"""
+    """Helper class to render text and image observations and meta data in the trajectory
+
+    Each step is appended to the HTML file, which is closed when the helper
+    is. The screenshots are inlined in it, or saved next to it in
+    `render_{task_id}/` with `screenshot_files`.
+    """
 
     def __init__(
-        self, config_file: str, result_dir: str, action_set_tag: str
+        self,
+        config_file: str | TaskConfig,
+        result_dir: str,
+        action_set_tag: str,
+        screenshot_files: bool = False,
     ) -> None:
-        with open(config_file, "r") as f:
-            _config = json.load(f)
-            _config_str = ""
-            for k, v in _config.items():
-                _config_str += f"{k}: {v}\n"
-            _config_str = f"<pre>{_config_str}</pre>\n"
-            task_id = _config["task_id"]
+        task_config = load_task_config(config_file)
+        _config_str = ""
+        for k, v in task_config.to_dict().items():
+            _config_str += f"{k}: {v}\n"
+        _config_str = f"<pre>{_config_str}</pre>\n"
+        task_id = task_config.task_id
 
         self.action_set_tag = action_set_tag
+        self.screenshot_files = screenshot_files
+        self.image_dir_name = f"render_{task_id}"
+        self.image_dir = Path(result_dir) / self.image_dir_name
+        self.step = 0
 
         self.render_file = open(
-            Path(result_dir) / f"render_{task_id}.html", "a+"
+            Path(result_dir) / f"render_{task_id}.html", "w"
         )
-        self.render_file.truncate(0)
-        # write init template
-        self.render_file.write(HTML_TEMPLATE.format(body=f"{_config_str}"))
-        self.render_file.read()
+        # write init template, the end of it is written on close
+        self.render_file.write(HTML_HEADER + _config_str)
         self.render_file.flush()
 
+    def inline_screenshot(self, state_info: StateInfo) -> str:
+        """The screenshot of the step as a data URI"""
+        # reuse the encoded screenshot if any
+        image_src: str = state_info["info"]["observation_metadata"]["image"][
+            "screenshot"
+        ]
+        if image_src:
+            return image_src
+        image = Image.fromarray(state_info["observation"]["image"])  # type: ignore
+        byte_io = io.BytesIO()
+        image.save(byte_io, format="PNG")
+        image_str = base64.b64encode(byte_io.getvalue()).decode("utf-8")
+        return f"data:image/png;base64,{image_str}"
+
+    def save_screenshot(self, state_info: StateInfo) -> str:
+        """Save the screenshot of the step, returns its relative path"""
+        self.image_dir.mkdir(parents=True, exist_ok=True)
+        # reuse the encoded screenshot if any
+        image_src = state_info["info"]["observation_metadata"]["image"][
+            "screenshot"
+        ]
+        if image_src:
+            header, data = image_src.split(",", 1)
+            image_format = header.split("/")[1].split(";")[0]
+            file_name = f"step_{self.step}.{image_format}"
+            (self.image_dir / file_name).write_bytes(base64.b64decode(data))
+        else:
+            file_name = f"step_{self.step}.png"
+            image = Image.fromarray(state_info["observation"]["image"])  # type: ignore
+            image.save(self.image_dir / file_name, format="PNG")
+        return f"{self.image_dir_name}/{file_name}"
+
     def render(
         self,
         action: Action,
         state_info: StateInfo,
         meta_data: dict[str, Any],
         render_screenshot: bool = False,
-    ) -> None:
-        """Render the trajectory"""
+    ) -> str | None:
+        """Render the trajectory, returns the path of the saved screenshot
+        if the screenshots are saved as files"""
         # text observation
         observation = state_info["observation"]
         text_obs = observation["text"]
@@ -151,16 +195,15 @@ class RenderHelper(object):
         new_content += f"<h3 class='url'><a href={state_info['info']['page'].url}>URL: {state_info['info']['page'].url}</a></h3>\n"
         new_content += f"<div class='state_obv'><pre>{text_obs}</pre><div>\n"
 
+        image_path = None
         if render_screenshot:
-            # image observation
-            img_obs = observation["image"]
-            image = Image.fromarray(img_obs)  # type:ignore
-            byte_io = io.BytesIO()
-            image.save(byte_io, format="PNG")
-            byte_io.seek(0)
-            image_bytes = base64.b64encode(byte_io.read())
-            image_str = image_bytes.decode("utf-8")
-            new_content += f"<img src='data:image/png;base64,{image_str}' style='width:50vw; height:auto;'/>\n"
+            if self.screenshot_files:
+                image_path = image_src = self.save_screenshot(state_info)
+            else:
+                image_src = self.inline_screenshot(state_info)
+            new_content += (
+                f"<img src='{image_src}' style='width:50vw; height:auto;'/>\n"
+            )
 
         # meta data
         new_content += f"<div class='prev_action' style='background-color:pink'>{meta_data['action_history'][-1]}</div>\n"
@@ -175,17 +218,13 @@ class RenderHelper(object):
         action_str = f"<div class='predict_action'>{action_str}</div>"
         new_content += f"{action_str}\n"
 
-        # add new content
-        self.render_file.seek(0)
-        html = self.render_file.read()
-        html_body = re.findall(r"<body>(.*?)</body>", html, re.DOTALL)[0]
-        html_body += new_content
-
-        html = HTML_TEMPLATE.format(body=html_body)
-        self.render_file.seek(0)
-        self.render_file.truncate()
-        self.render_file.write(html)
+        # only the new content is written
+        self.render_file.write(new_content)
         self.render_file.flush()
+        self.step += 1
+        return image_path
 
     def close(self) -> None:
+        if not self.render_file.closed:
+            self.render_file.write(HTML_FOOTER)
         self.render_file.close()
@@ -1,11 +1,15 @@
+import asyncio
+import base64
 import json
 import re
-from collections import defaultdict
-from typing import Any, TypedDict, Union
+from collections import Counter, defaultdict
+from typing import Any, TypedDict, TypeVar, Union
 
 import numpy as np
 import numpy.typing as npt
 from gymnasium import spaces
+from playwright.async_api import CDPSession as ACDPSession
+from playwright.async_api import Page as APage
 from playwright.sync_api import CDPSession, Page, ViewportSize
 
 from browser_env.constants import (
@@ -15,11 +19,13 @@ from browser_env.constants import (
     UTTERANCE_MAX_LENGTH,
 )
 
+from .replay import ObservationRecorder
 from .utils import (
     AccessibilityTree,
     AccessibilityTreeNode,
     BrowserConfig,
     BrowserInfo,
+    BrowserState,
     DOMNode,
     DOMTree,
     Observation,
@@ -28,28 +34,252 @@ from .utils import (
 
 IN_VIEWPORT_RATIO_THRESHOLD = 0.6
 
+# everything the processors need from the page in a single round trip
+BROWSER_STATE_JS = """
+() => {
+    const root = document.scrollingElement || document.documentElement;
+    return {
+        win_top_bound: window.pageYOffset,
+        win_left_bound: window.pageXOffset,
+        win_width: window.screen.width,
+        win_height: window.screen.height,
+        device_pixel_ratio: window.devicePixelRatio,
+        url: window.location.href,
+        title: document.title,
+        scroll_width: root ? root.scrollWidth : 0,
+        scroll_height: root ? root.scrollHeight : 0,
+    };
+}
+"""
+
+
+DOM_SNAPSHOT_PARAMS = {
+    "computedStyles": [],
+    "includeDOMRects": True,
+    "includePaintOrder": True,
+}
+
+BOUNDING_CLIENT_RECT_JS = """
+    function() {
+        if (this.nodeType == 3) {
+            var range = document.createRange();
+            range.selectNode(this);
+            var rect = range.getBoundingClientRect().toJSON();
+            range.detach();
+            return rect;
+        } else {
+            return this.getBoundingClientRect().toJSON();
+        }
+    }
+"""
+
 
 class ObservationProcessor:
     def process(self, page: Page, client: CDPSession) -> Observation:
         raise NotImplementedError
 
+    async def aprocess(self, page: APage, client: ACDPSession) -> Observation:
+        raise NotImplementedError
+
 
 class ObservationMetadata(TypedDict):
     obs_nodes_info: dict[str, Any]
+    # bookkeeping only for now, the agent still prompts with the full tree
+    obs_delta: str
+    screenshot: str
+    round_trips: dict[str, int]
 
 
 def create_empty_metadata() -> ObservationMetadata:
     return {
         "obs_nodes_info": {},
+        "obs_delta": "",
+        "screenshot": "",
+        "round_trips": {},
     }
 
 
+class SnapshotGeometry:
+    """Geometry table of the main document in a `DOMSnapshot.captureSnapshot`.
+
+    The snapshot stores the layout objects in a separate table that points
+    back to the DOM nodes. The table is inverted once so that the client
+    rect of a node can be looked up by its node index or its backend node id
+    without talking to the browser.
+    """
+
+    ELEMENT_NODE = 1
+    TEXT_NODE = 3
+
+    def __init__(self, info: BrowserInfo) -> None:
+        document = info["DOMTree"]["documents"][0]
+        nodes = document["nodes"]
+        layout = document["layout"]
+
+        self.node_types: list[int] = nodes["nodeType"]
+        self.win_left_bound = info["config"]["win_left_bound"]
+        self.win_top_bound = info["config"]["win_top_bound"]
+
+        # node index -> union of the rects of its layout objects, None if
+        # the node is not rendered; e.g., an inline element wrapped over
+        # several lines has one layout object per line
+        self.node_bounds: list[list[float] | None] = [None] * len(
+            self.node_types
+        )
+        for node_idx, (x, y, width, height) in zip(
+            layout["nodeIndex"], layout["bounds"]
+        ):
+            union = self.node_bounds[node_idx]
+            if union is None:
+                self.node_bounds[node_idx] = [x, y, width, height]
+                continue
+            left = min(union[0], x)
+            top = min(union[1], y)
+            right = max(union[0] + union[2], x + width)
+            bottom = max(union[1] + union[3], y + height)
+            self.node_bounds[node_idx] = [
+                left,
+                top,
+                right - left,
+                bottom - top,
+            ]
+
+        # backend node id -> node index
+        self.backend_id_to_node = {
+            backend_node_id: node_idx
+            for node_idx, backend_node_id in enumerate(nodes["backendNodeId"])
+        }
+
+    def __contains__(self, backend_node_id: int) -> bool:
+        return backend_node_id in self.backend_id_to_node
+
+    def get_client_rect(self, node_idx: int) -> list[float] | None:
+        """Return the rect `getBoundingClientRect` gives for the node.
+
+        The layout bounds are absolute page coordinates, the union of the
+        fragments of the node is shifted by the scroll offset. Elements and
+        texts without a layout object (e.g., display: none) get an empty
+        rect, other node types (e.g., comments) have no rect at all.
+        """
+        if self.node_types[node_idx] not in (
+            self.ELEMENT_NODE,
+            self.TEXT_NODE,
+        ):
+            return None
+        bounds = self.node_bounds[node_idx]
+        if bounds is None:
+            return [0.0, 0.0, 0.0, 0.0]
+        x, y, width, height = bounds
+        return [
+            x - self.win_left_bound,
+            y - self.win_top_bound,
+            width,
+            height,
+        ]
+
+    def get_client_rect_by_backend_id(
+        self, backend_node_id: int
+    ) -> list[float] | None:
+        return self.get_client_rect(self.backend_id_to_node[backend_node_id])
+
+
+TreeNode = TypeVar("TreeNode", AccessibilityTreeNode, DOMNode)
+
+
+def remove_nodes_from_tree(
+    tree: list[TreeNode], removed_ids: set[str]
+) -> list[TreeNode]:
+    """Remove the nodes from the tree in a single pass.
+
+    The children of a removed node take its place in the children of the
+    closest kept ancestor, and their parent is updated accordingly. Removed
+    nodes are marked with the parent "[REMOVED]". The result is the same as
+    splicing the nodes out one by one, but each child list is rebuilt once,
+    which keeps wide nodes (long lists, table rows) linear.
+    """
+    if not removed_ids:
+        return tree
+
+    id_to_node = {node["nodeId"]: node for node in tree}
+    kept_tree: list[TreeNode] = []
+    for node in tree:
+        node_id = node["nodeId"]
+        if node_id in removed_ids:
+            continue
+        kept_tree.append(node)
+
+        child_ids = node["childIds"]
+        if not any(child_id in removed_ids for child_id in child_ids):
+            continue
+
+        # flatten the removed children in place, depth first
+        new_child_ids: list[str] = []
+        stack = [(node_id, iter(child_ids))]
+        while stack:
+            owner_id, child_iter = stack[-1]
+            for child_id in child_iter:
+                if (
+                    child_id in removed_ids
+                    and id_to_node[child_id].get("parentId") == owner_id
+                ):
+                    child_node = id_to_node[child_id]
+                    stack.append((child_id, iter(child_node["childIds"])))
+                    break
+                new_child_ids.append(child_id)
+            else:
+                stack.pop()
+        node["childIds"] = new_child_ids
+
+        for child_id in new_child_ids:
+            if child_id in id_to_node and child_id not in removed_ids:
+                id_to_node[child_id]["parentId"] = node_id
+
+    for node_id in removed_ids:
+        if node_id in id_to_node:
+            id_to_node[node_id]["parentId"] = "[REMOVED]"
+
+    return kept_tree
+
+
+def get_observation_delta(prev_content: str, content: str) -> str:
+    """Compact difference between two tree observations, one line per node
+    keyed by its id: "+" for new nodes, "~" for changed ones and "-" for
+    the ones that are gone
+
+    It is only recorded in the metadata of the observation for now, neither
+    the prompt constructors nor the agents read it.
+    """
+
+    def index_lines(text: str) -> dict[str, str]:
+        lines = {}
+        for line in text.split("\n"):
+            line = line.strip()
+            end = line.find("]")
+            if line.startswith("[") and end > 0:
+                lines[line[1:end]] = line
+        return lines
+
+    prev_lines = index_lines(prev_content)
+    cur_lines = index_lines(content)
+    delta = []
+    for node_id, line in cur_lines.items():
+        if node_id not in prev_lines:
+            delta.append(f"+ {line}")
+        elif prev_lines[node_id] != line:
+            delta.append(f"~ {line}")
+    for node_id in prev_lines:
+        if node_id not in cur_lines:
+            delta.append(f"- [{node_id}]")
+    return "\n".join(delta)
+
+
 class TextObervationProcessor(ObservationProcessor):
     def __init__(
         self,
         observation_type: str,
         current_viewport_only: bool,
         viewport_size: ViewportSize,
+        incremental: bool = False,
     ):
         self.observation_type = observation_type
         self.current_viewport_only = current_viewport_only
@@ -59,21 +289,67 @@ class TextObervationProcessor(ObservationProcessor):
             create_empty_metadata()
         )  # use the store meta data of this observation type
 
+        # incremental mode: reuse the whole accessibility tree of the
+        # previous step when nothing on the page changed, and report the
+        # delta of the text observation; a change anywhere refetches the
+        # whole tree, no subtree is reused on its own
+        self.incremental = incremental
+        self.cached_client: CDPSession | ACDPSession | None = None
+        self.cached_signature: int | None = None
+        self.cached_accessibility_tree: AccessibilityTree = []
+        self.accessibility_tree_outdated = True
+        self.prev_client: CDPSession | ACDPSession | None = None
+        self.prev_content = ""
+
+        # round trips to the browser of the current observation
+        self.round_trips: Counter[str] = Counter()
+
+    def send(self, client: CDPSession, method: str, params: Any = None) -> Any:
+        self.round_trips[method] += 1
+        return client.send(method, params)
+
+    async def asend(
+        self, client: ACDPSession, method: str, params: Any = None
+    ) -> Any:
+        self.round_trips[method] += 1
+        return await client.send(method, params)
+
+    def fetch_browser_state(self, page: Page) -> BrowserState:
+        self.round_trips["page.evaluate"] += 1
+        state: BrowserState = page.evaluate(BROWSER_STATE_JS)
+        return state
+
+    async def afetch_browser_state(self, page: APage) -> BrowserState:
+        self.round_trips["page.evaluate"] += 1
+        state: BrowserState = await page.evaluate(BROWSER_STATE_JS)
+        return state
+
     def fetch_browser_info(
         self,
         page: Page,
         client: CDPSession,
     ) -> BrowserInfo:
         # extract domtree
-        tree = client.send(
-            "DOMSnapshot.captureSnapshot",
-            {
-                "computedStyles": [],
-                "includeDOMRects": True,
-                "includePaintOrder": True,
-            },
+        tree = self.send(
+            client, "DOMSnapshot.captureSnapshot", DOM_SNAPSHOT_PARAMS
         )
+        # extract browser info
+        self.browser_state = self.fetch_browser_state(page)
+        return self.make_browser_info(tree)
 
+    async def afetch_browser_info(
+        self,
+        page: APage,
+        client: ACDPSession,
+    ) -> BrowserInfo:
+        tree = await self.asend(
+            client, "DOMSnapshot.captureSnapshot", DOM_SNAPSHOT_PARAMS
+        )
+        self.browser_state = await self.afetch_browser_state(page)
+        return self.make_browser_info(tree)
+
+    def make_browser_info(self, tree: dict[str, Any]) -> BrowserInfo:
+        """Combine the dom snapshot with the fetched browser state"""
         # calibrate the bounds, in some cases, the bounds are scaled somehow
         bounds = tree["documents"][0]["layout"]["bounds"]
         b = bounds[0]
@@ -81,14 +357,13 @@ class TextObervationProcessor(ObservationProcessor):
         bounds = [[x / n for x in bound] for bound in bounds]
         tree["documents"][0]["layout"]["bounds"] = bounds
 
-        # extract browser info
-        win_top_bound = page.evaluate("window.pageYOffset")
-        win_left_bound = page.evaluate("window.pageXOffset")
-        win_width = page.evaluate("window.screen.width")
-        win_height = page.evaluate("window.screen.height")
+        win_top_bound = self.browser_state["win_top_bound"]
+        win_left_bound = self.browser_state["win_left_bound"]
+        win_width = self.browser_state["win_width"]
+        win_height = self.browser_state["win_height"]
         win_right_bound = win_left_bound + win_width
         win_lower_bound = win_top_bound + win_height
-        device_pixel_ratio = page.evaluate("window.devicePixelRatio")
+        device_pixel_ratio = self.browser_state["device_pixel_ratio"]
         assert device_pixel_ratio == 1.0, "devicePixelRatio is not 1.0"
 
         config: BrowserConfig = {
@@ -108,30 +383,24 @@ class TextObervationProcessor(ObservationProcessor):
 
     @staticmethod
     def get_bounding_client_rect(
-        client: CDPSession, backend_node_id: str
+        client: CDPSession,
+        backend_node_id: str,
+        round_trips: Counter[str] | None = None,
     ) -> dict[str, Any]:
+        if round_trips is None:
+            round_trips = Counter()
         try:
+            round_trips["DOM.resolveNode"] += 1
             remote_object = client.send(
                 "DOM.resolveNode", {"backendNodeId": int(backend_node_id)}
             )
             remote_object_id = remote_object["object"]["objectId"]
+            round_trips["Runtime.callFunctionOn"] += 1
             response = client.send(
                 "Runtime.callFunctionOn",
                 {
                     "objectId": remote_object_id,
-                    "functionDeclaration": """
-                        function() {
-                            if (this.nodeType == 3) {
-                                var range = document.createRange();
-                                range.selectNode(this);
-                                var rect = range.getBoundingClientRect().toJSON();
-                                range.detach();
-                                return rect;
-                            } else {
-                                return this.getBoundingClientRect().toJSON();
-                            }
-                        }
-                    """,
+                    "functionDeclaration": BOUNDING_CLIENT_RECT_JS,
                     "returnByValue": True,
                 },
             )
@@ -139,6 +408,44 @@ class TextObervationProcessor(ObservationProcessor):
         except Exception as e:
             return {"result": {"subtype": "error"}}
 
+    @staticmethod
+    async def aget_bounding_client_rect(
+        client: ACDPSession,
+        backend_node_id: str,
+        round_trips: Counter[str] | None = None,
+    ) -> dict[str, Any]:
+        if round_trips is None:
+            round_trips = Counter()
+        try:
+            round_trips["DOM.resolveNode"] += 1
+            remote_object = await client.send(
+                "DOM.resolveNode", {"backendNodeId": int(backend_node_id)}
+            )
+            remote_object_id = remote_object["object"]["objectId"]
+            round_trips["Runtime.callFunctionOn"] += 1
+            response: dict[str, Any] = await client.send(
+                "Runtime.callFunctionOn",
+                {
+                    "objectId": remote_object_id,
+                    "functionDeclaration": BOUNDING_CLIENT_RECT_JS,
+                    "returnByValue": True,
+                },
+            )
+            return response
+        except Exception:
+            return {"result": {"subtype": "error"}}
+
+    @staticmethod
+    def response_to_bound(response: dict[str, Any]) -> list[float] | None:
+        """Convert the response of `get_bounding_client_rect` to a bound"""
+        if response.get("result", {}).get("subtype", "") == "error":
+            return None
+        x = response["result"]["value"]["x"]
+        y = response["result"]["value"]["y"]
+        width = response["result"]["value"]["width"]
+        height = response["result"]["value"]["height"]
+        return [x, y, width, height]
+
     @staticmethod
     def get_element_in_viewport_ratio(
         elem_left_bound: float,
@@ -171,11 +478,35 @@ class TextObervationProcessor(ObservationProcessor):
         ratio = overlap_width * overlap_height / width * height
         return ratio
 
+    @staticmethod
+    def is_in_viewport(
+        union_bound: list[float] | None, config: BrowserConfig
+    ) -> bool:
+        if not union_bound:
+            return False
+
+        [x, y, width, height] = union_bound
+
+        # invisible node
+        if width == 0 or height == 0:
+            return False
+
+        in_viewport_ratio = (
+            TextObervationProcessor.get_element_in_viewport_ratio(
+                elem_left_bound=float(x),
+                elem_top_bound=float(y),
+                width=float(width),
+                height=float(height),
+                config=config,
+            )
+        )
+        return in_viewport_ratio >= IN_VIEWPORT_RATIO_THRESHOLD
+
     def fetch_page_html(
         self,
         info: BrowserInfo,
-        page: Page,
-        client: CDPSession,
+        page: Page | APage,
+        client: CDPSession | ACDPSession,
         current_viewport_only: bool,
     ) -> DOMTree:
         # adopted from [natbot](https://github.com/nat/natbot)
@@ -184,6 +515,8 @@ class TextObervationProcessor(ObservationProcessor):
         document = tree["documents"][0]
         nodes = document["nodes"]
 
+        geometry = SnapshotGeometry(info)
+
         # make a dom tree that is easier to navigate
         dom_tree: DOMTree = []
         graph = defaultdict(list)
@@ -239,17 +572,7 @@ class TextObervationProcessor(ObservationProcessor):
             if cur_node["parentId"] == "-1":
                 cur_node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
             else:
-                response = self.get_bounding_client_rect(
-                    client, cur_node["backendNodeId"]
-                )
-                if response.get("result", {}).get("subtype", "") == "error":
-                    cur_node["union_bound"] = None
-                else:
-                    x = response["result"]["value"]["x"]
-                    y = response["result"]["value"]["y"]
-                    width = response["result"]["value"]["width"]
-                    height = response["result"]["value"]["height"]
-                    cur_node["union_bound"] = [x, y, width, height]
+                cur_node["union_bound"] = geometry.get_client_rect(node_idx)
 
             dom_tree.append(cur_node)
 
@@ -259,61 +582,13 @@ class TextObervationProcessor(ObservationProcessor):
 
         # remove the nodes that are not in the current viewport
         if current_viewport_only:
-
-            def remove_node_in_graph(node: DOMNode) -> None:
-                # update the node information in the accessibility tree
-                node_id = node["nodeId"]
-                parent_id = node["parentId"]
-                child_ids = node["childIds"]
-
-                # update the children of the parent node
-                assert dom_tree[int(parent_id)]["parentId"] != "[REMOVED]"
-                # remove the nodeid from parent
-                index = dom_tree[int(parent_id)]["childIds"].index(node_id)
-                dom_tree[int(parent_id)]["childIds"].pop(index)
-
-                # Insert children_nodeids in the same location
-                for child_id in child_ids:
-                    dom_tree[int(parent_id)]["childIds"].insert(
-                        index, child_id
-                    )
-                    index += 1
-
-                # update children node's parent
-                for child_id in child_ids:
-                    dom_tree[int(child_id)]["parentId"] = parent_id
-                # mark as removed
-                dom_tree[int(node_id)]["parentId"] = "[REMOVED]"
-
             config = info["config"]
-            for cursor, node in enumerate(dom_tree):
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0.0 or height == 0.0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            dom_tree = [
-                node
+            removed_ids = {
+                node["nodeId"]
                 for node in dom_tree
-                if node.get("parentId", "-1") != "[REMOVED]"
-            ]
+                if not self.is_in_viewport(node["union_bound"], config)
+            }
+            dom_tree = remove_nodes_from_tree(dom_tree, removed_ids)
 
         return dom_tree
 
@@ -326,8 +601,12 @@ class TextObervationProcessor(ObservationProcessor):
             node["nodeId"]: idx for idx, node in enumerate(dom_tree)
         }
 
-        def dfs(node_cursor: int, depth: int) -> str:
-            tree_str = ""
+        # depth first traversal with an explicit stack, deep pages would
+        # exceed the recursion limit otherwise
+        tree_lines: list[str] = []
+        stack = [(0, 0)]
+        while stack:
+            node_cursor, depth = stack.pop()
             node = dom_tree[node_cursor]
             indent = "\t" * depth
             valid_node = True
@@ -344,32 +623,203 @@ class TextObervationProcessor(ObservationProcessor):
                         "union_bound": node["union_bound"],
                         "text": node_str,
                     }
-                    tree_str += f"{indent}{node_str}\n"
+                    tree_lines.append(f"{indent}{node_str}\n")
 
             except Exception as e:
                 valid_node = False
 
-            for child_ids in node["childIds"]:
+            child_depth = depth + 1 if valid_node else depth
+            # reversed so that the first child is visited first
+            for child_ids in reversed(node["childIds"]):
                 child_cursor = nodeid_to_cursor[child_ids]
-                child_depth = depth + 1 if valid_node else depth
-                child_str = dfs(child_cursor, child_depth)
-                tree_str += child_str
-
-            return tree_str
+                stack.append((child_cursor, child_depth))
 
-        html = dfs(0, 0)
+        html = "".join(tree_lines)
         return html, obs_nodes_info
 
+    @staticmethod
+    def get_snapshot_signature(info: BrowserInfo) -> int:
+        """Hash the parts of the DOM snapshot the accessibility tree depends
+        on: the nodes, their texts and attributes, which nodes are rendered
+        and the form states. It covers the whole page, so it only tells
+        whether anything changed, not which subtree."""
+        tree = info["DOMTree"]
+        strings = tree["strings"]
+        document = tree["documents"][0]
+        nodes = document["nodes"]
+
+        def rare_strings(name: str) -> tuple[Any, ...]:
+            data = nodes.get(name, {"index": [], "value": []})
+            return (
+                tuple(data["index"]),
+                tuple(strings[idx] for idx in data["value"]),
+            )
+
+        def rare_booleans(name: str) -> tuple[int, ...]:
+            return tuple(nodes.get(name, {"index": []})["index"])
+
+        return hash(
+            (
+                strings[document["documentURL"]],
+                tuple(nodes["backendNodeId"]),
+                tuple(nodes["parentIndex"]),
+                tuple(strings[idx] for idx in nodes["nodeValue"] if idx >= 0),
+                tuple(
+                    tuple(strings[idx] for idx in attributes)
+                    for attributes in nodes["attributes"]
+                ),
+                tuple(document["layout"]["nodeIndex"]),
+                rare_strings("inputValue"),
+                rare_booleans("inputChecked"),
+                rare_booleans("optionSelected"),
+            )
+        )
+
+    def on_accessibility_tree_update(self, event: Any) -> None:
+        self.accessibility_tree_outdated = True
+
+    def get_full_accessibility_tree(
+        self, info: BrowserInfo, client: CDPSession
+    ) -> AccessibilityTree:
+        """Fetch the accessibility tree of the page.
+
+        In incremental mode, the tree of the previous step is reused if the
+        browser did not report any accessibility change since then and the
+        signature of the DOM snapshot is the same. This is a shortcut for an
+        unchanged page: the tree is reused whole or fetched again whole.
+        The signature does not cover the focus, a change of the focus alone
+        is only noticed through `Accessibility.nodesUpdated`.
+        """
+        if not self.incremental:
+            accessibility_tree: AccessibilityTree = self.send(
+                client, "Accessibility.getFullAXTree", {}
+            )["nodes"]
+            return accessibility_tree
+
+        signature = self.get_snapshot_signature(info)
+        if self.is_cache_outdated(client, signature):
+            self.watch_accessibility_tree(client)
+            self.cached_accessibility_tree = self.send(
+                client, "Accessibility.getFullAXTree", {}
+            )["nodes"]
+            self.cached_client = client
+            self.cached_signature = signature
+        return self.copy_cached_accessibility_tree()
+
+    async def aget_full_accessibility_tree(
+        self, info: BrowserInfo, client: ACDPSession
+    ) -> AccessibilityTree:
+        if not self.incremental:
+            accessibility_tree: AccessibilityTree = (
+                await self.asend(client, "Accessibility.getFullAXTree", {})
+            )["nodes"]
+            return accessibility_tree
+
+        signature = self.get_snapshot_signature(info)
+        if self.is_cache_outdated(client, signature):
+            self.watch_accessibility_tree(client)
+            self.cached_accessibility_tree = (
+                await self.asend(client, "Accessibility.getFullAXTree", {})
+            )["nodes"]
+            self.cached_client = client
+            self.cached_signature = signature
+        return self.copy_cached_accessibility_tree()
+
+    def is_cache_outdated(
+        self, client: CDPSession | ACDPSession, signature: int
+    ) -> bool:
+        """Whether the cached tree cannot be reused, any change outdates
+        all of it"""
+        return (
+            client is not self.cached_client
+            or self.accessibility_tree_outdated
+            or signature != self.cached_signature
+        )
+
+    def watch_accessibility_tree(
+        self, client: CDPSession | ACDPSession
+    ) -> None:
+        """Listen to the accessibility changes of a new client, before the
+        tree is fetched so that no change goes unnoticed"""
+        if client is not self.cached_client:
+            client.on(
+                "Accessibility.nodesUpdated",
+                self.on_accessibility_tree_update,
+            )
+            client.on(
+                "Accessibility.loadComplete",
+                self.on_accessibility_tree_update,
+            )
+        self.accessibility_tree_outdated = False
+
+    def copy_cached_accessibility_tree(self) -> AccessibilityTree:
+        # the nodes are updated in place later on, keep the cache intact
+        accessibility_tree = []
+        for node in self.cached_accessibility_tree:
+            node_copy = node.copy()
+            if "childIds" in node:
+                node_copy["childIds"] = list(node["childIds"])
+            accessibility_tree.append(node_copy)
+        return accessibility_tree
+
     def fetch_page_accessibility_tree(
         self,
         info: BrowserInfo,
         client: CDPSession,
         current_viewport_only: bool,
     ) -> AccessibilityTree:
-        accessibility_tree: AccessibilityTree = client.send(
-            "Accessibility.getFullAXTree", {}
-        )["nodes"]
+        accessibility_tree = self.get_full_accessibility_tree(info, client)
+        accessibility_tree, unlocated = self.locate_accessibility_tree(
+            accessibility_tree, info
+        )
+        for node in unlocated:
+            response = self.get_bounding_client_rect(
+                client, node["backendDOMNodeId"], self.round_trips
+            )
+            node["union_bound"] = self.response_to_bound(response)
+
+        # filter nodes that are not in the current viewport
+        if current_viewport_only:
+            accessibility_tree = self.remove_nodes_out_of_viewport(
+                accessibility_tree, info["config"]
+            )
+        return accessibility_tree
+
+    async def afetch_page_accessibility_tree(
+        self,
+        info: BrowserInfo,
+        client: ACDPSession,
+        current_viewport_only: bool,
+    ) -> AccessibilityTree:
+        accessibility_tree = await self.aget_full_accessibility_tree(
+            info, client
+        )
+        accessibility_tree, unlocated = self.locate_accessibility_tree(
+            accessibility_tree, info
+        )
+        # the nodes are independent, the lookups share the round trip time
+        responses = await asyncio.gather(
+            *(
+                self.aget_bounding_client_rect(
+                    client, node["backendDOMNodeId"], self.round_trips
+                )
+                for node in unlocated
+            )
+        )
+        for node, response in zip(unlocated, responses):
+            node["union_bound"] = self.response_to_bound(response)
+
+        if current_viewport_only:
+            accessibility_tree = self.remove_nodes_out_of_viewport(
+                accessibility_tree, info["config"]
+            )
+        return accessibility_tree
 
+    def locate_accessibility_tree(
+        self, accessibility_tree: AccessibilityTree, info: BrowserInfo
+    ) -> tuple[AccessibilityTree, list[AccessibilityTreeNode]]:
+        """Drop the repeated nodes and set the bounds of the nodes from the
+        layout snapshot, return the nodes that have to be located live"""
         # a few nodes are repeated in the accessibility tree
         seen_ids = set()
         _accessibility_tree = []
@@ -379,96 +829,37 @@ class TextObervationProcessor(ObservationProcessor):
                 seen_ids.add(node["nodeId"])
         accessibility_tree = _accessibility_tree
 
-        nodeid_to_cursor = {}
-        for cursor, node in enumerate(accessibility_tree):
-            nodeid_to_cursor[node["nodeId"]] = cursor
+        # the bounds are looked up in the layout snapshot
+        geometry = SnapshotGeometry(info)
+
+        unlocated = []
+        for node in accessibility_tree:
             # usually because the node is not visible etc
             if "backendDOMNodeId" not in node:
                 node["union_bound"] = None
                 continue
-            backend_node_id = str(node["backendDOMNodeId"])
+            backend_node_id = int(node["backendDOMNodeId"])
             if node["role"]["value"] == "RootWebArea":
                 # always inside the viewport
                 node["union_bound"] = [0.0, 0.0, 10.0, 10.0]
-            else:
-                response = self.get_bounding_client_rect(
-                    client, backend_node_id
+            elif backend_node_id in geometry:
+                node["union_bound"] = geometry.get_client_rect_by_backend_id(
+                    backend_node_id
                 )
-                if response.get("result", {}).get("subtype", "") == "error":
-                    node["union_bound"] = None
-                else:
-                    x = response["result"]["value"]["x"]
-                    y = response["result"]["value"]["y"]
-                    width = response["result"]["value"]["width"]
-                    height = response["result"]["value"]["height"]
-                    node["union_bound"] = [x, y, width, height]
-
-        # filter nodes that are not in the current viewport
-        if current_viewport_only:
-
-            def remove_node_in_graph(node: AccessibilityTreeNode) -> None:
-                # update the node information in the accessibility tree
-                nodeid = node["nodeId"]
-                node_cursor = nodeid_to_cursor[nodeid]
-                parent_nodeid = node["parentId"]
-                children_nodeids = node["childIds"]
-                parent_cursor = nodeid_to_cursor[parent_nodeid]
-                # update the children of the parent node
-                assert (
-                    accessibility_tree[parent_cursor].get("parentId", "Root")
-                    is not None
-                )
-                # remove the nodeid from parent's childIds
-                index = accessibility_tree[parent_cursor]["childIds"].index(
-                    nodeid
-                )
-                accessibility_tree[parent_cursor]["childIds"].pop(index)
-                # Insert children_nodeids in the same location
-                for child_nodeid in children_nodeids:
-                    accessibility_tree[parent_cursor]["childIds"].insert(
-                        index, child_nodeid
-                    )
-                    index += 1
-                # update children node's parent
-                for child_nodeid in children_nodeids:
-                    child_cursor = nodeid_to_cursor[child_nodeid]
-                    accessibility_tree[child_cursor][
-                        "parentId"
-                    ] = parent_nodeid
-                # mark as removed
-                accessibility_tree[node_cursor]["parentId"] = "[REMOVED]"
-
-            config = info["config"]
-            for node in accessibility_tree:
-                if not node["union_bound"]:
-                    remove_node_in_graph(node)
-                    continue
-
-                [x, y, width, height] = node["union_bound"]
-
-                # invisible node
-                if width == 0 or height == 0:
-                    remove_node_in_graph(node)
-                    continue
-
-                in_viewport_ratio = self.get_element_in_viewport_ratio(
-                    elem_left_bound=float(x),
-                    elem_top_bound=float(y),
-                    width=float(width),
-                    height=float(height),
-                    config=config,
-                )
-
-                if in_viewport_ratio < IN_VIEWPORT_RATIO_THRESHOLD:
-                    remove_node_in_graph(node)
-
-            accessibility_tree = [
-                node
-                for node in accessibility_tree
-                if node.get("parentId", "Root") != "[REMOVED]"
-            ]
+            else:
+                # not part of the snapshot (e.g., created after it was taken)
+                unlocated.append(node)
+        return accessibility_tree, unlocated
 
-        return accessibility_tree
+    def remove_nodes_out_of_viewport(
+        self, accessibility_tree: AccessibilityTree, config: BrowserConfig
+    ) -> AccessibilityTree:
+        removed_ids = {
+            node["nodeId"]
+            for node in accessibility_tree
+            if not self.is_in_viewport(node["union_bound"], config)
+        }
+        return remove_nodes_from_tree(accessibility_tree, removed_ids)
 
     @staticmethod
     def parse_accessibility_tree(
@@ -481,8 +872,12 @@ class TextObervationProcessor(ObservationProcessor):
 
         obs_nodes_info = {}
 
-        def dfs(idx: int, obs_node_id: str, depth: int) -> str:
-            tree_str = ""
+        # depth first traversal with an explicit stack, deep pages would
+        # exceed the recursion limit otherwise
+        tree_lines: list[str] = []
+        stack = [(0, accessibility_tree[0]["nodeId"], 0)]
+        while stack:
+            idx, obs_node_id, depth = stack.pop()
             node = accessibility_tree[idx]
             indent = "\t" * depth
             valid_node = True
@@ -529,7 +924,7 @@ class TextObervationProcessor(ObservationProcessor):
                         valid_node = False
 
                 if valid_node:
-                    tree_str += f"{indent}{node_str}"
+                    tree_lines.append(f"{indent}{node_str}")
                     obs_nodes_info[obs_node_id] = {
                         "backend_id": node["backendDOMNodeId"],
                         "union_bound": node["union_bound"],
@@ -539,22 +934,17 @@ class TextObervationProcessor(ObservationProcessor):
             except Exception as e:
                 valid_node = False
 
-            for _, child_node_id in enumerate(node["childIds"]):
+            # mark this to save some tokens
+            child_depth = depth + 1 if valid_node else depth
+            # reversed so that the first child is visited first
+            for child_node_id in reversed(node["childIds"]):
                 if child_node_id not in node_id_to_idx:
                     continue
-                # mark this to save some tokens
-                child_depth = depth + 1 if valid_node else depth
-                child_str = dfs(
-                    node_id_to_idx[child_node_id], child_node_id, child_depth
+                stack.append(
+                    (node_id_to_idx[child_node_id], child_node_id, child_depth)
                 )
-                if child_str.strip():
-                    if tree_str.strip():
-                        tree_str += "\n"
-                    tree_str += child_str
-
-            return tree_str
 
-        tree_str = dfs(0, accessibility_tree[0]["nodeId"], 0)
+        tree_str = "\n".join(tree_lines)
         return tree_str, obs_nodes_info
 
     @staticmethod
@@ -581,29 +971,83 @@ class TextObervationProcessor(ObservationProcessor):
         return "\n".join(clean_lines)
 
     def process(self, page: Page, client: CDPSession) -> str:
-        # get the tab info
+        self.round_trips = Counter()
+        try:
+            browser_info = self.fetch_browser_info(page, client)
+        except Exception:
+            page.wait_for_load_state("load", timeout=500)
+            browser_info = self.fetch_browser_info(page, client)
+
+        # get the tab info, the title of the current tab comes with the
+        # browser state
         open_tabs = page.context.pages
         try:
-            tab_titles = [tab.title() for tab in open_tabs]
             current_tab_idx = open_tabs.index(page)
-            for idx in range(len(open_tabs)):
+            titles = []
+            for idx, tab in enumerate(open_tabs):
                 if idx == current_tab_idx:
-                    tab_titles[
-                        idx
-                    ] = f"Tab {idx} (current): {open_tabs[idx].title()}"
+                    titles.append(self.browser_state["title"])
                 else:
-                    tab_titles[idx] = f"Tab {idx}: {open_tabs[idx].title()}"
-            tab_title_str = " | ".join(tab_titles)
+                    self.round_trips["page.title"] += 1
+                    titles.append(tab.title())
+            tab_title_str = self.format_tab_titles(titles, current_tab_idx)
         except Exception:
-            tab_title_str = " | ".join(
-                ["Tab {idx}" for idx in range(len(open_tabs))]
+            tab_title_str = self.format_tab_titles(len(open_tabs))
+
+        if self.observation_type == "html":
+            dom_tree = self.fetch_page_html(
+                browser_info,
+                page,
+                client,
+                current_viewport_only=self.current_viewport_only,
+            )
+            content, obs_nodes_info = self.parse_html(dom_tree)
+
+        elif self.observation_type == "accessibility_tree":
+            accessibility_tree = self.fetch_page_accessibility_tree(
+                browser_info,
+                client,
+                current_viewport_only=self.current_viewport_only,
+            )
+            content, obs_nodes_info = self.parse_accessibility_tree(
+                accessibility_tree
+            )
+            content = self.clean_accesibility_tree(content)
+
+        else:
+            raise ValueError(
+                f"Invalid observatrion type: {self.observation_type}"
             )
 
+        return self.finish_observation(
+            content, obs_nodes_info, browser_info, client, tab_title_str
+        )
+
+    async def aprocess(self, page: APage, client: ACDPSession) -> str:
+        self.round_trips = Counter()
         try:
-            browser_info = self.fetch_browser_info(page, client)
+            browser_info = await self.afetch_browser_info(page, client)
         except Exception:
-            page.wait_for_load_state("load", timeout=500)
-            browser_info = self.fetch_browser_info(page, client)
+            await page.wait_for_load_state("load", timeout=500)
+            browser_info = await self.afetch_browser_info(page, client)
+
+        open_tabs = page.context.pages
+        try:
+            current_tab_idx = open_tabs.index(page)
+            other_tabs = [
+                tab
+                for idx, tab in enumerate(open_tabs)
+                if idx != current_tab_idx
+            ]
+            if other_tabs:
+                self.round_trips["page.title"] += len(other_tabs)
+            titles = list(
+                await asyncio.gather(*(tab.title() for tab in other_tabs))
+            )
+            titles.insert(current_tab_idx, self.browser_state["title"])
+            tab_title_str = self.format_tab_titles(titles, current_tab_idx)
+        except Exception:
+            tab_title_str = self.format_tab_titles(len(open_tabs))
 
         if self.observation_type == "html":
             dom_tree = self.fetch_page_html(
@@ -613,11 +1057,9 @@ class TextObervationProcessor(ObservationProcessor):
                 current_viewport_only=self.current_viewport_only,
             )
             content, obs_nodes_info = self.parse_html(dom_tree)
-            self.obs_nodes_info = obs_nodes_info
-            self.meta_data["obs_nodes_info"] = obs_nodes_info
 
         elif self.observation_type == "accessibility_tree":
-            accessibility_tree = self.fetch_page_accessibility_tree(
+            accessibility_tree = await self.afetch_page_accessibility_tree(
                 browser_info,
                 client,
                 current_viewport_only=self.current_viewport_only,
@@ -626,14 +1068,53 @@ class TextObervationProcessor(ObservationProcessor):
                 accessibility_tree
             )
             content = self.clean_accesibility_tree(content)
-            self.obs_nodes_info = obs_nodes_info
-            self.meta_data["obs_nodes_info"] = obs_nodes_info
 
         else:
             raise ValueError(
                 f"Invalid observatrion type: {self.observation_type}"
             )
 
+        return self.finish_observation(
+            content, obs_nodes_info, browser_info, client, tab_title_str
+        )
+
+    @staticmethod
+    def format_tab_titles(
+        titles: list[str] | int, current_tab_idx: int = -1
+    ) -> str:
+        """Tab header of the observation, only the tab numbers when the
+        titles could not be fetched"""
+        if isinstance(titles, int):
+            return " | ".join(f"Tab {idx}" for idx in range(titles))
+        tab_titles = []
+        for idx, title in enumerate(titles):
+            if idx == current_tab_idx:
+                tab_titles.append(f"Tab {idx} (current): {title}")
+            else:
+                tab_titles.append(f"Tab {idx}: {title}")
+        return " | ".join(tab_titles)
+
+    def finish_observation(
+        self,
+        content: str,
+        obs_nodes_info: dict[str, Any],
+        browser_info: BrowserInfo,
+        client: CDPSession | ACDPSession,
+        tab_title_str: str,
+    ) -> str:
+        self.obs_nodes_info = obs_nodes_info
+        self.meta_data["obs_nodes_info"] = obs_nodes_info
+
+        if self.incremental:
+            if client is self.prev_client:
+                obs_delta = get_observation_delta(self.prev_content, content)
+            else:
+                obs_delta = ""
+            self.meta_data["obs_delta"] = obs_delta
+            self.prev_client = client
+            self.prev_content = content
+
+        self.meta_data["round_trips"] = dict(self.round_trips)
         self.browser_config = browser_info["config"]
         content = f"{tab_title_str}\n\n{content}"
         return content
@@ -651,18 +1132,82 @@ class TextObervationProcessor(ObservationProcessor):
 
 
 class ImageObservationProcessor(ObservationProcessor):
-    def __init__(self, observation_type: str):
+    def __init__(
+        self,
+        observation_type: str,
+        screenshot_format: str = "png",
+        screenshot_quality: int = 80,
+        decode: bool = True,
+    ):
         self.observation_type = observation_type
         self.observation_tag = "image"
         self.meta_data = create_empty_metadata()
+        self.screenshot_format = screenshot_format
+        self.screenshot_quality = screenshot_quality
+        # the encoded screenshot is always kept as a data url in the meta
+        # data, the pixels are only needed if the agent looks at them
+        self.decode = decode
+
+    def capture_screenshot(self, page: Page, client: CDPSession) -> str:
+        """Return the screenshot of the viewport, base64 encoded"""
+        if self.screenshot_format == "png":
+            self.meta_data["round_trips"] = {"page.screenshot": 1}
+            return base64.b64encode(page.screenshot()).decode("utf-8")
+        # jpeg and webp frames straight from the compositor, cheaper to
+        # encode and to decode than a png
+        self.meta_data["round_trips"] = {"Page.captureScreenshot": 1}
+        response = client.send(
+            "Page.captureScreenshot",
+            {
+                "format": self.screenshot_format,
+                "quality": self.screenshot_quality,
+            },
+        )
+        data: str = response["data"]
+        return data
+
+    async def acapture_screenshot(
+        self, page: APage, client: ACDPSession
+    ) -> str:
+        if self.screenshot_format == "png":
+            self.meta_data["round_trips"] = {"page.screenshot": 1}
+            return base64.b64encode(await page.screenshot()).decode("utf-8")
+        self.meta_data["round_trips"] = {"Page.captureScreenshot": 1}
+        response = await client.send(
+            "Page.captureScreenshot",
+            {
+                "format": self.screenshot_format,
+                "quality": self.screenshot_quality,
+            },
+        )
+        data: str = response["data"]
+        return data
 
     def process(self, page: Page, client: CDPSession) -> npt.NDArray[np.uint8]:
         try:
-            screenshot = png_bytes_to_numpy(page.screenshot())
+            data = self.capture_screenshot(page, client)
         except:
             page.wait_for_event("load")
-            screenshot = png_bytes_to_numpy(page.screenshot())
-        return screenshot
+            data = self.capture_screenshot(page, client)
+        return self.finish_observation(data)
+
+    async def aprocess(
+        self, page: APage, client: ACDPSession
+    ) -> npt.NDArray[np.uint8]:
+        try:
+            data = await self.acapture_screenshot(page, client)
+        except Exception:
+            await page.wait_for_event("load")
+            data = await self.acapture_screenshot(page, client)
+        return self.finish_observation(data)
+
+    def finish_observation(self, data: str) -> npt.NDArray[np.uint8]:
+        self.meta_data[
+            "screenshot"
+        ] = f"data:image/{self.screenshot_format};base64,{data}"
+        if not self.decode:
+            return np.zeros((0, 0, 3), dtype=np.uint8)
+        return png_bytes_to_numpy(base64.b64decode(data))
 
 
 class ObservationHandler:
@@ -675,15 +1220,31 @@ class ObservationHandler:
         image_observation_type: str,
         current_viewport_only: bool,
         viewport_size: ViewportSize,
+        incremental_observation: bool = False,
+        record_dir: str | None = None,
+        capture_screenshot: bool = True,
+        screenshot_format: str = "png",
+        decode_screenshot: bool = True,
     ) -> None:
         self.main_observation_type = main_observation_type
         self.text_processor = TextObervationProcessor(
-            text_observation_type, current_viewport_only, viewport_size
+            text_observation_type,
+            current_viewport_only,
+            viewport_size,
+            incremental=incremental_observation,
         )
         self.image_processor = ImageObservationProcessor(
-            image_observation_type
+            image_observation_type,
+            screenshot_format=screenshot_format,
+            decode=decode_screenshot or main_observation_type == "image",
         )
         self.viewport_size = viewport_size
+        # text-only agents that do not render the screenshots can skip them
+        self.capture_screenshot = (
+            capture_screenshot or main_observation_type == "image"
+        )
+        # dump the payloads of the text observations for offline replays
+        self.recorder = ObservationRecorder(record_dir) if record_dir else None
 
     def get_observation_space(self) -> spaces.Dict:
         text_space = spaces.Text(
@@ -711,8 +1272,25 @@ class ObservationHandler:
     def get_observation(
         self, page: Page, client: CDPSession
     ) -> dict[str, Observation]:
-        text_obs = self.text_processor.process(page, client)
-        image_obs = self.image_processor.process(page, client)
+        if self.recorder is not None:
+            text_obs = self.recorder.record(self.text_processor, page, client)
+        else:
+            text_obs = self.text_processor.process(page, client)
+        if self.capture_screenshot:
+            image_obs = self.image_processor.process(page, client)
+        else:
+            image_obs = np.zeros((0, 0, 3), dtype=np.uint8)
+        return {"text": text_obs, "image": image_obs}
+
+    async def aget_observation(
+        self, page: APage, client: ACDPSession
+    ) -> dict[str, Observation]:
+        # the recorder wraps the sync api only
+        text_obs = await self.text_processor.aprocess(page, client)
+        if self.capture_screenshot:
+            image_obs = await self.image_processor.aprocess(page, client)
+        else:
+            image_obs = np.zeros((0, 0, 3), dtype=np.uint8)
         return {"text": text_obs, "image": image_obs}
 
     def get_observation_metadata(self) -> dict[str, ObservationMetadata]:
@@ -0,0 +1,238 @@
+"""Record the browser payloads behind the text observations and replay them
+offline, e.g., to benchmark the processors without the live sites.
+
+The corpus is a directory with one gzipped jsonl file per page type, each
+line holds one observation step:
+{
+    "page_type": ..., "url": ...,
+    "observation_type": ..., "current_viewport_only": ..., "viewport_size": ...,
+    "tabs": [tab titles], "current_tab": index of the observed tab,
+    "evaluate": {javascript expression: value},
+    "cdp": {request key: response},
+}
+"""
+import copy
+import gzip
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from playwright.sync_api import CDPSession, Page
+
+if TYPE_CHECKING:
+    from .processors import TextObervationProcessor
+
+PAGE_TYPES = (
+    "shopping",
+    "shopping_admin",
+    "gitlab",
+    "reddit",
+    "wikipedia",
+    "map",
+)
+
+ReplayStep = dict[str, Any]
+
+
+def get_page_type(url: str) -> str:
+    """Map the url to the website it belongs to, `other` if none matches"""
+    from .env_config import (
+        GITLAB,
+        MAP,
+        REDDIT,
+        SHOPPING,
+        SHOPPING_ADMIN,
+        WIKIPEDIA,
+    )
+
+    sites = {
+        "shopping": SHOPPING,
+        "shopping_admin": SHOPPING_ADMIN,
+        "gitlab": GITLAB,
+        "reddit": REDDIT,
+        "wikipedia": WIKIPEDIA,
+        "map": MAP,
+    }
+    # the admin panel lives under the shopping site in some deployments
+    for page_type, site_url in sorted(
+        sites.items(), key=lambda item: len(item[1]), reverse=True
+    ):
+        if url.startswith(site_url):
+            return page_type
+    return "other"
+
+
+def get_request_key(method: str, params: Any = None) -> str:
+    """The per-node commands are keyed by their node, the function body sent
+    with `Runtime.callFunctionOn` is the same for every node"""
+    params = params or {}
+    if method == "DOM.resolveNode":
+        return f"{method}:{params['backendNodeId']}"
+    elif method == "Runtime.callFunctionOn":
+        return f"{method}:{params['objectId']}"
+    return method
+
+
+class RecordingCDPSession:
+    """Forward the commands to the CDP session and keep the responses"""
+
+    def __init__(self, client: CDPSession, step: ReplayStep) -> None:
+        self.client = client
+        self.step = step
+
+    def send(self, method: str, params: Any = None) -> Any:
+        key = get_request_key(method, params)
+        try:
+            response = self.client.send(method, params)
+        except Exception as e:
+            self.step["cdp"][key] = {"error": str(e)}
+            raise
+        # the processors update the responses in place
+        self.step["cdp"][key] = copy.deepcopy(response)
+        return response
+
+    def on(self, event: str, handler: Any) -> None:
+        self.client.on(event, handler)
+
+
+class RecordingPage:
+    """Forward everything to the page and keep the evaluated values"""
+
+    def __init__(self, page: Page, step: ReplayStep) -> None:
+        self.page = page
+        self.step = step
+
+    def evaluate(self, expression: str) -> Any:
+        value = self.page.evaluate(expression)
+        self.step["evaluate"][expression] = value
+        return value
+
+    @property
+    def context(self) -> "RecordingContext":
+        return RecordingContext(self)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.page, name)
+
+
+class RecordingContext:
+    def __init__(self, page: RecordingPage) -> None:
+        self.recording_page = page
+
+    @property
+    def pages(self) -> list[Any]:
+        page = self.recording_page.page
+        return [
+            self.recording_page if tab is page else tab
+            for tab in page.context.pages
+        ]
+
+
+class ObservationRecorder:
+    """Append the payloads of every processed observation to the corpus"""
+
+    def __init__(self, corpus_dir: str | Path) -> None:
+        self.corpus_dir = Path(corpus_dir)
+        self.corpus_dir.mkdir(parents=True, exist_ok=True)
+        # keep one wrapper per session, the processors cache by session
+        self.recording_client: RecordingCDPSession | None = None
+
+    def record(
+        self,
+        processor: "TextObervationProcessor",
+        page: Page,
+        client: CDPSession,
+    ) -> str:
+        step: ReplayStep = {
+            "page_type": get_page_type(page.url),
+            "url": page.url,
+            "observation_type": processor.observation_type,
+            "current_viewport_only": processor.current_viewport_only,
+            "viewport_size": processor.viewport_size,
+            "evaluate": {},
+            "cdp": {},
+        }
+        if (
+            self.recording_client is None
+            or self.recording_client.client is not client
+        ):
+            self.recording_client = RecordingCDPSession(client, step)
+        self.recording_client.step = step
+        content = processor.process(
+            RecordingPage(page, step),  # type: ignore[arg-type]
+            self.recording_client,  # type: ignore[arg-type]
+        )
+        open_tabs = page.context.pages
+        step["tabs"] = [tab.title() for tab in open_tabs]
+        step["current_tab"] = open_tabs.index(page)
+
+        corpus_file = self.corpus_dir / f"{step['page_type']}.jsonl.gz"
+        with gzip.open(corpus_file, "at") as f:
+            f.write(json.dumps(step, separators=(",", ":")) + "\n")
+        return content
+
+
+def load_corpus(corpus_dir: str | Path) -> dict[str, list[ReplayStep]]:
+    """Load the recorded steps, grouped by page type"""
+    corpus: dict[str, list[ReplayStep]] = {}
+    for corpus_file in sorted(Path(corpus_dir).glob("*.jsonl.gz")):
+        with gzip.open(corpus_file, "rt") as f:
+            for line in f:
+                step = json.loads(line)
+                corpus.setdefault(step["page_type"], []).append(step)
+    return corpus
+
+
+class ReplayCDPSession:
+    """Answer the CDP commands from a recorded step.
+
+    The responses are copied once when the session is created, as the
+    processors update them in place, so a session serves a single replay.
+    """
+
+    def __init__(self, step: ReplayStep) -> None:
+        self.responses = copy.deepcopy(step["cdp"])
+
+    def send(self, method: str, params: Any = None) -> Any:
+        key = get_request_key(method, params)
+        if key not in self.responses:
+            raise RuntimeError(f"No recorded response for {key}")
+        response = self.responses[key]
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def on(self, event: str, handler: Any) -> None:
+        # nothing changes during a replay
+        pass
+
+
+class ReplayTab:
+    def __init__(self, title: str) -> None:
+        self._title = title
+
+    def title(self) -> str:
+        return self._title
+
+
+class ReplayContext:
+    def __init__(self, pages: list[Any]) -> None:
+        self.pages = pages
+
+
+class ReplayPage(ReplayTab):
+    """The parts of a page the text processor touches, from a recorded step"""
+
+    def __init__(self, step: ReplayStep) -> None:
+        super().__init__(step["tabs"][step["current_tab"]])
+        self.url = step["url"]
+        self.evaluations = step["evaluate"]
+        pages: list[Any] = [ReplayTab(title) for title in step["tabs"]]
+        pages[step["current_tab"]] = self
+        self.context = ReplayContext(pages)
+
+    def evaluate(self, expression: str) -> Any:
+        return self.evaluations[expression]
+
+    def wait_for_load_state(self, *args: Any, **kwargs: Any) -> None:
+        pass
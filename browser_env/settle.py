@@ -0,0 +1,161 @@
+"""Wait for the page to settle after an action, instead of a fixed sleep.
+
+The page is considered settled once it is loaded, no request has been in
+flight for a quiet window and the DOM has not been mutated for a quiet
+window, whichever comes first with the hard cap.
+"""
+import asyncio
+import time
+from typing import TypedDict
+
+from playwright.async_api import BrowserContext as ABrowserContext
+from playwright.async_api import Page as APage
+from playwright.async_api import Request as ARequest
+from playwright.sync_api import BrowserContext, Page, Request
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+
+# requests that stay open by design, e.g., long polling, never settle
+STALE_REQUEST_AGE = 10.0
+IGNORED_RESOURCE_TYPES = ("eventsource", "websocket")
+POLL_INTERVAL = 50  # ms
+
+DOM_QUIET_JS = """
+([quietMs, timeoutMs]) => new Promise(resolve => {
+    const start = performance.now();
+    let last = start;
+    const observer = new MutationObserver(() => { last = performance.now(); });
+    observer.observe(document, {
+        subtree: true, childList: true, attributes: true, characterData: true
+    });
+    const check = () => {
+        const now = performance.now();
+        if (now - last >= quietMs || now - start >= timeoutMs) {
+            observer.disconnect();
+            resolve(now - start);
+        } else {
+            setTimeout(check, Math.min(quietMs, 50));
+        }
+    };
+    setTimeout(check, Math.min(quietMs, timeoutMs));
+})
+"""
+
+
+class SettleTimings(TypedDict):
+    load: float
+    network: float
+    dom: float
+    total: float
+
+
+class NetworkTracker:
+    """Keep track of the requests in flight of all the pages in a context"""
+
+    def __init__(self, context: BrowserContext | ABrowserContext) -> None:
+        self.in_flight: dict[Request | ARequest, float] = {}
+        self.last_activity = time.perf_counter()
+        context.on("request", self.on_request)
+        context.on("requestfinished", self.on_request_done)
+        context.on("requestfailed", self.on_request_done)
+
+    def on_request(self, request: Request | ARequest) -> None:
+        if request.resource_type in IGNORED_RESOURCE_TYPES:
+            return
+        self.last_activity = time.perf_counter()
+        self.in_flight[request] = self.last_activity
+
+    def on_request_done(self, request: Request | ARequest) -> None:
+        if self.in_flight.pop(request, None) is not None:
+            self.last_activity = time.perf_counter()
+
+    def is_idle(self, quiet_window: float) -> bool:
+        now = time.perf_counter()
+        pending = [
+            start
+            for start in self.in_flight.values()
+            if now - start < STALE_REQUEST_AGE
+        ]
+        return not pending and now - self.last_activity >= quiet_window
+
+
+def wait_for_settled(
+    page: Page,
+    tracker: NetworkTracker | None,
+    timeout: float,
+    quiet_window: float = 0.5,
+) -> SettleTimings:
+    """Wait until the page is loaded, the network and the DOM are quiet, for
+    at most `timeout` seconds in total, and return the time spent on each"""
+    start = time.perf_counter()
+    deadline = start + timeout
+
+    def remaining_ms() -> float:
+        return max(0.0, (deadline - time.perf_counter()) * 1000)
+
+    try:
+        page.wait_for_load_state("load", timeout=remaining_ms())
+    except PlaywrightTimeoutError:
+        pass
+    load_end = time.perf_counter()
+
+    if tracker is not None:
+        while not tracker.is_idle(quiet_window) and remaining_ms() > 0:
+            # waiting through playwright lets it dispatch the events
+            page.wait_for_timeout(min(POLL_INTERVAL, remaining_ms()))
+    network_end = time.perf_counter()
+
+    if remaining_ms() > 0:
+        try:
+            page.evaluate(DOM_QUIET_JS, [quiet_window * 1000, remaining_ms()])
+        except Exception:
+            # e.g., the page navigated while waiting
+            pass
+    end = time.perf_counter()
+
+    return {
+        "load": load_end - start,
+        "network": network_end - load_end,
+        "dom": end - network_end,
+        "total": end - start,
+    }
+
+
+async def async_wait_for_settled(
+    page: APage,
+    tracker: NetworkTracker | None,
+    timeout: float,
+    quiet_window: float = 0.5,
+) -> SettleTimings:
+    start = time.perf_counter()
+    deadline = start + timeout
+
+    def remaining_ms() -> float:
+        return max(0.0, (deadline - time.perf_counter()) * 1000)
+
+    try:
+        await page.wait_for_load_state("load", timeout=remaining_ms())
+    except PlaywrightTimeoutError:
+        pass
+    load_end = time.perf_counter()
+
+    if tracker is not None:
+        while not tracker.is_idle(quiet_window) and remaining_ms() > 0:
+            # the events are dispatched by the event loop meanwhile
+            await asyncio.sleep(min(POLL_INTERVAL, remaining_ms()) / 1000)
+    network_end = time.perf_counter()
+
+    if remaining_ms() > 0:
+        try:
+            await page.evaluate(
+                DOM_QUIET_JS, [quiet_window * 1000, remaining_ms()]
+            )
+        except Exception:
+            pass
+    end = time.perf_counter()
+
+    return {
+        "load": load_end - start,
+        "network": network_end - load_end,
+        "dom": end - network_end,
+        "total": end - start,
+    }
@@ -0,0 +1,236 @@
+"""Parse the config of a task once and share it across the components.
+
+A TaskConfig is frozen, and its nested data is read-only, so the agent,
+the environment, the renders and the evaluators can all hold the same
+object. The config files are parsed once per version of the file, and a
+suite can be compiled into a TaskCatalog, a single file that is memory
+mapped and looked up by task id without parsing the other tasks.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Iterable, Mapping
+
+MAX_CACHED_CONFIGS = 4096
+
+CATALOG_MAGIC = b"WATASKS1"
+# the magic and the number of tasks
+CATALOG_HEADER = struct.Struct("<8sI")
+# the task id, the offset and the length of its config, sorted by task id
+CATALOG_ENTRY = struct.Struct("<qQI")
+
+
+def freeze(value: Any) -> Any:
+    """Turn the parsed JSON into read-only mappings and tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """The JSON data of a frozen value"""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+@dataclass(frozen=True)
+class TaskConfig:
+    """The config of a task, `data` holds all its keys in the file order"""
+
+    task_id: int
+    intent: str
+    sites: tuple[str, ...] = ()
+    require_login: bool = False
+    storage_state: str | None = None
+    start_url: str | None = None
+    geolocation: Mapping[str, Any] | None = None
+    require_reset: bool = False
+    eval: Mapping[str, Any] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    data: Mapping[str, Any] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+
+    @classmethod
+    def from_dict(cls, config: dict[str, Any]) -> "TaskConfig":
+        data = freeze(config)
+        return cls(
+            task_id=int(config["task_id"]),
+            intent=config.get("intent", ""),
+            sites=data.get("sites") or (),
+            require_login=bool(config.get("require_login", False)),
+            storage_state=config.get("storage_state") or None,
+            start_url=config.get("start_url") or None,
+            geolocation=data.get("geolocation"),
+            require_reset=bool(config.get("require_reset", False)),
+            eval=data.get("eval") or MappingProxyType({}),
+            data=data,
+        )
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def to_dict(self) -> dict[str, Any]:
+        config: dict[str, Any] = thaw(self.data)
+        return config
+
+    def with_storage_state(self, storage_state: str) -> "TaskConfig":
+        config = self.to_dict()
+        config["storage_state"] = storage_state
+        return TaskConfig.from_dict(config)
+
+
+class _ConfigCache:
+    """The parsed configs by path, dropped when the file changes"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.configs: OrderedDict[
+            str, tuple[int, int, TaskConfig]
+        ] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def load(self, config_file: str | Path) -> TaskConfig:
+        path = os.path.abspath(config_file)
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.configs.get(path)
+            if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+                self.configs.move_to_end(path)
+                return cached[2]
+        with open(path, "r") as f:
+            config = TaskConfig.from_dict(json.load(f))
+        with self.lock:
+            self.configs[path] = (stat.st_mtime_ns, stat.st_size, config)
+            if len(self.configs) > self.max_size:
+                self.configs.popitem(last=False)
+        return config
+
+
+_config_cache = _ConfigCache(MAX_CACHED_CONFIGS)
+
+
+def load_task_config(config: str | Path | TaskConfig) -> TaskConfig:
+    """The config of a task file, parsed once while the file is unchanged"""
+    if isinstance(config, TaskConfig):
+        return config
+    return _config_cache.load(config)
+
+
+class TaskCatalog:
+    """The configs of a suite in one file, looked up by task id
+
+    The file starts with the index of the tasks, sorted by id, followed by
+    their configs. The file is memory mapped, a lookup is a binary search
+    in the index and parses only the config of the task.
+    """
+
+    def __init__(self, path: str | Path) -> None:
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = CATALOG_HEADER.unpack_from(self.buffer, 0)
+        if magic != CATALOG_MAGIC:
+            raise ValueError(f"{self.path} is not a task catalog")
+        self.configs: dict[int, TaskConfig] = {}
+
+    @staticmethod
+    def compile(
+        configs: Iterable[dict[str, Any]], path: str | Path
+    ) -> "TaskCatalog":
+        payloads = sorted(
+            (
+                int(config["task_id"]),
+                json.dumps(config, ensure_ascii=False).encode("utf-8"),
+            )
+            for config in configs
+        )
+        offset = CATALOG_HEADER.size + CATALOG_ENTRY.size * len(payloads)
+        tmp_path = Path(f"{path}.{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            f.write(CATALOG_HEADER.pack(CATALOG_MAGIC, len(payloads)))
+            for task_id, payload in payloads:
+                f.write(CATALOG_ENTRY.pack(task_id, offset, len(payload)))
+                offset += len(payload)
+            for _, payload in payloads:
+                f.write(payload)
+        os.replace(tmp_path, path)
+        return TaskCatalog(path)
+
+    @staticmethod
+    def from_json(raw_json: str | Path, path: str | Path) -> "TaskCatalog":
+        """Compile a suite file like `config_files/test.json`"""
+        with open(raw_json, "r") as f:
+            return TaskCatalog.compile(json.load(f), path)
+
+    def entry(self, idx: int) -> tuple[int, int, int]:
+        entry: tuple[int, int, int] = CATALOG_ENTRY.unpack_from(
+            self.buffer, CATALOG_HEADER.size + CATALOG_ENTRY.size * idx
+        )
+        return entry
+
+    def find(self, task_id: int) -> int:
+        """The position of the task in the index, -1 if it is missing"""
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if self.entry(mid)[0] < task_id:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.size and self.entry(low)[0] == task_id:
+            return low
+        return -1
+
+    def get(self, task_id: int) -> TaskConfig:
+        config = self.configs.get(task_id)
+        if config is None:
+            idx = self.find(task_id)
+            if idx < 0:
+                raise KeyError(task_id)
+            _, offset, length = self.entry(idx)
+            config = TaskConfig.from_dict(
+                json.loads(self.buffer[offset : offset + length])
+            )
+            self.configs[task_id] = config
+        return config
+
+    def task_ids(self) -> list[int]:
+        return [self.entry(idx)[0] for idx in range(self.size)]
+
+    def __contains__(self, task_id: int) -> bool:
+        return self.find(task_id) >= 0
+
+    def __len__(self) -> int:
+        return int(self.size)
+
+    def close(self) -> None:
+        self.buffer.close()
+
+
+_catalogs: dict[str, TaskCatalog] = {}
+_catalogs_lock = threading.Lock()
+
+
+def open_catalog(path: str | Path) -> TaskCatalog:
+    """The catalog at the path, opened once per process"""
+    key = os.path.abspath(path)
+    with _catalogs_lock:
+        if key not in _catalogs:
+            _catalogs[key] = TaskCatalog(key)
+        return _catalogs[key]
@@ -0,0 +1,247 @@
+"""Store the trajectories of a run, one row per step.
+
+Each task is a Parquet file under `{result_dir}/trajectories/`, written
+once the task is evaluated, and the finished tasks are listed in an index
+that the workers of a run append to, like `results.jsonl`. The rows refer
+to the chunks of their observation, which are stored once for all the
+steps and the tasks in a ChunkStore. The renders are for looking at a
+task, the store is what resuming, exporting and analyzing a run read.
+"""
+import json
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Iterable
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from .actions import Action, ActionTypes
+from .chunk_store import ChunkStore
+from .utils import StateInfo
+
+STORE_DIR = "trajectories"
+INDEX_FILE = "index.jsonl"
+CHUNKS_FILE = "chunks.sqlite"
+
+STEP_SCHEMA = pa.schema(
+    [
+        ("task_id", pa.int64()),
+        ("step", pa.int32()),
+        ("url", pa.string()),
+        ("observation_chunks", pa.list_(pa.string())),
+        ("screenshot", pa.string()),
+        ("prev_action", pa.string()),
+        ("action_type", pa.string()),
+        ("action", pa.string()),
+        ("raw_prediction", pa.string()),
+        ("element_id", pa.string()),
+        ("answer", pa.string()),
+        ("llm_seconds", pa.float64()),
+        ("env_seconds", pa.float64()),
+        # the settle timings and the error of the action that led here
+        ("metadata", pa.string()),
+        ("score", pa.float64()),
+    ]
+)
+
+
+@dataclass
+class IndexEntry:
+    task_id: int
+    config_file: str
+    file: str
+    steps: int
+    score: float
+    finished_at: float
+
+
+class TrajectoryStore:
+    """The trajectories of the finished tasks of a result dir"""
+
+    def __init__(self, result_dir: str | Path) -> None:
+        self.root = Path(result_dir) / STORE_DIR
+        self.index_path = self.root / INDEX_FILE
+        self.chunks = ChunkStore(self.root / CHUNKS_FILE)
+
+    def exists(self) -> bool:
+        return self.index_path.exists()
+
+    def write(
+        self,
+        task_id: int,
+        config_file: str,
+        rows: list[dict[str, Any]],
+        score: float,
+    ) -> IndexEntry:
+        self.root.mkdir(parents=True, exist_ok=True)
+        observation_chunks = self.chunks.put_many(
+            [row["observation"] for row in rows]
+        )
+        rows = [
+            {k: v for k, v in row.items() if k != "observation"}
+            | {"observation_chunks": chunks, "score": score}
+            for row, chunks in zip(rows, observation_chunks)
+        ]
+        table = pa.Table.from_pylist(rows, schema=STEP_SCHEMA)
+        file_name = f"task_{task_id}.parquet"
+        # written aside and renamed, a killed worker leaves no partial file
+        tmp_path = self.root / f".{file_name}.{os.getpid()}"
+        pq.write_table(table, tmp_path, compression="zstd")
+        os.replace(tmp_path, self.root / file_name)
+
+        entry = IndexEntry(
+            task_id, config_file, file_name, len(rows), score, time.time()
+        )
+        with open(self.index_path, "a") as f:
+            f.write(json.dumps(asdict(entry)) + "\n")
+        return entry
+
+    def entries(self) -> dict[int, IndexEntry]:
+        """The last entry of each finished task"""
+        entries: dict[int, IndexEntry] = {}
+        if not self.exists():
+            return entries
+        with open(self.index_path, "r") as f:
+            for line in f:
+                try:
+                    entry = IndexEntry(**json.loads(line))
+                except (json.JSONDecodeError, TypeError):
+                    # the line of a killed worker
+                    continue
+                entries[entry.task_id] = entry
+        return entries
+
+    def finished_task_ids(self) -> set[int]:
+        return set(self.entries())
+
+    def read(self, task_id: int) -> list[dict[str, Any]]:
+        entry = self.entries()[task_id]
+        table = self.with_observations(pq.read_table(self.root / entry.file))
+        rows: list[dict[str, Any]] = table.to_pylist()
+        return rows
+
+    def with_observations(self, table: pa.Table) -> pa.Table:
+        """Replace the chunks by the text of the observations"""
+        hashes = table["observation_chunks"].to_pylist()
+        chunks = self.chunks.get_many(h for row in hashes for h in row)
+        observations = pa.array(
+            ["".join(chunks[h] for h in row) for row in hashes], pa.string()
+        )
+        idx = table.schema.get_field_index("observation_chunks")
+        return table.set_column(idx, "observation", observations)
+
+    def scan(
+        self,
+        columns: list[str] | None = None,
+        task_ids: Iterable[int] | None = None,
+    ) -> pa.Table:
+        """The steps of the finished tasks as one table, only the given
+        columns are read from the files, and the observations are only
+        joined from their chunks if they are asked for"""
+        names = [
+            "observation_chunks" if name == "observation" else name
+            for name in columns or STEP_SCHEMA.names
+        ]
+        entries = self.entries()
+        if task_ids is not None:
+            wanted = set(task_ids)
+            entries = {k: v for k, v in entries.items() if k in wanted}
+        if entries:
+            dataset = ds.dataset(
+                [str(self.root / entry.file) for entry in entries.values()],
+                schema=STEP_SCHEMA,
+                format="parquet",
+            )
+            table = dataset.to_table(columns=names)
+        else:
+            table = STEP_SCHEMA.empty_table().select(names)
+        if columns is None or "observation" in columns:
+            table = self.with_observations(table)
+        return table
+
+    def find(
+        self, substrings: list[str], task_ids: Iterable[int] | None = None
+    ) -> set[int]:
+        """The tasks with a step whose observation contains any of the
+        substrings, searched in each chunk once instead of in each step"""
+        found = self.chunks.find(substrings)
+        if not found:
+            return set()
+        steps = self.scan(["task_id", "observation_chunks"], task_ids)
+        return {
+            task_id
+            for task_id, hashes in zip(
+                steps["task_id"].to_pylist(),
+                steps["observation_chunks"].to_pylist(),
+            )
+            if not found.isdisjoint(hashes)
+        }
+
+    def remove(self, task_ids: Iterable[int]) -> None:
+        """Drop the tasks from the store, so that they run again, their
+        chunks are kept since other steps may share them"""
+        removed = set(task_ids)
+        entries = self.entries()
+        tmp_path = self.root / f".{INDEX_FILE}.{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            for task_id, entry in entries.items():
+                if task_id not in removed:
+                    f.write(json.dumps(asdict(entry)) + "\n")
+        os.replace(tmp_path, self.index_path)
+        for task_id in removed & set(entries):
+            (self.root / entries[task_id].file).unlink(missing_ok=True)
+
+
+class TrajectoryRecorder:
+    """Collect the steps of a task as it runs, next to the RenderHelper"""
+
+    def __init__(
+        self, store: TrajectoryStore, task_id: int, config_file: str
+    ) -> None:
+        self.store = store
+        self.task_id = task_id
+        self.config_file = config_file
+        self.rows: list[dict[str, Any]] = []
+
+    def record(
+        self,
+        action: Action,
+        action_str: str,
+        state_info: StateInfo,
+        meta_data: dict[str, Any],
+        llm_seconds: float,
+        env_seconds: float,
+        screenshot: str | None = None,
+    ) -> None:
+        info = state_info["info"]
+        metadata = {
+            "settle_timings": info.get("settle_timings"),
+            "fail_error": info.get("fail_error", ""),
+        }
+        self.rows.append(
+            {
+                "task_id": self.task_id,
+                "step": len(self.rows),
+                "url": info["page"].url,
+                "observation": state_info["observation"]["text"],
+                "screenshot": screenshot,
+                "prev_action": meta_data["action_history"][-1],
+                "action_type": ActionTypes(action["action_type"]).name,
+                "action": action_str,
+                "raw_prediction": action.get("raw_prediction", ""),
+                "element_id": action.get("element_id", ""),
+                "answer": action.get("answer", ""),
+                "llm_seconds": llm_seconds,
+                "env_seconds": env_seconds,
+                "metadata": json.dumps(metadata),
+                "score": None,
+            }
+        )
+
+    def finish(self, score: float) -> IndexEntry:
+        return self.store.write(
+            self.task_id, self.config_file, self.rows, score
+        )
@@ -63,6 +63,18 @@ class BrowserConfig(TypedDict):
     device_pixel_ratio: float
 
 
+class BrowserState(TypedDict):
+    win_top_bound: float
+    win_left_bound: float
+    win_width: float
+    win_height: float
+    device_pixel_ratio: float
+    url: str
+    title: str
+    scroll_width: float
+    scroll_height: float
+
+
 class BrowserInfo(TypedDict):
     DOMTree: dict[str, Any]
     config: BrowserConfig
@@ -1,22 +1,26 @@
 """base class for evaluation"""
 # answer string match
+import asyncio
 import collections
 import html
 import importlib
-import json
 import time
 import urllib
 from pathlib import Path
-from typing import Any, Tuple, Union
+from typing import Any, Generator, Mapping, Tuple, Union
 
 from beartype import beartype
 from nltk.tokenize import word_tokenize  # type: ignore
+from playwright.async_api import CDPSession as AsyncCDPSession
+from playwright.async_api import Page as AsyncPage
 from playwright.sync_api import CDPSession, Page
 
 from browser_env.actions import Action
+from browser_env.task_config import TaskConfig, load_task_config
 from browser_env.utils import StateInfo
 from evaluation_harness.helper_functions import (
     PseudoPage,
+    agitlab_get_project_memeber_role,
     gitlab_get_project_memeber_role,
     llm_fuzzy_match,
     llm_ua_match,
@@ -28,6 +32,12 @@ from evaluation_harness.helper_functions import (
 
 Trajectory = list[Union[Action, StateInfo]]
 
+# the helpers of the `func:` locators that drive the page, by the name the
+# configs call them with, for the evaluation on an async page
+ASYNC_PAGE_HELPERS = {
+    "gitlab_get_project_memeber_role": agitlab_get_project_memeber_role,
+}
+
 
 class Evaluator(object):
     def __init__(self, eval_tag: str = "") -> None:
@@ -37,12 +47,22 @@ class Evaluator(object):
     def __call__(
         self,
         trajectory: Trajectory,
-        config_file: Path | str,
+        config_file: Path | str | TaskConfig,
         page: Page | PseudoPage,
         client: CDPSession,
     ) -> float:
         raise NotImplementedError
 
+    async def acall(
+        self,
+        trajectory: Trajectory,
+        config_file: Path | str | TaskConfig,
+        page: AsyncPage,
+        client: AsyncCDPSession | None = None,
+    ) -> float:
+        """Evaluate on the async page the episode ended on"""
+        raise NotImplementedError
+
     @staticmethod
     def get_last_action(trajectory: Trajectory) -> Action:
         try:
@@ -123,12 +143,11 @@ class StringEvaluator(Evaluator):
     def __call__(
         self,
         trajectory: Trajectory,
-        config_file: Path | str,
+        config_file: Path | str | TaskConfig,
         page: Page | PseudoPage | None = None,
         client: CDPSession | None = None,
     ) -> float:
-        with open(config_file, "r") as f:
-            configs = json.load(f)
+        configs = load_task_config(config_file)
 
         last_action = self.get_last_action(trajectory)
         pred = self.clean_answer(last_action["answer"])
@@ -140,7 +159,7 @@ class StringEvaluator(Evaluator):
                     score *= self.exact_match(ref=value, pred=pred)
 
                 case "must_include":
-                    assert isinstance(value, list)
+                    assert isinstance(value, tuple)
                     for must_value in value:
                         score *= self.must_include(
                             ref=must_value,
@@ -162,13 +181,23 @@ class StringEvaluator(Evaluator):
                                 pred=pred,
                             )
                     else:
-                        assert isinstance(value, list)
+                        assert isinstance(value, tuple)
                         for reference in value:
                             score *= self.fuzzy_match(
                                 ref=reference, pred=pred, intent=intent
                             )
         return score
 
+    async def acall(
+        self,
+        trajectory: Trajectory,
+        config_file: Path | str | TaskConfig,
+        page: AsyncPage | None = None,
+        client: AsyncCDPSession | None = None,
+    ) -> float:
+        # the page is not used, only the judge calls may block
+        return await asyncio.to_thread(self, trajectory, config_file)
+
 
 class URLEvaluator(Evaluator):
     """Check URL matching"""
@@ -177,13 +206,24 @@ class URLEvaluator(Evaluator):
     def __call__(
         self,
         trajectory: Trajectory,
-        config_file: Path | str,
+        config_file: Path | str | TaskConfig,
         page: Page | PseudoPage,
         client: CDPSession | None = None,
     ) -> float:
-        with open(config_file, "r") as f:
-            configs = json.load(f)
+        return self.match_url(load_task_config(config_file), page.url)
+
+    @beartype
+    async def acall(
+        self,
+        trajectory: Trajectory,
+        config_file: Path | str | TaskConfig,
+        page: AsyncPage,
+        client: AsyncCDPSession | None = None,
+    ) -> float:
+        return self.match_url(load_task_config(config_file), page.url)
 
+    @staticmethod
+    def match_url(configs: TaskConfig, url: str) -> float:
         def clean_url(url: str) -> str:
             url = str(url)
             url = url.rstrip("/")
@@ -209,7 +249,7 @@ class URLEvaluator(Evaluator):
                     queries[k].update(v)
             return base_paths, queries
 
-        pred = clean_url(page.url)
+        pred = clean_url(url)
         ref_urls = configs["eval"]["reference_url"].split(" |OR| ")
         ref_urls = [clean_url(url) for url in ref_urls]
         matching_rule = configs["eval"].get("url_note", "GOLD in PRED")
@@ -242,19 +282,100 @@ class URLEvaluator(Evaluator):
 
 
 class HTMLContentEvaluator(Evaluator):
-    """Check whether the contents appear in the page"""
+    """Check whether the contents appear in the page
+
+    The checks are written once, in `check_targets`, which yields the
+    calls to the page so that a sync and an async page run the same ones.
+    """
 
     @beartype
     def __call__(
         self,
         trajectory: Trajectory,
-        config_file: Path | str,
+        config_file: Path | str | TaskConfig,
         page: Page | PseudoPage,
         client: CDPSession | None = None,
     ) -> float:
-        with open(config_file, "r") as f:
-            configs = json.load(f)
+        checks = self.check_targets(load_task_config(config_file))
+        try:
+            call = next(checks)
+            while True:
+                call = checks.send(self.call_page(page, *call))
+        except StopIteration as stop:
+            score: float = stop.value
+            return score
 
+    @beartype
+    async def acall(
+        self,
+        trajectory: Trajectory,
+        config_file: Path | str | TaskConfig,
+        page: AsyncPage,
+        client: AsyncCDPSession | None = None,
+    ) -> float:
+        checks = self.check_targets(load_task_config(config_file))
+        try:
+            call = next(checks)
+            while True:
+                call = checks.send(await self.acall_page(page, *call))
+        except StopIteration as stop:
+            score: float = stop.value
+            return score
+
+    @staticmethod
+    def call_page(page: Page | PseudoPage, kind: str, arg: str) -> Any:
+        match kind:
+            case "url":
+                return page.url
+            case "goto":
+                page.goto(arg)
+                time.sleep(3)  # TODO [shuyanzh]: fix this hard-coded sleep
+                return None
+            case "content":
+                return page.content()
+            case "evaluate":
+                try:
+                    return page.evaluate(arg)
+                except Exception as e:
+                    return e
+            case "eval":
+                return eval(arg)
+            case "page_eval":
+                return eval(arg, globals(), {"page": page})
+        raise ValueError(f"Unknown page call: {kind}")
+
+    @staticmethod
+    async def acall_page(page: AsyncPage, kind: str, arg: str) -> Any:
+        """The page calls of `call_page` on an async page, the helpers that
+        call the sites run in a thread"""
+        match kind:
+            case "url":
+                return page.url
+            case "goto":
+                await page.goto(arg)
+                await asyncio.sleep(3)
+                return None
+            case "content":
+                return await page.content()
+            case "evaluate":
+                try:
+                    return await page.evaluate(arg)
+                except Exception as e:
+                    return e
+            case "eval":
+                return await asyncio.to_thread(eval, arg, globals())
+            case "page_eval":
+                return await eval(
+                    arg, globals() | ASYNC_PAGE_HELPERS, {"page": page}
+                )
+        raise ValueError(f"Unknown page call: {kind}")
+
+    def check_targets(
+        self, configs: TaskConfig
+    ) -> Generator[tuple[str, str], Any, float]:
+        """Score the targets, each call to the page is yielded as its kind
+        and argument and the result is sent back, the errors of the
+        `evaluate` calls are sent back instead of raised"""
         targets = configs["eval"]["program_html"]
 
         score = 1.0
@@ -262,74 +383,81 @@ class HTMLContentEvaluator(Evaluator):
             target_url: str = target["url"]  # which url to check
             if target_url.startswith("func"):
                 func = target_url.split("func:")[1]
-                func = func.replace("__last_url__", page.url)
-                target_url = eval(func)
+                func = func.replace("__last_url__", (yield ("url", "")))
+                target_url = yield ("eval", func)
 
             locator: str = target["locator"]  # js element locator
 
             # navigate to that url
             if target_url != "last":
-                page.goto(target_url)
-                time.sleep(3)  # TODO [shuyanzh]: fix this hard-coded sleep
+                yield ("goto", target_url)
 
             # empty, use the full page
             if not locator.strip():
-                selected_element = page.content()
+                selected_element = yield ("content", "")
             # use JS to select the element
             elif locator.startswith("document.") or locator.startswith(
                 "[...document."
             ):
-                if "prep_actions" in target:
-                    try:
-                        for prep_action in target["prep_actions"]:
-                            page.evaluate(f"() => {prep_action}")
-                    except Exception:
-                        pass
-                try:
-                    selected_element = str(page.evaluate(f"() => {locator}"))
-                    if not selected_element:
-                        selected_element = ""
-                except Exception:
+                for prep_action in target.get("prep_actions", ()):
+                    prepared = yield ("evaluate", f"() => {prep_action}")
+                    if isinstance(prepared, Exception):
+                        break
+                selected = yield ("evaluate", f"() => {locator}")
+                if isinstance(selected, Exception):
                     # the page is wrong, return empty
                     selected_element = ""
+                else:
+                    selected_element = str(selected)
             # run program to call API
             elif locator.startswith("func:"):  # a helper function
                 func = locator.split("func:")[1]
-                func = func.replace("__page__", "page")
-                selected_element = eval(func)
+                if "__page__" in func:
+                    func = func.replace("__page__", "page")
+                    selected_element = yield ("page_eval", func)
+                else:
+                    selected_element = yield ("eval", func)
             else:
                 raise ValueError(f"Unknown locator: {locator}")
 
-            selected_element = html.unescape(selected_element)
+            score *= self.match_contents(target, selected_element)
+        return score
+
+    @staticmethod
+    def match_contents(
+        target: Mapping[str, Any], selected_element: str
+    ) -> float:
+        selected_element = html.unescape(selected_element)
 
-            if "exact_match" in target["required_contents"]:
-                required_contents = target["required_contents"]["exact_match"]
-                cur_score = StringEvaluator.exact_match(
-                    ref=required_contents, pred=selected_element
+        score = 1.0
+        if "exact_match" in target["required_contents"]:
+            required_contents = target["required_contents"]["exact_match"]
+            cur_score = StringEvaluator.exact_match(
+                ref=required_contents, pred=selected_element
+            )
+            score *= float(cur_score)
+            # print(f"[exact match] {cur_score}, selected element: {selected_element}, required contents: {required_contents}")
+        elif "must_include" in target["required_contents"]:
+            required_contents = target["required_contents"]["must_include"]
+            assert isinstance(required_contents, tuple)
+            for content in required_contents:
+                content_or = content.split(" |OR| ")
+                cur_score = any(
+                    [
+                        StringEvaluator.must_include(
+                            ref=content,
+                            pred=selected_element,
+                            tokenize=False,
+                        )
+                        for content in content_or
+                    ]
                 )
                 score *= float(cur_score)
-                # print(f"[exact match] {cur_score}, selected element: {selected_element}, required contents: {required_contents}")
-            elif "must_include" in target["required_contents"]:
-                required_contents = target["required_contents"]["must_include"]
-                assert isinstance(required_contents, list)
-                for content in required_contents:
-                    content_or = content.split(" |OR| ")
-                    cur_score = any(
-                        [
-                            StringEvaluator.must_include(
-                                ref=content,
-                                pred=selected_element,
-                                tokenize=False,
-                            )
-                            for content in content_or
-                        ]
-                    )
-                    score *= float(cur_score)
-                    # print(f"[must include] {cur_score}, selected element: {selected_element}, required contents: {content_or}")
-            else:
-                raise ValueError(
-                    f"Unknown required_contents: {target['required_contents'].keys()}"
-                )
+                # print(f"[must include] {cur_score}, selected element: {selected_element}, required contents: {content_or}")
+        else:
+            raise ValueError(
+                f"Unknown required_contents: {target['required_contents'].keys()}"
+            )
         return score
 
 
@@ -341,7 +469,7 @@ class EvaluatorComb:
     def __call__(
         self,
         trajectory: Trajectory,
-        config_file: Path | str,
+        config_file: Path | str | TaskConfig,
         page: Page | PseudoPage,
         client: CDPSession,
     ) -> float:
@@ -351,12 +479,29 @@ class EvaluatorComb:
             score *= cur_score
         return score
 
+    @beartype
+    async def acall(
+        self,
+        trajectory: Trajectory,
+        config_file: Path | str | TaskConfig,
+        page: AsyncPage,
+        client: AsyncCDPSession | None = None,
+    ) -> float:
+        score = 1.0
+        for evaluator in self.evaluators:
+            cur_score = await evaluator.acall(
+                trajectory, config_file, page, client
+            )
+            score *= cur_score
+        return score
+
 
 @beartype
-def evaluator_router(config_file: Path | str) -> EvaluatorComb:
+def evaluator_router(
+    config_file: Path | str | TaskConfig,
+) -> EvaluatorComb:
     """Router to get the evaluator class"""
-    with open(config_file, "r") as f:
-        configs = json.load(f)
+    configs = load_task_config(config_file)
 
     eval_types = configs["eval"]["eval_types"]
     evaluators: list[Evaluator] = []
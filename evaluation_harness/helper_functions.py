@@ -1,9 +1,11 @@
 """Implements helper functions to assist evaluation cases where other evaluators are not suitable."""
 import json
+import os
 from typing import Any
 from urllib.parse import urlparse
 
 import requests
+from playwright.async_api import Page as AsyncPage
 from playwright.sync_api import CDPSession, Page
 
 from browser_env.env_config import (
@@ -15,10 +17,23 @@ from browser_env.env_config import (
     SHOPPING_ADMIN,
     WIKIPEDIA,
 )
+from llms import PromptCache
+from llms.lm_config import LMConfig
 from llms.providers.openai_utils import (
     generate_from_openai_chat_completion,
 )
 
+# the judges answer at temperature 0, so their verdicts are replayed when
+# the same answer is graded again, set LLM_JUDGE_CACHE to "" to disable
+JUDGE_CACHE_PATH = os.environ.get("LLM_JUDGE_CACHE", "cache/llm_judge.sqlite")
+JUDGE_LM_CONFIG = LMConfig(
+    provider="openai",
+    model="gpt-4-1106-preview",
+    mode="chat",
+    gen_config={"temperature": 0, "max_tokens": 768, "top_p": 1.0},
+)
+_judge_cache: PromptCache | None = None
+
 
 def shopping_get_auth_token() -> str:
     response = requests.post(
@@ -112,11 +127,8 @@ def reddit_get_post_url(url: str) -> str:
     return post_url
 
 
-def gitlab_get_project_memeber_role(page: Page, account_name: str) -> str:
-    # get the account index
-    try:
-        account_idx = page.evaluate(
-            f"""(() => {{
+def _gitlab_account_idx_js(account_name: str) -> str:
+    return f"""(() => {{
                 const elements = document.querySelectorAll("td[data-label='Account'] span.gl-avatar-labeled-sublabel");
                 let index = -1;  // Default value if not found
 
@@ -129,20 +141,66 @@ def gitlab_get_project_memeber_role(page: Page, account_name: str) -> str:
 
                 return index;
             }})()"""
-        )
 
-        # get the role
-        role: str = page.evaluate(
-            f"""(() => {{
+
+def _gitlab_role_js(account_idx: int) -> str:
+    return f"""(() => {{
                 return document.querySelectorAll("td.col-max-role span")[{account_idx}].outerText;
             }})()"""
-        )
+
+
+def gitlab_get_project_memeber_role(page: Page, account_name: str) -> str:
+    try:
+        # get the account index
+        account_idx = page.evaluate(_gitlab_account_idx_js(account_name))
+        # get the role
+        role: str = page.evaluate(_gitlab_role_js(account_idx))
     except Exception:
         role = ""
 
     return role
 
 
+async def agitlab_get_project_memeber_role(
+    page: AsyncPage, account_name: str
+) -> str:
+    """The async counterpart of `gitlab_get_project_memeber_role`"""
+    try:
+        account_idx = await page.evaluate(_gitlab_account_idx_js(account_name))
+        role: str = await page.evaluate(_gitlab_role_js(account_idx))
+    except Exception:
+        role = ""
+
+    return role
+
+
+def get_judge_cache() -> PromptCache | None:
+    global _judge_cache
+    if _judge_cache is None and JUDGE_CACHE_PATH:
+        _judge_cache = PromptCache(JUDGE_CACHE_PATH)
+    return _judge_cache
+
+
+def ask_judge(messages: list[dict[str, Any]]) -> str:
+    """Get the verdict of the judge model, from the cache if possible"""
+    cache = get_judge_cache()
+    if cache is not None:
+        if (cached := cache.get(JUDGE_LM_CONFIG, messages)) is not None:
+            return cached
+    gen_config = JUDGE_LM_CONFIG.gen_config
+    response: str = generate_from_openai_chat_completion(
+        model=JUDGE_LM_CONFIG.model,
+        messages=messages,
+        temperature=gen_config["temperature"],
+        max_tokens=gen_config["max_tokens"],
+        top_p=gen_config["top_p"],
+        context_length=0,
+    )
+    if cache is not None:
+        cache.put(JUDGE_LM_CONFIG, messages, response)
+    return response
+
+
 def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
     """Check whether the prediction matches the reference with GPT4-turbo"""
     messages: list[dict[str, Any]] = []
@@ -158,14 +216,7 @@ def llm_fuzzy_match(pred: str, reference: str, question: str) -> float:
         {"role": "user", "content": message},
     ]
 
-    response = generate_from_openai_chat_completion(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        temperature=0,
-        max_tokens=768,
-        top_p=1.0,
-        context_length=0,
-    ).lower()
+    response = ask_judge(messages).lower()
     if "partially correct" in response or "incorrect" in response:
         return 0.0
     else:
@@ -193,14 +244,7 @@ def llm_ua_match(pred: str, reference: str, question: str) -> float:
         {"role": "user", "content": message},
     ]
 
-    response = generate_from_openai_chat_completion(
-        model="gpt-4-1106-preview",
-        messages=messages,
-        temperature=0,
-        max_tokens=768,
-        top_p=1.0,
-        context_length=0,
-    ).lower()
+    response = ask_judge(messages).lower()
     if "different" in response:
         return 0.0
     else:
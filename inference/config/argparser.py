@@ -1,4 +1,4 @@
-from argparse import Namespace, ArgumentParser
+from argparse import BooleanOptionalAction, Namespace, ArgumentParser
 import time
 
 from .config import WebArenaConfig
@@ -58,10 +58,87 @@ def _add_webarena_config(parser: ArgumentParser) -> ArgumentParser:
     )
     parser.add_argument("--viewport_width", type=int, default=1280)
     parser.add_argument("--viewport_height", type=int, default=720)
+    parser.add_argument(
+        "--render_screenshot",
+        action=BooleanOptionalAction,
+        default=True,
+        help="Capture the screenshots and add them to the render",
+    )
+    parser.add_argument(
+        "--render_screenshot_files",
+        action="store_true",
+        help="Save the screenshots of the render as files next to it "
+        "instead of inlining them",
+    )
+    parser.add_argument(
+        "--screenshot_format",
+        choices=["png", "jpeg", "webp"],
+        default="png",
+        help="Encoding of the captured screenshots",
+    )
     parser.add_argument("--save_trace_enabled", action="store_true")
     parser.add_argument("--sleep_after_execution", type=float, default=0.0)
+    parser.add_argument(
+        "--settle_timeout",
+        type=float,
+        default=0.0,
+        help="When not zero, wait for the network and the DOM to be quiet "
+        "for at most this many seconds instead of sleep_after_execution",
+    )
+    parser.add_argument(
+        "--incremental_observation",
+        action="store_true",
+        help="Reuse the whole accessibility tree when nothing on the page "
+        "changed since the previous step",
+    )
 
     parser.add_argument("--max_steps", type=int, default=30)
+    parser.add_argument(
+        "--context_pool_size",
+        type=int,
+        default=0,
+        help="Number of browser contexts created ahead of the tasks",
+    )
+    parser.add_argument(
+        "--browser_recycle_after",
+        type=int,
+        default=1,
+        help="Relaunch the browser after this many tasks, 0 to keep it",
+    )
+    parser.add_argument(
+        "--browser_recycle_memory_growth",
+        type=float,
+        default=0.0,
+        help="When not zero, relaunch the browser once its memory grew by "
+        "more than this many MB",
+    )
+
+    parser.add_argument(
+        "--num_workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, each with its own browser",
+    )
+    parser.add_argument(
+        "--max_task_retries",
+        type=int,
+        default=1,
+        help="Times a failed task is queued again by the parallel runner",
+    )
+    parser.add_argument(
+        "--num_concurrent_episodes",
+        type=int,
+        default=1,
+        help="Number of episodes run concurrently in one process, sharing "
+        "one browser, while the others wait for the model",
+    )
+    parser.add_argument(
+        "--site_reset_command",
+        type=str,
+        default="",
+        help="Shell command that resets a website, {site} is replaced by "
+        "the site, run after the tasks with require_reset",
+    )
 
     # agent config
     parser.add_argument("--agent_type", type=str, default="prompt")
@@ -82,6 +159,12 @@ def _add_webarena_config(parser: ArgumentParser) -> ArgumentParser:
         type=int,
         default=3,
     )
+    parser.add_argument(
+        "--stream_action",
+        action="store_true",
+        help="Stream the model responses and cancel them as soon as they "
+        "contain a valid action",
+    )
     return parser
 
 def _add_lm_config(parser: ArgumentParser) -> ArgumentParser:
@@ -105,17 +188,60 @@ def _add_lm_config(parser: ArgumentParser) -> ArgumentParser:
         help="when not zero, will truncate the observation to this length before feeding to the model",
         default=1920,
     )
+    parser.add_argument(
+        "--obs_truncation",
+        choices=["head", "structure"],
+        default="head",
+        help="How the observation is cut to max_obs_length: keep its "
+        "beginning, or pack its most relevant nodes for the intent",
+    )
     parser.add_argument(
         "--model_endpoint",
-        help="huggingface model endpoint",
+        help="huggingface model endpoint, several TGI replicas of the "
+        "model can be given separated by commas",
         type=str,
         default="",
     )
+    parser.add_argument(
+        "--requests_per_minute",
+        type=int,
+        default=0,
+        help="Requests per minute to the model shared by the concurrent "
+        "episodes, 0 for no limit",
+    )
+    parser.add_argument(
+        "--tokens_per_minute",
+        type=int,
+        default=0,
+        help="Tokens per minute to the model shared by the concurrent "
+        "episodes, 0 for no limit",
+    )
+    parser.add_argument(
+        "--llm_cache_path",
+        type=str,
+        default="",
+        help="SQLite file that caches the responses of the agent's model "
+        "at temperature 0, off when empty",
+    )
+    parser.add_argument(
+        "--llm_cache_max_mb",
+        type=float,
+        default=512,
+        help="Size of the cached responses above which the least recently "
+        "used ones are evicted",
+    )
     return parser
 
 def _add_example_config(parser: ArgumentParser) -> ArgumentParser:
     parser.add_argument("--test_start_idx", type=int, default=0)
     parser.add_argument("--test_end_idx", type=int, default=1000)
+    parser.add_argument(
+        "--task_catalog",
+        type=str,
+        default="",
+        help="Look the tasks up by id in this catalog, e.g., "
+        "config_files/test.catalog, instead of parsing their config files",
+    )
     return parser
 
 def _add_logging_config(parser: ArgumentParser) -> ArgumentParser:
@@ -14,11 +14,13 @@ logger = getLogger("logger")
 
 ActionSetTag = Literal["id_accessibility_tree", "playwright"]
 ObservationType = Literal["accessibility_tree", "html", "image"]
+ScreenshotFormat = Literal["png", "jpeg", "webp"]
 
 AgentType = Literal["prompt", "teacher_forcing"]
 
 Provider = Literal["openai", "huggingface"]
 Mode = Literal["chat", "generation"]
+ObsTruncation = Literal["head", "structure"]
 
 
 @dataclass(frozen=True)
@@ -39,9 +41,20 @@ class WebArenaConfig:
     viewport_width: int = 1280
     viewport_height: int = 720
     render_screenshot: bool = True
+    screenshot_format: ScreenshotFormat = "png"
+    render_screenshot_files: bool = False
     save_trace_enabled: bool = False
     sleep_after_execution: float = 2.0
+    settle_timeout: float = 0.0
     max_steps: int = 30
+    context_pool_size: int = 0
+    browser_recycle_after: int = 1
+    browser_recycle_memory_growth: float = 0.0
+    num_workers: int = 1
+    max_task_retries: int = 1
+    num_concurrent_episodes: int = 1
+    site_reset_command: str = ""
+    incremental_observation: bool = False
 
     @staticmethod
     def from_args(args: Namespace) -> WebArenaConfig:
@@ -53,16 +66,30 @@ class WebArenaConfig:
                 LMConfig.from_args(args),
                 ExampleConfig.from_args(args),
                 LoggingConfig.from_args(args),
-                args.render,
-                args.slow_mo,
-                args.action_set_tag,
-                args.observation_type,
-                args.current_viewport_only,
-                args.viewport_width,
-                args.viewport_height,
-                args.save_trace_enabled,
-                args.sleep_after_execution,
-                args.max_steps
+                render=args.render,
+                slow_mo=args.slow_mo,
+                action_set_tag=args.action_set_tag,
+                observation_type=args.observation_type,
+                current_viewport_only=args.current_viewport_only,
+                viewport_width=args.viewport_width,
+                viewport_height=args.viewport_height,
+                render_screenshot=args.render_screenshot,
+                screenshot_format=args.screenshot_format,
+                render_screenshot_files=args.render_screenshot_files,
+                save_trace_enabled=args.save_trace_enabled,
+                sleep_after_execution=args.sleep_after_execution,
+                settle_timeout=args.settle_timeout,
+                max_steps=args.max_steps,
+                context_pool_size=args.context_pool_size,
+                browser_recycle_after=args.browser_recycle_after,
+                browser_recycle_memory_growth=(
+                    args.browser_recycle_memory_growth
+                ),
+                num_workers=args.num_workers,
+                max_task_retries=args.max_task_retries,
+                num_concurrent_episodes=args.num_concurrent_episodes,
+                site_reset_command=args.site_reset_command,
+                incremental_observation=args.incremental_observation
             )
 
     @staticmethod
@@ -104,6 +131,7 @@ class AgentConfig:
     instruction_path: str = "agents/prompts/state_action_agent.json"
     parsing_failure_th: int = 3
     repeating_action_failure_th: int = 3
+    stream_action: bool = False
 
     @staticmethod
     def from_args(args: Namespace) -> AgentConfig:
@@ -111,7 +139,8 @@ class AgentConfig:
             args.agent_type,
             args.instruction_path,
             args.parsing_failure_th,
-            args.repeating_action_failure_th
+            args.repeating_action_failure_th,
+            args.stream_action
         )
 
 @dataclass(frozen=True)
@@ -129,7 +158,12 @@ class LMConfig:
     stop_token: str | None = None
     max_retry: int = 1
     max_obs_length: int = 1920
+    obs_truncation: ObsTruncation = "head"
     model_endpoint: str = ""
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    cache_path: str = ""
+    cache_max_mb: float = 512
 
     @staticmethod
     def from_args(args: Namespace) -> LMConfig:
@@ -144,7 +178,12 @@ class LMConfig:
             args.stop_token,
             args.max_retry,
             args.max_obs_length,
-            args.model_endpoint
+            args.obs_truncation,
+            args.model_endpoint,
+            args.requests_per_minute,
+            args.tokens_per_minute,
+            args.llm_cache_path,
+            args.llm_cache_max_mb
         )
 
 @dataclass(frozen=True)
@@ -154,12 +193,16 @@ class ExampleConfig:
     """
     test_start_idx: int = 0
     test_end_idx: int = 1000
+    # the compiled catalog the tasks are looked up in, by id, instead of
+    # parsing their config files
+    task_catalog: str = ""
 
     @staticmethod
     def from_args(args: Namespace) -> ExampleConfig:
         return ExampleConfig(
             args.test_start_idx,
-            args.test_end_idx
+            args.test_end_idx,
+            args.task_catalog
         )
 
 @dataclass(frozen=True)
@@ -0,0 +1,199 @@
+"""
+the state of every task of a result dir, in a SQLite file that the runs
+on this dir share
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, Literal
+
+LEDGER_FILE = "tasks.sqlite"
+
+TaskStatus = Literal["pending", "running", "done", "errored", "rate_limited"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    config_file TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner INTEGER,
+    score REAL,
+    error TEXT NOT NULL DEFAULT '',
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status);
+"""
+
+RATE_LIMIT_ERRORS = ("RateLimitError", "RateLimitExceededError")
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class TaskLedger:
+    """
+    a task is pending until a run claims it, then running until it is done,
+    errored or rate limited, with the number of attempts over all the runs
+    a claim is a single conditional update, so two runs never take the same
+    task, and a task that a dead process left running can be claimed again
+    the commits are synchronous in WAL mode, a crash loses no finished task
+    """
+
+    def __init__(self, result_dir: str | Path) -> None:
+        self.path = Path(result_dir) / LEDGER_FILE
+        self.connection: sqlite3.Connection | None = None
+        self.pid = 0
+
+    def connect(self) -> sqlite3.Connection:
+        # a connection inherited from the parent process is not used
+        if self.connection is None or self.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, timeout=30)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=FULL")
+            self.connection.executescript(SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def __len__(self) -> int:
+        (count,) = (
+            self.connect().execute("SELECT COUNT(*) FROM tasks").fetchone()
+        )
+        return int(count)
+
+    def add(
+        self, config_files: Iterable[str], status: TaskStatus = "pending"
+    ) -> None:
+        """
+        the tasks that are already in the ledger keep their status
+        """
+        connection = self.connect()
+        now = time.time()
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO tasks (config_file, status, updated_at)"
+                " VALUES (?, ?, ?)",
+                [(config_file, status, now) for config_file in config_files],
+            )
+
+    def unfinished(self, config_files: list[str]) -> list[str]:
+        done = {
+            config_file
+            for (config_file,) in self.connect().execute(
+                "SELECT config_file FROM tasks WHERE status = 'done'"
+            )
+        }
+        return [c for c in config_files if c not in done]
+
+    def claim(self, config_file: str) -> bool:
+        """
+        marks the task as running for this process, false if it is done or
+        another live process is running it
+        """
+        connection = self.connect()
+        with connection:
+            claimed = connection.execute(
+                "UPDATE tasks SET status = 'running', owner = ?,"
+                " attempts = attempts + 1, updated_at = ?"
+                " WHERE config_file = ?"
+                " AND status NOT IN ('running', 'done')",
+                (os.getpid(), time.time(), config_file),
+            ).rowcount
+            if claimed:
+                return True
+            row = connection.execute(
+                "SELECT status, owner FROM tasks WHERE config_file = ?",
+                (config_file,),
+            ).fetchone()
+            if row is None:
+                connection.execute(
+                    "INSERT INTO tasks"
+                    " (config_file, status, attempts, owner, updated_at)"
+                    " VALUES (?, 'running', 1, ?, ?)",
+                    (config_file, os.getpid(), time.time()),
+                )
+                return True
+            status, owner = row
+            if status == "done" or owner == os.getpid() or is_alive(owner):
+                return False
+            # taken over only if no other process did in the meantime
+            return bool(
+                connection.execute(
+                    "UPDATE tasks SET owner = ?, attempts = attempts + 1,"
+                    " updated_at = ?"
+                    " WHERE config_file = ? AND status = 'running'"
+                    " AND owner = ?",
+                    (os.getpid(), time.time(), config_file, owner),
+                ).rowcount
+            )
+
+    def finish(
+        self, config_file: str, score: float | None, error: str = ""
+    ) -> TaskStatus:
+        """
+        a task without a score errored, or was rate limited if the model
+        calls gave up on the rate limits
+        """
+        status: TaskStatus
+        if score is not None:
+            status = "done"
+        elif any(name in error for name in RATE_LIMIT_ERRORS):
+            status = "rate_limited"
+        else:
+            status = "errored"
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                "UPDATE tasks SET status = ?, owner = NULL, score = ?,"
+                " error = ?, updated_at = ? WHERE config_file = ?",
+                (status, score, error, time.time(), config_file),
+            )
+        return status
+
+    def reset(self, config_files: Iterable[str]) -> None:
+        """
+        the tasks run again, e.g., after their result turned out wrong
+        """
+        connection = self.connect()
+        with connection:
+            connection.executemany(
+                "UPDATE tasks SET status = 'pending', owner = NULL,"
+                " updated_at = ? WHERE config_file = ?",
+                [(time.time(), config_file) for config_file in config_files],
+            )
+
+    def attempts(self, config_file: str) -> int:
+        row = (
+            self.connect()
+            .execute(
+                "SELECT attempts FROM tasks WHERE config_file = ?",
+                (config_file,),
+            )
+            .fetchone()
+        )
+        return int(row[0]) if row else 0
+
+    def counts(self) -> Counter[str]:
+        return Counter(
+            dict(
+                self.connect()
+                .execute("SELECT status, COUNT(*) FROM tasks GROUP BY status")
+                .fetchall()
+            )
+        )
+
+    def close(self) -> None:
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
@@ -1,15 +1,21 @@
-import json
 import os
 import tempfile
 import subprocess
+from pathlib import Path
 from typing import Any
 
+from playwright.async_api import Browser
+
 from agent import Agent
 from browser_env import (
+    AsyncScriptBrowserEnv,
     ScriptBrowserEnv,
     Action,
+    TaskConfig,
     Trajectory,
-    create_stop_action
+    create_stop_action,
+    load_task_config,
+    open_catalog
 )
 from browser_env.auto_login import get_site_comb_from_filepath
 
@@ -29,39 +35,87 @@ def create_env_from_config(config: WebArenaConfig) -> ScriptBrowserEnv:
         },
         save_trace_enabled=config.save_trace_enabled,
         sleep_after_execution=config.sleep_after_execution,
+        settle_timeout=config.settle_timeout,
+        incremental_observation=config.incremental_observation,
+        capture_screenshot=config.render_screenshot,
+        screenshot_format=config.screenshot_format,
+        # the renderer embeds the encoded screenshot as is
+        decode_screenshot=False,
+        context_pool_size=config.context_pool_size,
+        browser_recycle_after=config.browser_recycle_after,
+        browser_recycle_memory_growth=config.browser_recycle_memory_growth,
     )
     return env
 
 
-def get_intent_and_task_id(config_file: str) -> tuple[str, str]:
-    with open(config_file) as f:
-        _c = json.load(f)
-        intent: str = _c["intent"]
-        task_id = _c["task_id"]
-        # automatically login
-        if _c["storage_state"]:
-            cookie_file_name = os.path.basename(_c["storage_state"])
-            comb = get_site_comb_from_filepath(cookie_file_name)
-            temp_dir = tempfile.mkdtemp()
-            # subprocess to renew the cookie
-            subprocess.run(
-                [
-                    "python",
-                    "-m",
-                    "browser_env.auto_login",
-                    "--auth_folder",
-                    temp_dir,
-                    "--site_list",
-                    *comb,
-                ]
-            )
-            _c["storage_state"] = f"{temp_dir}/{cookie_file_name}"
-            assert os.path.exists(_c["storage_state"])
-            # update the config file
-            config_file = f"{temp_dir}/{os.path.basename(config_file)}"
-            with open(config_file, "w") as f:
-                json.dump(_c, f)
-    return intent, task_id
+def create_async_env_from_config(
+    config: WebArenaConfig,
+    browser: Browser | None = None
+) -> AsyncScriptBrowserEnv:
+    """
+    async counterpart of `create_env_from_config`, the environments of the
+    concurrent episodes share `browser`
+    """
+    env = AsyncScriptBrowserEnv(
+        headless=not config.render,
+        slow_mo=config.slow_mo,
+        observation_type=config.observation_type,
+        current_viewport_only=config.current_viewport_only,
+        viewport_size={
+            "width": config.viewport_width,
+            "height": config.viewport_height,
+        },
+        save_trace_enabled=config.save_trace_enabled,
+        sleep_after_execution=config.sleep_after_execution,
+        settle_timeout=config.settle_timeout,
+        incremental_observation=config.incremental_observation,
+        capture_screenshot=config.render_screenshot,
+        screenshot_format=config.screenshot_format,
+        decode_screenshot=False,
+        browser=browser
+    )
+    return env
+
+
+def load_task(config: WebArenaConfig, config_file: str) -> TaskConfig:
+    """
+    the config of a task, looked up by the id in its file name in the task
+    catalog if there is one, parsed from the file otherwise
+    """
+    if config.example.task_catalog:
+        catalog = open_catalog(config.example.task_catalog)
+        return catalog.get(int(Path(config_file).stem))
+    return load_task_config(config_file)
+
+
+def get_intent_and_task_id(
+    task_config: TaskConfig
+) -> tuple[str, int, TaskConfig]:
+    """
+    Returns the intent, the task id and the config to use, which has
+    renewed cookies if the task needs to be logged in
+    """
+    # automatically login
+    if task_config.storage_state:
+        cookie_file_name = os.path.basename(task_config.storage_state)
+        comb = get_site_comb_from_filepath(cookie_file_name)
+        temp_dir = tempfile.mkdtemp()
+        # subprocess to renew the cookie
+        subprocess.run(
+            [
+                "python",
+                "-m",
+                "browser_env.auto_login",
+                "--auth_folder",
+                temp_dir,
+                "--site_list",
+                *comb,
+            ]
+        )
+        storage_state = f"{temp_dir}/{cookie_file_name}"
+        assert os.path.exists(storage_state)
+        task_config = task_config.with_storage_state(storage_state)
+    return task_config.intent, task_config.task_id, task_config
 
 
 def get_next_action(
@@ -93,4 +147,34 @@ def get_next_action(
         except ValueError as e:
             action = create_stop_action(f"ERROR: {str(e)}")
 
-    return action
\ No newline at end of file
+    return action
+
+
+async def aget_next_action(
+    config: WebArenaConfig,
+    trajectory: Trajectory,
+    agent: Agent,
+    intent: str,
+    meta_data: dict[str, Any]
+) -> Action:
+    """
+    async counterpart of `get_next_action`
+    """
+    action: Action
+    if (stop_info := early_stop(
+        trajectory,
+        config.max_steps,
+        config.agent.parsing_failure_th,
+        config.agent.repeating_action_failure_th
+    )) is not None:
+        action = create_stop_action(f"Early stop: {stop_info}")
+
+    else:
+        try:
+            action = await agent.anext_action(
+                trajectory, intent, meta_data=meta_data
+            )
+        except ValueError as e:
+            action = create_stop_action(f"ERROR: {str(e)}")
+
+    return action
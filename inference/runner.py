@@ -0,0 +1,665 @@
+"""
+runs the tasks, either one after another in the current process, on a
+pool of worker processes that each own a browser environment, or as
+concurrent async episodes that share one browser
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing as mp
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+from typing import Any, Callable
+
+from playwright.async_api import Browser, async_playwright
+
+from agent import Agent, PromptAgent, construct_agent_from_config
+from browser_env import (
+    ActionTypes,
+    AsyncScriptBrowserEnv,
+    ScriptBrowserEnv,
+    StateInfo,
+    Trajectory,
+    create_stop_action,
+)
+from browser_env.helper_functions import (
+    RenderHelper,
+    get_action_description,
+)
+from browser_env.trajectory_store import (
+    TrajectoryRecorder,
+    TrajectoryStore,
+)
+from evaluation_harness import evaluator_router
+from llms import LLMGateway
+
+from .config import WebArenaConfig
+from .ledger import TaskLedger
+from .pipes import (
+    aget_next_action,
+    create_async_env_from_config,
+    create_env_from_config,
+    get_intent_and_task_id,
+    get_next_action,
+    load_task,
+)
+from .scheduler import SiteScheduler, make_reset_hook
+from .utils import log_error_file
+
+logger = getLogger("logger")
+
+RESULTS_FILE = "results.jsonl"
+
+
+def run_task(
+    config: WebArenaConfig,
+    agent: Agent,
+    env: ScriptBrowserEnv,
+    config_file: str,
+) -> float:
+    """
+    originally the body of the task loop in `test` in run.py
+    runs the agent on a single task, renders it and returns the score
+    """
+    result_dir = config.logging.result_dir
+    # parsed once, the components below share it
+    task_config = load_task(config, config_file)
+    render_helper = RenderHelper(
+        task_config,
+        result_dir,
+        config.action_set_tag,
+        config.render_screenshot_files,
+    )
+    try:
+        # get intent
+        intent, task_id, task_config = get_intent_and_task_id(task_config)
+        recorder = TrajectoryRecorder(
+            TrajectoryStore(result_dir), task_id, config_file
+        )
+
+        logger.info(f"[Config file]: {config_file}")
+        logger.info(f"[Intent]: {intent}")
+
+        # reset
+        agent.reset(task_config)
+        start = time.perf_counter()
+        obs, info = env.reset(options={"config_file": task_config})
+        env_seconds = time.perf_counter() - start
+        logger.info("reset")
+
+        # init state_info, trajectory
+        state_info: StateInfo = {"observation": obs, "info": info}
+        trajectory: Trajectory = [state_info]
+
+        # init metadata
+        meta_data: dict[str, Any] = {"action_history": ["None"]}
+
+        while True:
+            # get new action
+            start = time.perf_counter()
+            action = get_next_action(
+                config, trajectory, agent, intent, meta_data
+            )
+            llm_seconds = time.perf_counter() - start
+            logger.info("got new action")
+
+            # update trajectory
+            trajectory.append(action)
+
+            # get description about new action
+            action_str = get_action_description(
+                action,
+                state_info["info"]["observation_metadata"],
+                action_set_tag=config.action_set_tag,
+                prompt_constructor=agent.prompt_constructor
+                if isinstance(agent, PromptAgent)
+                else None,
+            )
+            logger.info("got description about new action")
+
+            screenshot = render_helper.render(
+                action, state_info, meta_data, config.render_screenshot
+            )
+            recorder.record(
+                action,
+                action_str,
+                state_info,
+                meta_data,
+                llm_seconds,
+                env_seconds,
+                screenshot,
+            )
+            meta_data["action_history"].append(action_str)
+
+            if action["action_type"] == ActionTypes.STOP:
+                break
+
+            # get new env state
+            start = time.perf_counter()
+            obs, _, terminated, _, info = env.step(action)
+            env_seconds = time.perf_counter() - start
+
+            # update state_info, trajectory
+            state_info = {"observation": obs, "info": info}
+            trajectory.append(state_info)
+
+            if terminated:
+                # add a action placeholder
+                trajectory.append(create_stop_action(""))
+                break
+
+        evaluator = evaluator_router(task_config)
+        score = evaluator(
+            trajectory=trajectory,
+            config_file=task_config,
+            page=env.page,
+            client=env.get_page_client(env.page),
+        )
+        recorder.finish(score)
+
+        if score == 1:
+            logger.info(f"[Result] (PASS) {config_file}")
+        else:
+            logger.info(f"[Result] (FAIL) {config_file}")
+        if isinstance(agent, PromptAgent) and agent.stream_action:
+            logger.info(f"[Stream] {agent.stream_stats}")
+        if isinstance(agent, PromptAgent) and agent.cache is not None:
+            logger.info(f"[Cache] {agent.cache.stats}")
+
+        if config.save_trace_enabled:
+            env.save_trace(Path(result_dir) / "traces" / f"{task_id}.zip")
+        return score
+
+    finally:
+        render_helper.close()
+
+
+@dataclass
+class TaskResult:
+    """
+    one line of the aggregated results file
+    """
+
+    config_file: str
+    score: float | None
+    attempts: int
+    worker: int
+    duration: float
+    error: str = ""
+
+
+def create_scheduler(
+    config: WebArenaConfig, config_files: list[str]
+) -> SiteScheduler:
+    reset_hook = (
+        make_reset_hook(config.site_reset_command)
+        if config.site_reset_command
+        else None
+    )
+    return SiteScheduler(
+        config_files, reset_hook, lambda c: load_task(config, c)
+    )
+
+
+def append_result(results_path: Path, result: TaskResult) -> None:
+    with open(results_path, "a") as f:
+        f.write(json.dumps(asdict(result)) + "\n")
+
+
+def _serve(
+    worker_id: int,
+    conn: Connection,
+    run: Callable[[str], float],
+    result_dir: str,
+) -> None:
+    """
+    runs the tasks that the parent hands out through the pipe until it
+    sends None, and reports each of them back; a pipe, unlike a queue, does
+    not buffer the messages in a thread that dies with the process
+    """
+    conn.send(("ready", None, None, ""))
+    while (config_file := conn.recv()) is not None:
+        start = time.perf_counter()
+        try:
+            score = run(config_file)
+            error = ""
+        except Exception as e:
+            score = None
+            error = f"{repr(e)}\n{traceback.format_exc()}"
+            log_error_file(result_dir, config_file, e)
+        duration = time.perf_counter() - start
+        conn.send(("done", config_file, score, error))
+        logger.info(f"[Worker {worker_id}] {config_file} in {duration:.1f}s")
+
+
+def _worker(worker_id: int, config: WebArenaConfig, conn: Connection) -> None:
+    """
+    a worker process with its own agent and browser environment
+    """
+    agent = construct_agent_from_config(config)
+    env = create_env_from_config(config)
+    try:
+        _serve(
+            worker_id,
+            conn,
+            lambda config_file: run_task(config, agent, env, config_file),
+            config.logging.result_dir,
+        )
+    finally:
+        env.close()
+        agent.close()
+
+
+def run_parallel(
+    config: WebArenaConfig,
+    config_files: list[str],
+    num_workers: int,
+    max_retries: int = 1,
+    worker: Callable[[int, WebArenaConfig, Connection], None] = _worker,
+) -> list[TaskResult]:
+    """
+    runs the tasks on `num_workers` processes, the parent hands the next
+    task to the first idle worker, so slow tasks do not hold back the
+    others, and knows which task each worker runs before the worker gets
+    it, so the task of a worker that dies at any point is not lost
+    the failed tasks and the tasks of crashed workers are queued again up
+    to `max_retries` times
+    the tasks are queued once the `SiteScheduler` lets them run next to
+    the running ones
+    every finished task is appended to `results.jsonl` in the result dir
+    the parent claims the tasks in the `TaskLedger` and records how they end
+    """
+    # playwright is not fork-safe
+    ctx = mp.get_context("spawn")
+    results_path = Path(config.logging.result_dir) / RESULTS_FILE
+    scheduler = create_scheduler(config, config_files)
+    ledger = TaskLedger(config.logging.result_dir)
+
+    attempts = {config_file: 0 for config_file in config_files}
+    started: dict[str, float] = {}
+    in_flight: dict[int, str] = {}
+    ready: deque[str] = deque()
+    idle: list[int] = []
+    results: list[TaskResult] = []
+
+    def submit_ready() -> None:
+        while len(scheduler.running) < num_workers and (
+            config_file := scheduler.next_task()
+        ):
+            if not ledger.claim(config_file):
+                logger.info(f"[Skip] {config_file} is run by another process")
+                scheduler.release(config_file)
+                continue
+            attempts[config_file] += 1
+            ready.append(config_file)
+
+    def dispatch() -> None:
+        while ready and idle:
+            worker_id = idle.pop()
+            config_file = ready.popleft()
+            # recorded first, the worker may die as soon as it has the task
+            in_flight[worker_id] = config_file
+            started[config_file] = time.perf_counter()
+            try:
+                workers[worker_id][1].send(config_file)
+            except OSError:
+                # the worker is dead, its task is handled with it
+                pass
+
+    def finish(result: TaskResult) -> None:
+        results.append(result)
+        append_result(results_path, result)
+
+    def retry_or_finish(
+        config_file: str, worker_id: int, score: float | None, error: str
+    ) -> None:
+        start = started.pop(config_file, time.perf_counter())
+        duration = time.perf_counter() - start
+        ledger.finish(config_file, score, error)
+        scheduler.finish(config_file)
+        if score is None and attempts[config_file] <= max_retries:
+            logger.info(f"[Retry] {config_file}: {error.splitlines()[0]}")
+            scheduler.add(config_file)
+            return
+        finish(
+            TaskResult(
+                config_file,
+                score,
+                attempts[config_file],
+                worker_id,
+                duration,
+                error,
+            )
+        )
+
+    def handle(worker_id: int, conn: Connection) -> None:
+        kind, config_file, score, error = conn.recv()
+        if kind == "done":
+            in_flight.pop(worker_id, None)
+            retry_or_finish(config_file, worker_id, score, error)
+        idle.append(worker_id)
+
+    def spawn(worker_id: int) -> tuple[Any, Connection]:
+        conn, child_conn = ctx.Pipe()
+        process = ctx.Process(
+            target=worker,
+            args=(worker_id, config, child_conn),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return process, conn
+
+    num_workers = max(1, min(num_workers, len(config_files)))
+    submit_ready()
+    workers = {worker_id: spawn(worker_id) for worker_id in range(num_workers)}
+    dispatch()
+
+    while not scheduler.finished:
+        readers: dict[Any, int] = {
+            reader: worker_id for worker_id, (_, reader) in workers.items()
+        }
+        for reader in wait(list(readers), timeout=1):
+            try:
+                handle(readers[reader], reader)  # type: ignore[arg-type]
+            except EOFError:
+                # the worker exited, see below
+                pass
+
+        # a worker that crashed in the middle of a task is replaced and the
+        # task is tried again, one that could not even start is not
+        for worker_id, (process, reader) in list(workers.items()):
+            if process.is_alive():
+                continue
+            try:
+                while reader.poll():
+                    handle(worker_id, reader)
+            except EOFError:
+                pass
+            del workers[worker_id]
+            if worker_id in idle:
+                idle.remove(worker_id)
+            if config_file := in_flight.pop(worker_id, ""):
+                retry_or_finish(
+                    config_file,
+                    worker_id,
+                    None,
+                    f"worker exited with code {process.exitcode}",
+                )
+                workers[worker_id] = spawn(worker_id)
+        if not workers and not scheduler.finished:
+            raise RuntimeError("All the workers exited before the end")
+        submit_ready()
+        dispatch()
+
+    for _, conn in workers.values():
+        try:
+            conn.send(None)
+        except OSError:
+            pass
+    for process, _ in workers.values():
+        process.join(timeout=60)
+        if process.is_alive():
+            process.terminate()
+    ledger.close()
+
+    scores = [r.score for r in results if r.score is not None]
+    if scores:
+        logger.info(f"Average score: {sum(scores) / len(scores)}")
+    return results
+
+
+async def arun_task(
+    config: WebArenaConfig,
+    agent: Agent,
+    env: AsyncScriptBrowserEnv,
+    config_file: str,
+) -> float:
+    """
+    async counterpart of `run_task`, the blocking parts, i.e., the model
+    calls, the cookie renewal and the judge calls of the evaluation, run
+    in threads so that the other episodes go on meanwhile
+    """
+    result_dir = config.logging.result_dir
+    task_config = load_task(config, config_file)
+    render_helper = RenderHelper(
+        task_config,
+        result_dir,
+        config.action_set_tag,
+        config.render_screenshot_files,
+    )
+    try:
+        intent, task_id, task_config = await asyncio.to_thread(
+            get_intent_and_task_id, task_config
+        )
+        recorder = TrajectoryRecorder(
+            TrajectoryStore(result_dir), task_id, config_file
+        )
+
+        logger.info(f"[Config file]: {config_file}")
+        logger.info(f"[Intent]: {intent}")
+
+        agent.reset(task_config)
+        start = time.perf_counter()
+        obs, info = await env.areset(options={"config_file": task_config})
+        env_seconds = time.perf_counter() - start
+
+        state_info: StateInfo = {"observation": obs, "info": info}
+        trajectory: Trajectory = [state_info]
+        meta_data: dict[str, Any] = {"action_history": ["None"]}
+
+        while True:
+            start = time.perf_counter()
+            action = await aget_next_action(
+                config, trajectory, agent, intent, meta_data
+            )
+            llm_seconds = time.perf_counter() - start
+            trajectory.append(action)
+
+            action_str = get_action_description(
+                action,
+                state_info["info"]["observation_metadata"],
+                action_set_tag=config.action_set_tag,
+                prompt_constructor=agent.prompt_constructor
+                if isinstance(agent, PromptAgent)
+                else None,
+            )
+
+            screenshot = render_helper.render(
+                action, state_info, meta_data, config.render_screenshot
+            )
+            recorder.record(
+                action,
+                action_str,
+                state_info,
+                meta_data,
+                llm_seconds,
+                env_seconds,
+                screenshot,
+            )
+            meta_data["action_history"].append(action_str)
+
+            if action["action_type"] == ActionTypes.STOP:
+                break
+
+            start = time.perf_counter()
+            obs, _, terminated, _, info = await env.astep(action)
+            env_seconds = time.perf_counter() - start
+
+            state_info = {"observation": obs, "info": info}
+            trajectory.append(state_info)
+
+            if terminated:
+                trajectory.append(create_stop_action(""))
+                break
+
+        if config.save_trace_enabled:
+            await env.asave_trace(
+                Path(result_dir) / "traces" / f"{task_id}.zip"
+            )
+
+        # on the page of the episode, while its context is still open
+        evaluator = evaluator_router(task_config)
+        score = await evaluator.acall(
+            trajectory=trajectory,
+            config_file=task_config,
+            page=env.page,
+            client=env.get_page_client(env.page),
+        )
+        await asyncio.to_thread(recorder.finish, score)
+
+        if score == 1:
+            logger.info(f"[Result] (PASS) {config_file}")
+        else:
+            logger.info(f"[Result] (FAIL) {config_file}")
+        if isinstance(agent, PromptAgent) and agent.stream_action:
+            logger.info(f"[Stream] {agent.stream_stats}")
+        if isinstance(agent, PromptAgent) and agent.cache is not None:
+            logger.info(f"[Cache] {agent.cache.stats}")
+        return score
+
+    finally:
+        render_helper.close()
+
+
+def create_gateway(
+    config: WebArenaConfig, agents: list[Agent]
+) -> LLMGateway | None:
+    """
+    one gateway for the model calls of all the episodes, so that they
+    share the rate limits and the connections
+    """
+    prompt_agents = [a for a in agents if isinstance(a, PromptAgent)]
+    if not prompt_agents:
+        return None
+    agent = prompt_agents[0]
+    gateway = LLMGateway(
+        agent.lm_config,
+        agent.prompt_constructor.tokenizer,
+        requests_per_minute=config.lm.requests_per_minute,
+        tokens_per_minute=config.lm.tokens_per_minute,
+    )
+    for agent in prompt_agents:
+        agent.gateway = gateway
+    return gateway
+
+
+def run_concurrent(
+    config: WebArenaConfig,
+    config_files: list[str],
+    num_episodes: int,
+    max_retries: int = 1,
+) -> list[TaskResult]:
+    """
+    runs the tasks as `num_episodes` concurrent episodes in this process,
+    each with its own agent and browser context in one shared browser
+    most of the time of a step is spent waiting for the model, meanwhile
+    the other episodes act in the browser
+    the results are appended to `results.jsonl` like `run_parallel`
+    """
+    return asyncio.run(
+        _run_concurrent(config, config_files, num_episodes, max_retries)
+    )
+
+
+async def _run_concurrent(
+    config: WebArenaConfig,
+    config_files: list[str],
+    num_episodes: int,
+    max_retries: int,
+) -> list[TaskResult]:
+    # the threads mostly wait for the model, one per episode and a few for
+    # the evaluations
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=2 * num_episodes)
+    )
+    results_path = Path(config.logging.result_dir) / RESULTS_FILE
+    scheduler = create_scheduler(config, config_files)
+    ledger = TaskLedger(config.logging.result_dir)
+    # notified whenever a task releases its sites
+    released = asyncio.Condition()
+    attempts = {config_file: 0 for config_file in config_files}
+    results: list[TaskResult] = []
+
+    async def claim() -> str | None:
+        async with released:
+            while not scheduler.finished:
+                if config_file := scheduler.next_task():
+                    if ledger.claim(config_file):
+                        return config_file
+                    logger.info(
+                        f"[Skip] {config_file} is run by another process"
+                    )
+                    scheduler.release(config_file)
+                    continue
+                await released.wait()
+        return None
+
+    num_episodes = max(1, min(num_episodes, len(config_files)))
+    agents = [construct_agent_from_config(config) for _ in range(num_episodes)]
+    gateway = create_gateway(config, agents)
+
+    async def episodes(slot: int, browser: Browser) -> None:
+        agent = agents[slot]
+        env = create_async_env_from_config(config, browser)
+        try:
+            while config_file := await claim():
+                attempts[config_file] += 1
+                start = time.perf_counter()
+                try:
+                    score = await arun_task(config, agent, env, config_file)
+                    error = ""
+                except Exception as e:
+                    score = None
+                    error = f"{repr(e)}\n{traceback.format_exc()}"
+                    log_error_file(config.logging.result_dir, config_file, e)
+                retry = score is None and attempts[config_file] <= max_retries
+                ledger.finish(config_file, score, error)
+                await scheduler.afinish(config_file)
+                async with released:
+                    if retry:
+                        logger.info(
+                            f"[Retry] {config_file}: {error.splitlines()[0]}"
+                        )
+                        scheduler.add(config_file)
+                    released.notify_all()
+                if retry:
+                    continue
+                result = TaskResult(
+                    config_file,
+                    score,
+                    attempts[config_file],
+                    slot,
+                    time.perf_counter() - start,
+                    error,
+                )
+                results.append(result)
+                append_result(results_path, result)
+        finally:
+            await env.aclose()
+
+    try:
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(
+                headless=not config.render, slow_mo=config.slow_mo
+            )
+            await asyncio.gather(
+                *(episodes(slot, browser) for slot in range(num_episodes))
+            )
+            await browser.close()
+    finally:
+        ledger.close()
+        if gateway is not None:
+            await gateway.aclose()
+
+    scores = [r.score for r in results if r.score is not None]
+    if scores:
+        logger.info(f"Average score: {sum(scores) / len(scores)}")
+    return results
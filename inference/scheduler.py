@@ -0,0 +1,164 @@
+"""
+decides which tasks can run at the same time on the shared websites
+"""
+from __future__ import annotations
+
+import asyncio
+import subprocess
+from collections import Counter
+from dataclasses import dataclass
+from logging import getLogger
+from typing import Callable
+
+from browser_env import TaskConfig, load_task_config
+
+logger = getLogger("logger")
+
+ResetHook = Callable[[str], None]
+TaskLoader = Callable[[str], TaskConfig]
+
+# the evaluation of these tasks looks at the state of the website, which
+# means that the task changes it
+MUTATING_EVAL_TYPES = ("program_html",)
+
+
+@dataclass(frozen=True)
+class TaskSites:
+    """
+    the websites a task works on and whether it changes them
+    """
+
+    config_file: str
+    sites: tuple[str, ...]
+    mutates: bool
+    require_reset: bool
+
+    @staticmethod
+    def from_config_file(
+        config_file: str, load: TaskLoader = load_task_config
+    ) -> TaskSites:
+        task_config = load(config_file)
+        eval_types = task_config.eval.get("eval_types", ())
+        mutates = task_config.require_reset or any(
+            eval_type in MUTATING_EVAL_TYPES for eval_type in eval_types
+        )
+        return TaskSites(
+            config_file, task_config.sites, mutates, task_config.require_reset
+        )
+
+
+def make_reset_hook(command: str) -> ResetHook:
+    """
+    `command` is a shell command, `{site}` is replaced by the site to reset
+    """
+
+    def reset(site: str) -> None:
+        logger.info(f"[Reset] {site}")
+        subprocess.run(command.format(site=site), shell=True, check=True)
+
+    return reset
+
+
+class SiteScheduler:
+    """
+    hands out the tasks so that the running tasks do not interfere
+    the read-only tasks share the sites, a mutating task has its sites to
+    itself, and only once the pending read-only tasks of these sites are
+    done, so that they see the sites in their initial state
+    the sites of a task with `require_reset` are reset before they are
+    handed out again
+    the configs of the tasks are read with `load`, e.g., from a catalog
+    """
+
+    def __init__(
+        self,
+        config_files: list[str],
+        reset_hook: ResetHook | None = None,
+        load: TaskLoader = load_task_config,
+    ) -> None:
+        self.load = load
+        self.pending = [
+            TaskSites.from_config_file(config_file, load)
+            for config_file in config_files
+        ]
+        self.running: dict[str, TaskSites] = {}
+        self.readers: Counter[str] = Counter()
+        self.writers: set[str] = set()
+        self.reset_hook = reset_hook
+
+    def add(self, config_file: str) -> None:
+        """
+        queues a task again, e.g., to retry it
+        """
+        self.pending.append(TaskSites.from_config_file(config_file, self.load))
+
+    @property
+    def finished(self) -> bool:
+        return not self.pending and not self.running
+
+    def can_start(self, task: TaskSites) -> bool:
+        if any(site in self.writers for site in task.sites):
+            return False
+        if not task.mutates:
+            return True
+        if any(self.readers[site] for site in task.sites):
+            return False
+        # the read-only tasks of the sites go first
+        return not any(
+            not other.mutates and set(other.sites) & set(task.sites)
+            for other in self.pending
+        )
+
+    def next_task(self) -> str | None:
+        """
+        claims the sites of the first task that can start now, None if no
+        task can start until a running one finishes
+        """
+        for idx, task in enumerate(self.pending):
+            if self.can_start(task):
+                del self.pending[idx]
+                self.running[task.config_file] = task
+                if task.mutates:
+                    self.writers.update(task.sites)
+                else:
+                    self.readers.update(task.sites)
+                return task.config_file
+        return None
+
+    def sites_to_reset(self, config_file: str) -> tuple[str, ...]:
+        task = self.running[config_file]
+        if not task.require_reset:
+            return ()
+        if self.reset_hook is None:
+            logger.warning(
+                f"[Reset] no reset command, {task.sites} stay changed "
+                f"by {config_file}"
+            )
+            return ()
+        return task.sites
+
+    def release(self, config_file: str) -> None:
+        task = self.running.pop(config_file)
+        if task.mutates:
+            self.writers.difference_update(task.sites)
+        else:
+            self.readers.subtract(task.sites)
+
+    def finish(self, config_file: str) -> None:
+        """
+        resets the sites of the task if needed and releases them
+        """
+        for site in self.sites_to_reset(config_file):
+            assert self.reset_hook is not None
+            self.reset_hook(site)
+        self.release(config_file)
+
+    async def afinish(self, config_file: str) -> None:
+        """
+        `finish` without blocking the event loop, the sites are still
+        claimed by the task while they are reset
+        """
+        for site in self.sites_to_reset(config_file):
+            assert self.reset_hook is not None
+            await asyncio.to_thread(self.reset_hook, site)
+        self.release(config_file)
@@ -3,7 +3,10 @@ import os
 import glob
 from logging import getLogger
 
+from browser_env.trajectory_store import TrajectoryStore
+
 from .config import WebArenaConfig
+from .ledger import TaskLedger
 
 
 logger = getLogger("logger")
@@ -30,7 +33,23 @@ def create_test_file_list(st_idx: int, ed_idx: int, result_dir: str) -> list[str
     for i in range(st_idx, ed_idx):
         test_file_list.append(f"config_files/{i}.json")
     if "debug" not in result_dir:
-        test_file_list = _get_unfinished(test_file_list, result_dir)
+        ledger = TaskLedger(result_dir)
+        if len(ledger) == 0:
+            # a result dir from before the ledger
+            unfinished = set(_get_unfinished(test_file_list, result_dir))
+            ledger.add(
+                [c for c in test_file_list if c not in unfinished],
+                status="done"
+            )
+        ledger.add(test_file_list)
+        test_file_list = ledger.unfinished(test_file_list)
+        logger.info(f"[Ledger] {dict(ledger.counts())}")
+        ledger.close()
+    else:
+        # a debug dir reruns every task, even the done ones
+        ledger = TaskLedger(result_dir)
+        ledger.reset(test_file_list)
+        ledger.close()
 
     return test_file_list
 
@@ -63,11 +82,18 @@ def _log_file(result_dir: str, LOG_FILE_NAME: str) -> None:
 def _get_unfinished(config_files: list[str], result_dir: str) -> list[str]:
     """
     originally `get_unfinished` in run.py
+    the tasks in the index of the trajectory store are finished, the result
+    dirs from before the store are resumed from their renders
     """
-    result_files = glob.glob(f"{result_dir}/*.html")
-    task_ids = [
-        os.path.basename(f).split(".")[0].split("_")[1] for f in result_files
-    ]
+    store = TrajectoryStore(result_dir)
+    if store.exists():
+        task_ids = [str(task_id) for task_id in store.finished_task_ids()]
+    else:
+        result_files = glob.glob(f"{result_dir}/*.html")
+        task_ids = [
+            os.path.basename(f).split(".")[0].split("_")[1]
+            for f in result_files
+        ]
     unfinished_configs = []
     for config_file in config_files:
         task_id = os.path.basename(config_file).split(".")[0]
@@ -1,5 +1,10 @@
 """This module is adapt from https://github.com/zeno-ml/zeno-build"""
-from .providers.hf_utils import generate_from_huggingface_completion
+from .cache import PromptCache
+from .gateway import LLMGateway
+from .providers.hf_utils import (
+    agenerate_from_huggingface_completion,
+    generate_from_huggingface_completion,
+)
 from .providers.openai_utils import (
     generate_from_openai_chat_completion,
     generate_from_openai_completion,
@@ -10,5 +15,8 @@ __all__ = [
     "generate_from_openai_completion",
     "generate_from_openai_chat_completion",
     "generate_from_huggingface_completion",
+    "agenerate_from_huggingface_completion",
     "call_llm",
+    "LLMGateway",
+    "PromptCache",
 ]
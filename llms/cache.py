@@ -0,0 +1,206 @@
+"""A persistent cache of the responses to deterministic prompts.
+
+The entries are addressed by the hash of everything that determines the
+response: the provider, the model, the mode, the generation config and the
+prompt, without its outer whitespace. Only the calls at temperature 0 are
+cached, a sampled response is not worth replaying. The cache lives in a
+SQLite file that several processes can share, and the least recently used
+entries are evicted once it grows over its size limit.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from llms.lm_config import LMConfig
+
+APIInput = str | list[Any] | dict[str, Any]
+
+# the settings that do not change the response; the ones that shape the
+# prompt, like the truncation of the observation, are already in its text
+IGNORED_GEN_CONFIG_KEYS = (
+    "max_obs_length",
+    "obs_truncation",
+    "max_retry",
+    "model_endpoint",
+    "context_length",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    bypassed: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hits, {self.misses} misses "
+            f"({self.hit_rate:.0%} hit rate), {self.bypassed} bypassed, "
+            f"{self.evictions} evictions"
+        )
+
+
+def normalize_text(text: str) -> str:
+    # only the outer whitespace, the text in between reaches the model as is
+    return text.strip()
+
+
+def normalize_prompt(prompt: APIInput) -> Any:
+    """Drop the whitespace around the contents of the prompt."""
+    if isinstance(prompt, str):
+        return normalize_text(prompt)
+    if isinstance(prompt, dict):
+        return {
+            key: normalize_prompt(value) if key == "content" else value
+            for key, value in prompt.items()
+        }
+    return [normalize_prompt(message) for message in prompt]
+
+
+def is_deterministic(lm_config: LMConfig) -> bool:
+    return bool(lm_config.gen_config.get("temperature", 1.0) == 0)
+
+
+def cache_key(lm_config: LMConfig, prompt: APIInput) -> str:
+    gen_config = {
+        key: value
+        for key, value in lm_config.gen_config.items()
+        if key not in IGNORED_GEN_CONFIG_KEYS
+    }
+    content = json.dumps(
+        [
+            lm_config.provider,
+            lm_config.model,
+            lm_config.mode,
+            gen_config,
+            normalize_prompt(prompt),
+        ],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """Responses of the deterministic LLM calls, in a SQLite file.
+
+    Args:
+        path: The SQLite file, created if needed.
+        max_size_mb: The size of the responses above which the least
+            recently used ones are evicted.
+    """
+
+    def __init__(self, path: str | Path, max_size_mb: float = 512) -> None:
+        self.path = Path(path)
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+        self.connection: sqlite3.Connection | None = None
+        self.pid = 0
+
+    def connect(self) -> sqlite3.Connection:
+        # a connection inherited from the parent process is not used
+        if self.connection is None or self.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False
+            )
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript(SCHEMA)
+            self.pid = os.getpid()
+        return self.connection
+
+    def get(self, lm_config: LMConfig, prompt: APIInput) -> str | None:
+        """Get the cached response, None on a miss or for a sampled call."""
+        if not is_deterministic(lm_config):
+            self.stats.bypassed += 1
+            return None
+        key = cache_key(lm_config, prompt)
+        with self.lock:
+            connection = self.connect()
+            row = connection.execute(
+                "SELECT response FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            with connection:
+                connection.execute(
+                    "UPDATE responses SET last_used = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            self.stats.hits += 1
+        response: str = row[0]
+        return response
+
+    def put(
+        self, lm_config: LMConfig, prompt: APIInput, response: str
+    ) -> None:
+        if not is_deterministic(lm_config):
+            return
+        key = cache_key(lm_config, prompt)
+        with self.lock:
+            connection = self.connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, response, len(response.encode()), time.time()),
+                )
+                self.evict(connection)
+
+    def evict(self, connection: sqlite3.Connection) -> None:
+        (size,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        # the oldest entries until the size is back under the limit
+        while size > self.max_size:
+            rows = connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            evicted = []
+            for key, entry_size in rows:
+                if size <= self.max_size:
+                    break
+                evicted.append((key,))
+                size -= entry_size
+            connection.executemany(
+                "DELETE FROM responses WHERE key = ?", evicted
+            )
+            self.stats.evictions += len(evicted)
+
+    def __len__(self) -> int:
+        with self.lock:
+            (count,) = (
+                self.connect()
+                .execute("SELECT COUNT(*) FROM responses")
+                .fetchone()
+            )
+        return int(count)
+
+    def close(self) -> None:
+        with self.lock:
+            if self.connection is not None and self.pid == os.getpid():
+                self.connection.close()
+            self.connection = None
@@ -0,0 +1,274 @@
+"""An asynchronous gateway to the language model, shared by the episodes
+that run concurrently.
+
+The gateway keeps the requests of all the episodes under the quota of the
+provider: a limiter for the requests and a token bucket for the tokens
+per minute, and a cap on the requests in flight. The OpenAI requests go
+through one HTTP session, the Hugging Face ones through the pool of the
+TGI endpoints, and the responses are streamed.
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Any, AsyncGenerator
+
+import aiohttp
+import aiolimiter
+import openai
+import openai.error
+import text_generation.errors  # type: ignore
+
+from llms.lm_config import LMConfig
+from llms.providers.hf_utils import get_tgi_pool, make_parameters
+from llms.tokenizers import Tokenizer
+from utils import load_env
+
+APIInput = str | list[Any] | dict[str, Any]
+
+RETRIED_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    text_generation.errors.OverloadedError,
+    text_generation.errors.RateLimitExceededError,
+    aiohttp.ClientError,
+    asyncio.TimeoutError,
+)
+
+
+class TokenBucket:
+    """Allow `per_minute` units per minute, in bursts of at most as many
+
+    Unlike `aiolimiter.AsyncLimiter`, the units reserved for a request can
+    be given back once its actual size is known.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+        # the waiters are served in order, large requests are not starved
+        self.lock = asyncio.Lock()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(
+            self.capacity, self.level + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    async def acquire(self, amount: float) -> None:
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self.refill()
+            while self.level < amount:
+                await asyncio.sleep((amount - self.level) / self.rate)
+                self.refill()
+            self.level -= amount
+
+    def give_back(self, amount: float) -> None:
+        """Return the units that were reserved but not used"""
+        self.refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class LLMGateway:
+    def __init__(
+        self,
+        lm_config: LMConfig,
+        tokenizer: Tokenizer,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_in_flight: int = 256,
+        max_retries: int = 5,
+    ) -> None:
+        """
+        :param requests_per_minute: 0 for no limit
+        :param tokens_per_minute: prompt and completion tokens, 0 for no
+            limit, the maximum completion is reserved until the response
+            is complete
+        """
+        self.lm_config = lm_config
+        self.tokenizer = tokenizer
+        self.limiter = (
+            aiolimiter.AsyncLimiter(requests_per_minute)
+            if requests_per_minute
+            else None
+        )
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        )
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        # created in the event loop of the first request
+        self.in_flight: asyncio.Semaphore | None = None
+        self.session: aiohttp.ClientSession | None = None
+
+    @property
+    def max_tokens(self) -> int:
+        gen_config = self.lm_config.gen_config
+        max_tokens: int = gen_config.get(
+            "max_tokens", gen_config.get("max_new_tokens", 0)
+        )
+        return max_tokens
+
+    def count_tokens(self, prompt: APIInput) -> int:
+        if isinstance(prompt, str):
+            return len(self.tokenizer.encode(prompt))
+        if isinstance(prompt, dict):
+            prompt = [prompt]
+        return sum(
+            len(self.tokenizer.encode(str(message.get("content", ""))))
+            for message in prompt
+        )
+
+    def open(self) -> None:
+        if self.in_flight is None:
+            self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        if self.lm_config.provider == "openai" and self.session is None:
+            openai.api_key = load_env("OPENAI_API_KEY")
+            openai.organization = load_env("OPENAI_ORGANIZATION")
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_in_flight)
+            )
+
+    async def aclose(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        if self.lm_config.provider == "huggingface":
+            pool = get_tgi_pool(self.lm_config.gen_config["model_endpoint"])
+            await pool.aclose()
+
+    async def request(self, prompt: APIInput) -> AsyncGenerator[str, None]:
+        """Send the request and return the stream of the text chunks"""
+        lm_config = self.lm_config
+        gen_config = lm_config.gen_config
+        if lm_config.provider == "openai":
+            # all the requests share the connections of the session
+            openai.aiosession.set(self.session)
+            if lm_config.mode == "chat":
+                assert isinstance(prompt, list)
+                response = await openai.ChatCompletion.acreate(  # type: ignore
+                    model=lm_config.model,
+                    messages=prompt,
+                    temperature=gen_config["temperature"],
+                    max_tokens=gen_config["max_tokens"],
+                    top_p=gen_config["top_p"],
+                    stream=True,
+                )
+                return (
+                    chunk["choices"][0]["delta"].get("content", "")
+                    async for chunk in response
+                    if chunk["choices"]
+                )
+            elif lm_config.mode == "completion":
+                assert isinstance(prompt, str)
+                stop_token = gen_config["stop_token"]
+                response = await openai.Completion.acreate(  # type: ignore
+                    prompt=prompt,
+                    engine=lm_config.model,
+                    temperature=gen_config["temperature"],
+                    max_tokens=gen_config["max_tokens"],
+                    top_p=gen_config["top_p"],
+                    stop=[stop_token],
+                    stream=True,
+                )
+                return (
+                    chunk["choices"][0]["text"]
+                    async for chunk in response
+                    if chunk["choices"]
+                )
+            else:
+                raise ValueError(
+                    f"OpenAI models do not support mode {lm_config.mode}"
+                )
+        elif lm_config.provider == "huggingface":
+            assert isinstance(prompt, str)
+            pool = get_tgi_pool(gen_config["model_endpoint"])
+            return pool.astream(
+                prompt,
+                make_parameters(
+                    gen_config["temperature"],
+                    gen_config["top_p"],
+                    gen_config["max_new_tokens"],
+                    gen_config["stop_sequences"],
+                ),
+            )
+        else:
+            raise NotImplementedError(
+                f"Provider {lm_config.provider} not implemented"
+            )
+
+    async def reserve(self, tokens: int) -> None:
+        """Take a request and `tokens` tokens from the shared quotas"""
+        if self.limiter is not None:
+            await self.limiter.acquire()
+        if self.token_bucket is not None:
+            await self.token_bucket.acquire(tokens)
+
+    async def astream(self, prompt: APIInput) -> AsyncGenerator[str, None]:
+        """Stream the response to the prompt, the consumer can stop early
+
+        The request is retried with an exponential backoff until its first
+        chunk arrives, after that an error is raised. Each attempt takes
+        its own request and tokens from the quotas.
+        """
+        self.open()
+        assert self.in_flight is not None
+        reserved = self.count_tokens(prompt) + self.max_tokens
+        completion: list[str] = []
+        chunks: AsyncGenerator[str, None] | None = None
+        # whether the completion tokens of the attempt are still reserved
+        reserving = False
+        async with self.in_flight:
+            try:
+                delay = 1.0
+                for num_retries in range(self.max_retries + 1):
+                    await self.reserve(reserved)
+                    reserving = True
+                    try:
+                        chunks = await self.request(prompt)
+                        first_chunk = await anext(chunks, None)
+                        break
+                    except RETRIED_ERRORS as e:
+                        if chunks is not None:
+                            await chunks.aclose()
+                            chunks = None
+                        if self.token_bucket is not None:
+                            # the prompt was sent, but nothing was generated
+                            self.token_bucket.give_back(self.max_tokens)
+                        reserving = False
+                        if num_retries == self.max_retries:
+                            raise
+                        delay *= 2 * (1 + random.random())
+                        logging.warning(
+                            f"{repr(e)}, retrying in {delay:.1f} seconds"
+                        )
+                        await asyncio.sleep(delay)
+                if first_chunk is None:
+                    return
+                completion.append(first_chunk)
+                yield first_chunk
+                assert chunks is not None
+                async for chunk in chunks:
+                    completion.append(chunk)
+                    yield chunk
+            finally:
+                # stops the generation when the consumer stopped early
+                if chunks is not None:
+                    await chunks.aclose()
+                if self.token_bucket is not None and reserving:
+                    completion_tokens = len(
+                        self.tokenizer.encode("".join(completion))
+                    )
+                    self.token_bucket.give_back(
+                        max(0, self.max_tokens - completion_tokens)
+                    )
+
+    async def agenerate(self, prompt: APIInput) -> str:
+        return "".join([chunk async for chunk in self.astream(prompt)])
@@ -1,4 +1,283 @@
-from text_generation import Client  # type: ignore
+"""Clients of the text-generation-inference (TGI) endpoints.
+
+The `text_generation` clients open a new connection for every request, so
+the requests go through pooled HTTP sessions instead, one per endpoint.
+A model endpoint can name several TGI replicas of the same model,
+separated by commas. The requests are balanced across them.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import AsyncGenerator, Iterator
+
+import aiohttp
+import requests
+from text_generation.errors import parse_error  # type: ignore
+from text_generation.types import (  # type: ignore
+    Parameters,
+    Request,
+    Response,
+    StreamResponse,
+)
+
+# the request did not reach the endpoint, another one can take it
+UNREACHABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    aiohttp.ClientConnectionError,
+    asyncio.TimeoutError,
+)
+
+
+class TGIEndpoint:
+    """One TGI replica with its HTTP sessions."""
+
+    def __init__(self, url: str, timeout: float, max_connections: int):
+        self.url = url.strip().rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.outstanding = 0
+        self.healthy = True
+        self.next_probe = 0.0
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=max_connections
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # the aiohttp sessions are bound to the event loop they are used in
+        self.asessions: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, aiohttp.ClientSession
+        ] = weakref.WeakKeyDictionary()
+
+    def asession(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self.asessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+            )
+            self.asessions[loop] = session
+        return session
+
+    @property
+    def health_url(self) -> str:
+        return f"{self.url}/health"
+
+
+class TGIPool:
+    """Clients of the TGI replicas of one model.
+
+    A request goes to the healthy replica with the fewest outstanding
+    requests. A replica that cannot be reached is left out and probed on
+    its `/health` route every `retry_interval` seconds until it answers.
+    When no replica is healthy, all of them are tried.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        timeout: float = 60,
+        retry_interval: float = 30,
+        max_connections: int = 64,
+    ) -> None:
+        if not urls:
+            raise ValueError("No TGI endpoint given")
+        self.endpoints = [
+            TGIEndpoint(url, timeout, max_connections) for url in urls
+        ]
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+
+    def pick(self, tried: set[TGIEndpoint]) -> TGIEndpoint | None:
+        with self.lock:
+            untried = [e for e in self.endpoints if e not in tried]
+            candidates = [e for e in untried if e.healthy]
+            if not candidates and not any(e.healthy for e in self.endpoints):
+                candidates = untried
+            if not candidates:
+                return None
+            return min(candidates, key=lambda e: e.outstanding)
+
+    @contextmanager
+    def track(self, endpoint: TGIEndpoint) -> Iterator[None]:
+        with self.lock:
+            endpoint.outstanding += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                endpoint.outstanding -= 1
+
+    def mark_down(self, endpoint: TGIEndpoint, error: Exception) -> None:
+        logging.warning(f"TGI endpoint {endpoint.url} is down: {error!r}")
+        with self.lock:
+            endpoint.healthy = False
+            endpoint.next_probe = time.monotonic() + self.retry_interval
+
+    def mark_up(self, endpoint: TGIEndpoint) -> None:
+        with self.lock:
+            if not endpoint.healthy:
+                logging.info(f"TGI endpoint {endpoint.url} is up again")
+            endpoint.healthy = True
+
+    def due_for_probe(self) -> list[TGIEndpoint]:
+        """Claim the probes of the unhealthy endpoints that are due."""
+        now = time.monotonic()
+        with self.lock:
+            due = [
+                e
+                for e in self.endpoints
+                if not e.healthy and e.next_probe <= now
+            ]
+            for endpoint in due:
+                endpoint.next_probe = now + self.retry_interval
+        return due
+
+    def check_health(self) -> None:
+        for endpoint in self.due_for_probe():
+            try:
+                ok = endpoint.session.get(endpoint.health_url, timeout=5).ok
+            except UNREACHABLE_ERRORS:
+                ok = False
+            if ok:
+                self.mark_up(endpoint)
+
+    async def acheck_health(self) -> None:
+        async def probe(endpoint: TGIEndpoint) -> None:
+            try:
+                async with endpoint.asession().get(
+                    endpoint.health_url, timeout=aiohttp.ClientTimeout(5)
+                ) as response:
+                    ok = response.ok
+            except UNREACHABLE_ERRORS:
+                ok = False
+            if ok:
+                self.mark_up(endpoint)
+
+        await asyncio.gather(*map(probe, self.due_for_probe()))
+
+    def generate(self, prompt: str, parameters: Parameters) -> str:
+        """Generate the completion of the prompt on one of the replicas."""
+        self.check_health()
+        request = Request(inputs=prompt, stream=False, parameters=parameters)
+        tried: set[TGIEndpoint] = set()
+        error: Exception | None = None
+        while endpoint := self.pick(tried):
+            tried.add(endpoint)
+            with self.track(endpoint):
+                try:
+                    response = endpoint.session.post(
+                        endpoint.url,
+                        json=request.dict(),
+                        timeout=endpoint.timeout,
+                    )
+                except UNREACHABLE_ERRORS as e:
+                    self.mark_down(endpoint, e)
+                    error = e
+                    continue
+            self.mark_up(endpoint)
+            payload = response.json()
+            if response.status_code != 200:
+                raise parse_error(response.status_code, payload)
+            generated_text: str = Response(**payload[0]).generated_text
+            return generated_text
+        assert error is not None
+        raise error
+
+    async def astream(
+        self, prompt: str, parameters: Parameters
+    ) -> AsyncGenerator[str, None]:
+        """Stream the text of the completion from one of the replicas.
+
+        A request that cannot be sent goes to the next replica, an error
+        after the first chunk is raised.
+        """
+        await self.acheck_health()
+        request = Request(inputs=prompt, stream=True, parameters=parameters)
+        tried: set[TGIEndpoint] = set()
+        error: Exception | None = None
+        while endpoint := self.pick(tried):
+            tried.add(endpoint)
+            with self.track(endpoint):
+                try:
+                    response = await endpoint.asession().post(
+                        endpoint.url, json=request.dict()
+                    )
+                except UNREACHABLE_ERRORS as e:
+                    self.mark_down(endpoint, e)
+                    error = e
+                    continue
+                self.mark_up(endpoint)
+                async with response:
+                    if response.status != 200:
+                        raise parse_error(
+                            response.status, await response.json()
+                        )
+                    async for line in response.content:
+                        text = line.decode("utf-8").strip()
+                        if not text.startswith("data:"):
+                            continue
+                        payload = json.loads(text[len("data:") :])
+                        if "error" in payload:
+                            raise parse_error(response.status, payload)
+                        chunk = StreamResponse(**payload)
+                        if not chunk.token.special:
+                            yield chunk.token.text
+            return
+        assert error is not None
+        raise error
+
+    async def agenerate(self, prompt: str, parameters: Parameters) -> str:
+        return "".join(
+            [chunk async for chunk in self.astream(prompt, parameters)]
+        )
+
+    async def aclose(self) -> None:
+        """Close the aiohttp sessions of the running event loop."""
+        loop = asyncio.get_running_loop()
+        for endpoint in self.endpoints:
+            session = endpoint.asessions.pop(loop, None)
+            if session is not None:
+                await session.close()
+
+
+_pools: dict[str, TGIPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_tgi_pool(model_endpoint: str) -> TGIPool:
+    """Get the pool shared by the calls to the same model endpoint.
+
+    Args:
+        model_endpoint: The URLs of the TGI replicas, separated by commas.
+    """
+    with _pools_lock:
+        if model_endpoint not in _pools:
+            urls = [url for url in model_endpoint.split(",") if url.strip()]
+            _pools[model_endpoint] = TGIPool(urls)
+        return _pools[model_endpoint]
+
+
+def make_parameters(
+    temperature: float,
+    top_p: float,
+    max_new_tokens: int,
+    stop_sequences: list[str] | None = None,
+) -> Parameters:
+    # the defaults of `text_generation.Client.generate`
+    return Parameters(
+        details=True,
+        temperature=temperature,
+        top_p=top_p,
+        max_new_tokens=max_new_tokens,
+        stop=stop_sequences if stop_sequences is not None else [],
+    )
 
 
 def generate_from_huggingface_completion(
@@ -9,13 +288,23 @@ def generate_from_huggingface_completion(
     max_new_tokens: int,
     stop_sequences: list[str] | None = None,
 ) -> str:
-    client = Client(model_endpoint, timeout=60)
-    generation: str = client.generate(
-        prompt=prompt,
-        temperature=temperature,
-        top_p=top_p,
-        max_new_tokens=max_new_tokens,
-        stop_sequences=stop_sequences,
-    ).generated_text
+    pool = get_tgi_pool(model_endpoint)
+    return pool.generate(
+        prompt,
+        make_parameters(temperature, top_p, max_new_tokens, stop_sequences),
+    )
+
 
-    return generation
+async def agenerate_from_huggingface_completion(
+    prompt: str,
+    model_endpoint: str,
+    temperature: float,
+    top_p: float,
+    max_new_tokens: int,
+    stop_sequences: list[str] | None = None,
+) -> str:
+    pool = get_tgi_pool(model_endpoint)
+    return await pool.agenerate(
+        prompt,
+        make_parameters(temperature, top_p, max_new_tokens, stop_sequences),
+    )
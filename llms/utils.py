@@ -7,6 +7,7 @@ from llms import (
     generate_from_openai_completion,
     lm_config,
 )
+from llms.cache import PromptCache
 
 APIInput = str | list[Any] | dict[str, Any]
 
@@ -14,7 +15,12 @@ APIInput = str | list[Any] | dict[str, Any]
 def call_llm(
     lm_config: lm_config.LMConfig,
     prompt: APIInput,
+    cache: PromptCache | None = None,
 ) -> str:
+    """Call the model, or replay its response from the cache if given"""
+    if cache is not None:
+        if (cached := cache.get(lm_config, prompt)) is not None:
+            return cached
     response: str
     if lm_config.provider == "openai":
         if lm_config.mode == "chat":
@@ -57,4 +63,6 @@ def call_llm(
             f"Provider {lm_config.provider} not implemented"
         )
 
+    if cache is not None:
+        cache.put(lm_config, prompt, response)
     return response
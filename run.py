@@ -14,32 +14,16 @@ from agent import (
     construct_agent_from_config
 )
 from agent.prompts import *
-from browser_env import (
-    ActionTypes,
-    ScriptBrowserEnv,
-    StateInfo,
-    Trajectory,
-    create_stop_action,
-)
-
-from browser_env.helper_functions import (
-    RenderHelper,
-    get_action_description,
-)
-from evaluation_harness import evaluator_router
-
 
 from inference.config import WebArenaConfig, get_config
+from inference.ledger import TaskLedger
 from inference.utils import (
     prepare,
     create_test_file_list,
     log_error_file
 )
-from inference.pipes import (
-    create_env_from_config,
-    get_intent_and_task_id,
-    get_next_action
-)
+from inference.pipes import create_env_from_config
+from inference.runner import run_concurrent, run_parallel, run_task
 
 from typing import Optional
 
@@ -78,106 +62,32 @@ def test(
     scores = []
 
     env = create_env_from_config(config)
+    ledger = TaskLedger(result_dir)
 
     for config_file in tqdm(config_file_list):
-        render_helper = RenderHelper(
-            config_file, result_dir, config.action_set_tag
-        )
-
+        if not ledger.claim(config_file):
+            logger.info(f"[Skip] {config_file} is run by another process")
+            continue
         try:
-            # get intent
-            intent, task_id = get_intent_and_task_id(config_file)
-
-            logger.info(f"[Config file]: {config_file}")
-            logger.info(f"[Intent]: {intent}")
-
-            # reset
-            agent.reset(config_file)
-            obs, info = env.reset(options={"config_file": config_file})
-            logger.info("reset")
-
-            # init state_info, trajectory
-            state_info: StateInfo = {"observation": obs, "info": info}
-            trajectory: Trajectory = [state_info]
-
-            # init metadata
-            meta_data = {"action_history": ["None"]}
-
-            while True:
-                # get new action
-                action = get_next_action(
-                    config,
-                    trajectory,
-                    agent,
-                    intent,
-                    meta_data
-                )
-                logger.info("got new action")
-
-                # update trajectory
-                trajectory.append(action)
-
-                # get description about new action
-                action_str = get_action_description(
-                    action,
-                    state_info["info"]["observation_metadata"],
-                    action_set_tag=config.action_set_tag,
-                    prompt_constructor=agent.prompt_constructor
-                    if isinstance(agent, PromptAgent)
-                    else None,
-                )
-                logger.info("got description about new action")
-
-                render_helper.render(
-                    action, state_info, meta_data, config.render_screenshot
-                )
-                meta_data["action_history"].append(action_str)
-
-                if action["action_type"] == ActionTypes.STOP:
-                    break
-
-                # get new env state
-                obs, _, terminated, _, info = env.step(action)
-
-                # update state_info, trajectory
-                state_info = {"observation": obs, "info": info}
-                trajectory.append(state_info)
-
-                if terminated:
-                    # add a action placeholder
-                    trajectory.append(create_stop_action(""))
-                    break
-
-            evaluator = evaluator_router(config_file)
-            score = evaluator(
-                trajectory=trajectory,
-                config_file=config_file,
-                page=env.page,
-                client=env.get_page_client(env.page),
-            )
-
+            score = run_task(config, agent, env, config_file)
             scores.append(score)
-
-            if score == 1:
-                logger.info(f"[Result] (PASS) {config_file}")
-            else:
-                logger.info(f"[Result] (FAIL) {config_file}")
-
-            if config.save_trace_enabled:
-                env.save_trace(
-                    Path(result_dir) / "traces" / f"{task_id}.zip"
-                )
+            ledger.finish(config_file, score)
 
         except openai.error.OpenAIError as e:
             logger.info(f"[OpenAI Error] {repr(e)}")
+            ledger.finish(config_file, None, repr(e))
         except Exception as e:
             logger.info(f"[Unhandled Error] {repr(e)}]")
             log_error_file(result_dir, config_file, e)
-
-        render_helper.close()
+            ledger.finish(config_file, None, repr(e))
 
     env.close()
-    logger.info(f"Average score: {sum(scores) / len(scores)}")
+    agent.close()
+    ledger.close()
+    if scores:
+        logger.info(f"Average score: {sum(scores) / len(scores)}")
+    else:
+        logger.info("No tasks run")
 
 
 
@@ -195,8 +105,23 @@ if __name__ == "__main__":
     if len(test_file_list) > 0:
         logger.info(f"Total {len(test_file_list)} tasks left")
         config.dump()
-        agent = construct_agent_from_config(config)
-        test(config, agent, test_file_list)
+        if config.num_concurrent_episodes > 1:
+            run_concurrent(
+                config,
+                test_file_list,
+                config.num_concurrent_episodes,
+                config.max_task_retries
+            )
+        elif config.num_workers > 1:
+            run_parallel(
+                config,
+                test_file_list,
+                config.num_workers,
+                config.max_task_retries
+            )
+        else:
+            agent = construct_agent_from_config(config)
+            test(config, agent, test_file_list)
 
     else:
         logger.info("No task left to run")
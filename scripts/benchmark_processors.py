@@ -0,0 +1,416 @@
+"""Microbenchmarks for the observation processors.
+
+pruning: the trees are either generated or loaded from json files holding a
+list of accessibility tree nodes (with `nodeId`, `parentId`, `childIds` and
+`union_bound`), e.g., the output of `fetch_page_accessibility_tree` with
+`current_viewport_only=False`.
+
+serialize: the captured CDP payloads are replayed offline, each json file
+holds the responses of `DOMSnapshot.captureSnapshot` and
+`Accessibility.getFullAXTree` and the browser config of one observation
+({"snapshot": ..., "accessibility_tree": ..., "config": ...}).
+
+python scripts/benchmark_processors.py pruning --sizes 5000 20000 50000
+python scripts/benchmark_processors.py pruning --tree_files trees/*.json
+python scripts/benchmark_processors.py serialize --capture_files caps/*.json
+"""
+import argparse
+import copy
+import gc
+import json
+import random
+import statistics
+import time
+from typing import Any, Callable
+
+from browser_env.constants import IGNORED_ACTREE_PROPERTIES
+from browser_env.processors import (
+    TextObervationProcessor,
+    remove_nodes_from_tree,
+)
+from browser_env.utils import BrowserConfig, BrowserInfo
+
+CONFIG: BrowserConfig = {
+    "win_top_bound": 0.0,
+    "win_left_bound": 0.0,
+    "win_width": 1280,
+    "win_height": 720,
+    "win_right_bound": 1280,
+    "win_lower_bound": 720,
+    "device_pixel_ratio": 1.0,
+}
+
+
+def generate_tree(size: int, seed: int = 0) -> list[dict[str, Any]]:
+    """Generate a page-like tree: a few containers holding long lists and
+    tables, with most of the rows scrolled out of the viewport"""
+    rng = random.Random(seed)
+    tree: list[dict[str, Any]] = [
+        {
+            "nodeId": "0",
+            "childIds": [],
+            "union_bound": [0.0, 0.0, 10.0, 10.0],
+        }
+    ]
+    containers = [tree[0]]
+    y = 0.0
+    while len(tree) < size:
+        parent = rng.choice(containers)
+        node = {
+            "nodeId": str(len(tree)),
+            "parentId": parent["nodeId"],
+            "childIds": [],
+            "union_bound": [0.0, y, 200.0, 20.0],
+        }
+        y += rng.choice([0.0, 20.0])
+        parent["childIds"].append(node["nodeId"])
+        tree.append(node)
+        # some rows become wide containers themselves
+        if rng.random() < 0.01:
+            containers.append(node)
+    return tree
+
+
+def legacy_remove_nodes(
+    tree: list[dict[str, Any]], removed_ids: set[str]
+) -> list[dict[str, Any]]:
+    """The node-by-node splicing the processors used before"""
+    nodeid_to_cursor = {node["nodeId"]: idx for idx, node in enumerate(tree)}
+    for node in tree:
+        if node["nodeId"] not in removed_ids:
+            continue
+        parent = tree[nodeid_to_cursor[node["parentId"]]]
+        index = parent["childIds"].index(node["nodeId"])
+        parent["childIds"].pop(index)
+        for child_id in node["childIds"]:
+            parent["childIds"].insert(index, child_id)
+            index += 1
+        for child_id in node["childIds"]:
+            tree[nodeid_to_cursor[child_id]]["parentId"] = node["parentId"]
+        node["parentId"] = "[REMOVED]"
+    return [
+        node for node in tree if node.get("parentId", "Root") != "[REMOVED]"
+    ]
+
+
+def legacy_parse_accessibility_tree(
+    accessibility_tree: list[dict[str, Any]],
+) -> tuple[str, dict[str, Any]]:
+    """The recursive serializer the processor used before"""
+    node_id_to_idx = {}
+    for idx, node in enumerate(accessibility_tree):
+        node_id_to_idx[node["nodeId"]] = idx
+
+    obs_nodes_info = {}
+
+    def dfs(idx: int, obs_node_id: str, depth: int) -> str:
+        tree_str = ""
+        node = accessibility_tree[idx]
+        indent = "\t" * depth
+        valid_node = True
+        try:
+            role = node["role"]["value"]
+            name = node["name"]["value"]
+            node_str = f"[{obs_node_id}] {role} {repr(name)}"
+            properties = []
+            for property in node.get("properties", []):
+                try:
+                    if property["name"] in IGNORED_ACTREE_PROPERTIES:
+                        continue
+                    properties.append(
+                        f'{property["name"]}: {property["value"]["value"]}'
+                    )
+                except KeyError:
+                    pass
+
+            if properties:
+                node_str += " " + " ".join(properties)
+
+            if not node_str.strip():
+                valid_node = False
+
+            if not name.strip():
+                if not properties:
+                    if role in [
+                        "generic",
+                        "img",
+                        "list",
+                        "strong",
+                        "paragraph",
+                        "banner",
+                        "navigation",
+                        "Section",
+                        "LabelText",
+                        "Legend",
+                        "listitem",
+                    ]:
+                        valid_node = False
+                elif role in ["listitem"]:
+                    valid_node = False
+
+            if valid_node:
+                tree_str += f"{indent}{node_str}"
+                obs_nodes_info[obs_node_id] = {
+                    "backend_id": node["backendDOMNodeId"],
+                    "union_bound": node["union_bound"],
+                    "text": node_str,
+                }
+
+        except Exception:
+            valid_node = False
+
+        for child_node_id in node["childIds"]:
+            if child_node_id not in node_id_to_idx:
+                continue
+            child_depth = depth + 1 if valid_node else depth
+            child_str = dfs(
+                node_id_to_idx[child_node_id], child_node_id, child_depth
+            )
+            if child_str.strip():
+                if tree_str.strip():
+                    tree_str += "\n"
+                tree_str += child_str
+
+        return tree_str
+
+    tree_str = dfs(0, accessibility_tree[0]["nodeId"], 0)
+    return tree_str, obs_nodes_info
+
+
+def legacy_parse_html(
+    dom_tree: list[dict[str, Any]]
+) -> tuple[str, dict[str, Any]]:
+    """The recursive serializer the processor used before"""
+    obs_nodes_info = {}
+    nodeid_to_cursor = {
+        node["nodeId"]: idx for idx, node in enumerate(dom_tree)
+    }
+
+    def dfs(node_cursor: int, depth: int) -> str:
+        tree_str = ""
+        node = dom_tree[node_cursor]
+        indent = "\t" * depth
+        valid_node = True
+        try:
+            node_str = f"[{node_cursor}] <{node['nodeName']}"
+            if node["attributes"]:
+                node_str += f" {node['attributes']}"
+            node_str += f"> {node['nodeValue']}"
+            valid_node = bool(node["attributes"] or node["nodeValue"])
+
+            if valid_node:
+                obs_nodes_info[str(node_cursor)] = {
+                    "backend_id": node["backendNodeId"],
+                    "union_bound": node["union_bound"],
+                    "text": node_str,
+                }
+                tree_str += f"{indent}{node_str}\n"
+
+        except Exception:
+            valid_node = False
+
+        for child_ids in node["childIds"]:
+            child_cursor = nodeid_to_cursor[child_ids]
+            child_depth = depth + 1 if valid_node else depth
+            tree_str += dfs(child_cursor, child_depth)
+
+        return tree_str
+
+    html = dfs(0, 0)
+    return html, obs_nodes_info
+
+
+class ReplayCDPSession:
+    """Answer the CDP commands from the captured responses"""
+
+    def __init__(self, responses: dict[str, Any]) -> None:
+        self.responses = responses
+
+    def send(self, method: str, params: Any = None) -> Any:
+        return copy.deepcopy(self.responses[method])
+
+
+def generate_capture(size: int, seed: int = 0) -> dict[str, Any]:
+    """Generate the CDP payloads of a page with `size` DOM nodes, where each
+    element has an accessibility node and most of them are list items"""
+    rng = random.Random(seed)
+    strings = ["#document", "DIV", "UL", "LI", "A", "class", "item", "href"]
+    nodes: dict[str, list[Any]] = {
+        "backendNodeId": [1],
+        "parentIndex": [-1],
+        "nodeType": [9],
+        "nodeName": [0],
+        "nodeValue": [-1],
+        "attributes": [[]],
+    }
+    layout: dict[str, list[Any]] = {"nodeIndex": [], "bounds": []}
+    ax_nodes: list[dict[str, Any]] = [
+        {
+            "nodeId": "1",
+            "role": {"value": "RootWebArea"},
+            "name": {"value": "Generated page"},
+            "childIds": [],
+            "backendDOMNodeId": 1,
+        }
+    ]
+    containers = [0]
+    y = 0.0
+    for node_idx in range(1, size):
+        # nest into the recent containers to get realistic depths
+        parent_idx = rng.choice(containers[-3:])
+        name_idx = rng.randint(1, 4)
+        nodes["backendNodeId"].append(node_idx + 1)
+        nodes["parentIndex"].append(parent_idx)
+        nodes["nodeType"].append(1)
+        nodes["nodeName"].append(name_idx)
+        nodes["nodeValue"].append(-1)
+        nodes["attributes"].append([5, 6] if name_idx != 4 else [7, 6])
+        layout["nodeIndex"].append(node_idx)
+        layout["bounds"].append([0.0, y, 200.0, 20.0])
+        y += rng.choice([0.0, 20.0])
+        if name_idx != 4 and rng.random() < 0.05:
+            containers.append(node_idx)
+
+        role = ["generic", "list", "listitem", "link"][name_idx - 1]
+        ax_node = {
+            "nodeId": str(node_idx + 1),
+            "parentId": str(parent_idx + 1),
+            "role": {"value": role},
+            "name": {"value": f"{role} {node_idx}" if role == "link" else ""},
+            "properties": [{"name": "level", "value": {"value": 1}}],
+            "childIds": [],
+            "backendDOMNodeId": node_idx + 1,
+        }
+        ax_nodes[parent_idx]["childIds"].append(ax_node["nodeId"])
+        ax_nodes.append(ax_node)
+
+    return {
+        "snapshot": {
+            "documents": [{"nodes": nodes, "layout": layout}],
+            "strings": strings,
+        },
+        "accessibility_tree": {"nodes": ax_nodes},
+        "config": CONFIG,
+    }
+
+
+def timeit(
+    func: Callable[[list[dict[str, Any]]], Any],
+    tree: list[dict[str, Any]],
+    repeat: int,
+) -> float:
+    """Return the median run time in milliseconds, the copy is not timed"""
+    timings = []
+    for _ in range(repeat):
+        tree_copy = copy.deepcopy(tree)
+        gc.collect()
+        gc.disable()
+        start = time.perf_counter()
+        func(tree_copy)
+        timings.append((time.perf_counter() - start) * 1000)
+        gc.enable()
+    return statistics.median(timings)
+
+
+def bench_pruning(trees: dict[str, list[dict[str, Any]]], repeat: int) -> None:
+    print(f"{'tree':<30}{'nodes':>8}{'removed':>9}{'legacy':>12}{'new':>12}")
+    for name, tree in trees.items():
+        removed_ids = {
+            node["nodeId"]
+            for node in tree
+            if not TextObervationProcessor.is_in_viewport(
+                node["union_bound"], CONFIG
+            )
+        }
+        assert remove_nodes_from_tree(
+            copy.deepcopy(tree), removed_ids  # type: ignore[type-var]
+        ) == legacy_remove_nodes(copy.deepcopy(tree), removed_ids)
+
+        legacy_ms = timeit(
+            lambda t: legacy_remove_nodes(t, removed_ids), tree, repeat
+        )
+        new_ms = timeit(
+            lambda t: remove_nodes_from_tree(t, removed_ids), tree, repeat
+        )
+        print(
+            f"{name:<30}{len(tree):>8}{len(removed_ids):>9}"
+            f"{legacy_ms:>10.1f}ms{new_ms:>10.1f}ms"
+        )
+
+
+def bench_serialize(captures: dict[str, dict[str, Any]], repeat: int) -> None:
+    processor = TextObervationProcessor(
+        "accessibility_tree", False, {"width": 1280, "height": 720}
+    )
+    print(f"{'capture':<30}{'type':>6}{'nodes':>8}{'legacy':>12}{'new':>12}")
+    for name, capture in captures.items():
+        client = ReplayCDPSession(
+            {
+                "DOMSnapshot.captureSnapshot": capture["snapshot"],
+                "Accessibility.getFullAXTree": capture["accessibility_tree"],
+            }
+        )
+        info: BrowserInfo = {
+            "DOMTree": capture["snapshot"],
+            "config": capture["config"],
+        }
+        accessibility_tree = processor.fetch_page_accessibility_tree(
+            info, client, current_viewport_only=False  # type: ignore[arg-type]
+        )
+        dom_tree = processor.fetch_page_html(
+            info, None, client, current_viewport_only=False  # type: ignore[arg-type]
+        )
+        benchmarks: list[tuple[str, list[Any], Callable[..., Any], Any]] = [
+            (
+                "actree",
+                accessibility_tree,
+                legacy_parse_accessibility_tree,
+                processor.parse_accessibility_tree,
+            ),
+            ("html", dom_tree, legacy_parse_html, processor.parse_html),
+        ]
+        for tag, tree, legacy_func, new_func in benchmarks:
+            assert new_func(tree) == legacy_func(tree)
+            legacy_ms = timeit(legacy_func, tree, repeat)
+            new_ms = timeit(new_func, tree, repeat)
+            print(
+                f"{name:<30}{tag:>6}{len(tree):>8}"
+                f"{legacy_ms:>10.1f}ms{new_ms:>10.1f}ms"
+            )
+
+
+def load_captures(args: argparse.Namespace) -> dict[str, dict[str, Any]]:
+    captures = {}
+    for capture_file in args.capture_files:
+        with open(capture_file, "r") as f:
+            captures[capture_file] = json.load(f)
+    for size in args.sizes:
+        captures[f"generated_{size}"] = generate_capture(size)
+    return captures
+
+
+def load_trees(args: argparse.Namespace) -> dict[str, list[dict[str, Any]]]:
+    trees = {}
+    for tree_file in args.tree_files:
+        with open(tree_file, "r") as f:
+            trees[tree_file] = json.load(f)
+    for size in args.sizes:
+        trees[f"generated_{size}"] = generate_tree(size)
+    return trees
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=["pruning", "serialize"])
+    parser.add_argument("--tree_files", nargs="*", default=[])
+    parser.add_argument("--capture_files", nargs="*", default=[])
+    parser.add_argument(
+        "--sizes", nargs="*", type=int, default=[5000, 10000, 20000, 50000]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.benchmark == "pruning":
+        bench_pruning(load_trees(args), args.repeat)
+    elif args.benchmark == "serialize":
+        bench_serialize(load_captures(args), args.repeat)
@@ -7,6 +7,27 @@ import os
 import shutil
 import sys
 
+from browser_env.trajectory_store import TrajectoryStore
+from inference.ledger import TaskLedger
+
+LOGOUT_STRINGS = [
+    "Creating an account has many benefits: check out faster",
+    "Welcome, please sign in",
+    "Username or email",
+    "Keep me logged in",
+]
+
+
+def delete_examples(result_folder: str, task_ids: list[int]) -> None:
+    """Delete the renders and mark the tasks to run again"""
+    for idx in task_ids:
+        if os.path.exists(f"{result_folder}/render_{idx}.html"):
+            os.remove(f"{result_folder}/render_{idx}.html")
+    if os.path.exists(f"{result_folder}/tasks.sqlite"):
+        ledger = TaskLedger(result_folder)
+        ledger.reset([f"config_files/{idx}.json" for idx in task_ids])
+        ledger.close()
+
 
 def merge_logs(result_folder: str, args: argparse.Namespace) -> str:
     if not os.path.exists(f"{result_folder}/log_files.txt"):
@@ -72,8 +93,7 @@ def merge_logs(result_folder: str, args: argparse.Namespace) -> str:
         args.delete_errors
         or input("Do you want to delete these examples? (y/n)") == "y"
     ):
-        for idx in unlog_examples:
-            os.remove(f"{args.result_folder}/render_{idx}.html")
+        delete_examples(args.result_folder, unlog_examples)
 
     unifinished_examples = [
         i for i in range(0, 812) if str(i) not in merged_results
@@ -103,21 +123,12 @@ def check_unhandled_errors(args: argparse.Namespace) -> int:
         args.delete_errors
         or input("Do you want to delete these examples? (y/n)") == "y"
     ):
-        for idx in error_examples:
-            if os.path.exists(f"{args.result_folder}/render_{idx}.html"):
-                os.remove(f"{args.result_folder}/render_{idx}.html")
+        delete_examples(args.result_folder, error_examples)
     return num_errors
 
 
 def check_unexpected_logout(args: argparse.Namespace) -> int:
-    target_strings = set(
-        [
-            "Creating an account has many benefits: check out faster",
-            "Welcome, please sign in",
-            "Username or email",
-            "Keep me logged in",
-        ]
-    )
+    target_strings = set(LOGOUT_STRINGS)
 
     error_examples = []
     for render_file in glob.glob(f"{args.result_folder}/render_*.html"):
@@ -135,13 +146,38 @@ def check_unexpected_logout(args: argparse.Namespace) -> int:
         args.delete_errors
         or input("Do you want to delete these examples? (y/n)") == "y"
     ):
-        for idx in error_examples:
-            if os.path.exists(f"{args.result_folder}/render_{idx}.html"):
-                os.remove(f"{args.result_folder}/render_{idx}.html")
+        delete_examples(args.result_folder, error_examples)
 
     return num_errors
 
 
+def check_store(args: argparse.Namespace) -> int:
+    """The same checks on the trajectory store, without reading the logs
+    and the renders: a task that crashed has a render but no trajectory"""
+    store = TrajectoryStore(args.result_folder)
+    finished = store.finished_task_ids()
+    started = [
+        int(os.path.basename(f).split(".")[0].split("_")[-1])
+        for f in glob.glob(f"{args.result_folder}/render_*.html")
+    ]
+    error_examples = sorted(set(started) - finished)
+    print(f"Number of finished examples: {len(finished)}")
+    print(f"Number of unhandled errors: {len(error_examples)}")
+    print(error_examples)
+
+    logout_examples = sorted(store.find(LOGOUT_STRINGS))
+    print(f"Number of unexpected logout: {len(logout_examples)}")
+    print(logout_examples)
+
+    if (
+        args.delete_errors
+        or input("Do you want to delete these examples? (y/n)") == "y"
+    ):
+        store.remove(logout_examples)
+        delete_examples(args.result_folder, error_examples + logout_examples)
+    return len(error_examples) + len(logout_examples)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("result_folder", type=str)
@@ -149,9 +185,12 @@ if __name__ == "__main__":
     parser.add_argument("--tolerance", type=int, default=0)
 
     args = parser.parse_args()
-    n1 = check_unhandled_errors(args)
-    n2 = check_unexpected_logout(args)
-    if n1 + n2 > args.tolerance:
+    if TrajectoryStore(args.result_folder).exists():
+        num_errors = check_store(args)
+    else:
+        num_errors = check_unhandled_errors(args)
+        num_errors += check_unexpected_logout(args)
+    if num_errors > args.tolerance:
         sys.exit(1)
     else:
         sys.exit(0)
@@ -2,6 +2,7 @@
 Generate the test data"""
 import json
 
+from browser_env import TaskCatalog
 from browser_env.env_config import *
 
 
@@ -21,6 +22,8 @@ def main() -> None:
     for idx, item in enumerate(data):
         with open(f"config_files/{idx}.json", "w") as f:
             json.dump(item, f, indent=2)
+    # and the indexed catalog to look the tasks up by id
+    TaskCatalog.compile(data, "config_files/test.catalog").close()
 
 
 if __name__ == "__main__":
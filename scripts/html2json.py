@@ -8,6 +8,62 @@ from typing import Any
 
 from bs4 import BeautifulSoup
 
+from browser_env.trajectory_store import TrajectoryStore
+
+
+def save_image(
+    image_path: str, image_folder: str, task_id: int, i: int
+) -> str:
+    """Copy a screenshot of a render, in the format it was saved in"""
+    os.makedirs(image_folder, exist_ok=True)
+    extension = os.path.splitext(image_path)[1]
+    filename = f"{image_folder}/image_{task_id}_{i}{extension}"
+    with open(image_path, "rb") as src, open(filename, "wb") as dst:
+        dst.write(src.read())
+    return filename
+
+
+def load_from_store(
+    result_folder: str,
+) -> dict[int, tuple[list[dict[str, Any]], bool]]:
+    """The messages and the success of the tasks in the trajectory store"""
+    store = TrajectoryStore(result_folder)
+    image_folder = f"images/{os.path.basename(result_folder)}"
+    steps = store.scan(
+        columns=[
+            "task_id",
+            "step",
+            "url",
+            "observation",
+            "screenshot",
+            "action",
+            "raw_prediction",
+            "score",
+        ]
+    )
+    tasks: dict[int, tuple[list[dict[str, Any]], bool]] = {}
+    for row in sorted(
+        steps.to_pylist(), key=lambda r: (r["task_id"], r["step"])
+    ):
+        task_id = row["task_id"]
+        messages, _ = tasks.setdefault(task_id, ([], row["score"] == 1))
+        image = None
+        if row["screenshot"]:
+            image = save_image(
+                f"{result_folder}/{row['screenshot']}",
+                image_folder,
+                task_id,
+                row["step"],
+            )
+        messages.append(
+            {
+                "user": f"URL: {row['url']}\n\nobservation:\n{row['observation']}",
+                "image": image,
+            }
+        )
+        messages.append({"assistant": row["raw_prediction"] or row["action"]})
+    return tasks
+
 
 def main(result_folder: str, config_json: str) -> None:
     all_data = {}
@@ -35,6 +91,19 @@ def main(result_folder: str, config_json: str) -> None:
             else:
                 v["achievable"] = True
 
+    if TrajectoryStore(result_folder).exists():
+        for task_id, (messages, success) in load_from_store(
+            result_folder
+        ).items():
+            all_data[f"example_{task_id}"] = {
+                **data_configs[task_id],
+                "messages": messages,
+                "success": success,
+            }
+        with open(f"{result_folder}/json_dump.json", "w+") as f:
+            json.dump(all_data, f, indent=4)
+        return
+
     with open(f"{result_folder}/merged_log.txt", "r") as f:
         results = {}
         for line in f:
@@ -56,15 +125,25 @@ def main(result_folder: str, config_json: str) -> None:
                     obv.find("pre").text
                     for obv in soup.find_all("div", {"class": "state_obv"})
                 ]
-                base64_images = [
-                    img["src"].split(",")[1] for img in soup.find_all("img")
-                ]
+                image_srcs = [img["src"] for img in soup.find_all("img")]
                 image_observations = []
                 # save image to file and change the value to be path
                 image_folder = f"images/{os.path.basename(result_folder)}"
                 os.makedirs(image_folder, exist_ok=True)
-                for i, image in enumerate(base64_images):
-                    image_data = base64.b64decode(image)
+                for i, image_src in enumerate(image_srcs):
+                    if not image_src.startswith("data:"):
+                        # saved next to the render
+                        image_observations.append(
+                            save_image(
+                                f"{result_folder}/{image_src}",
+                                image_folder,
+                                task_id,
+                                i,
+                            )
+                        )
+                        continue
+                    # inlined by the older renders
+                    image_data = base64.b64decode(image_src.split(",")[1])
                     filename = f"{image_folder}/image_{task_id}_{i}.png"
                     with open(filename, "wb") as f:  # type: ignore[assignment]
                         f.write(image_data)  # type: ignore[arg-type]
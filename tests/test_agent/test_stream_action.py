@@ -0,0 +1,85 @@
+import json
+from pathlib import Path
+from typing import Any, AsyncGenerator
+
+import pytest
+
+from agent import PromptAgent
+from agent.prompts import CoTPromptConstructor
+from browser_env import ActionTypes
+from llms import LLMGateway, lm_config
+from llms.utils import APIInput
+
+RESPONSE = [
+    "Let's think step-by-step. The search box has id 12. ",
+    "In summary, the next action I will perform is ```click",
+    " [12]``",
+    "`",
+    " because it is the search box.",
+    " Then I will type the query.",
+]
+
+
+class FakeTokenizer:
+    def encode(self, text: str) -> list[int]:
+        return [0] * len(text.split())
+
+
+class FakeGateway(LLMGateway):
+    def __init__(self, config: lm_config.LMConfig) -> None:
+        super().__init__(config, FakeTokenizer())  # type: ignore[arg-type]
+        self.sent: list[str] = []
+        self.cancelled = False
+
+    async def astream(self, prompt: APIInput) -> AsyncGenerator[str, None]:
+        try:
+            for chunk in RESPONSE:
+                self.sent.append(chunk)
+                yield chunk
+        except GeneratorExit:
+            self.cancelled = True
+            raise
+
+
+def make_agent(tmp_path: Path) -> tuple[PromptAgent, FakeGateway]:
+    instruction_path = tmp_path / "instruction.json"
+    instruction: dict[str, Any] = {
+        "intro": "",
+        "examples": [],
+        "template": "{objective}",
+        "meta_data": {
+            "keywords": ["objective"],
+            "action_splitter": "```",
+            "answer_phrase": "In summary, the next action I will perform is",
+        },
+    }
+    instruction_path.write_text(json.dumps(instruction))
+    config = lm_config.LMConfig(
+        provider="openai", model="gpt-3.5-turbo", mode="chat"
+    )
+    config.gen_config.update({"max_tokens": 100, "max_retry": 1})
+    prompt_constructor = CoTPromptConstructor(
+        instruction_path, config, FakeTokenizer()  # type: ignore[arg-type]
+    )
+    agent = PromptAgent(
+        "id_accessibility_tree", config, prompt_constructor, True
+    )
+    gateway = FakeGateway(config)
+    agent.gateway = gateway
+    return agent, gateway
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_after_action(tmp_path: Path) -> None:
+    agent, gateway = make_agent(tmp_path)
+    response = await agent.astream_until_action("prompt")
+    assert gateway.cancelled
+    assert gateway.sent == RESPONSE[:4]
+    assert response == "".join(RESPONSE[:4])
+    action = agent.response_to_action(response, last_try=True)
+    assert action is not None
+    assert action["action_type"] == ActionTypes.CLICK
+    assert action["element_id"] == "12"
+    stats = agent.stream_stats
+    assert stats.requests == stats.early_exits == 1
+    assert stats.tokens_saved == 100 - stats.tokens
@@ -0,0 +1,70 @@
+from agent.prompts.truncation import ObservationTruncator, TreeBudgeter
+
+
+class CharTokenizer:
+    """one token per character, counts the encoded characters"""
+
+    def __init__(self) -> None:
+        self.encoded = 0
+
+    def encode(self, text: str) -> list[int]:
+        self.encoded += len(text)
+        return [ord(c) for c in text]
+
+    def decode(self, ids: list[int]) -> str:
+        return "".join(chr(i) for i in ids)
+
+
+TREE = "".join(f"\t[{i}] link 'item {i}'\n" for i in range(1000))
+
+
+def test_truncate_matches_prefix() -> None:
+    tokenizer = CharTokenizer()
+    truncator = ObservationTruncator(tokenizer)  # type: ignore[arg-type]
+    for max_tokens in [1, 20, 21, 500, len(TREE) - 1]:
+        assert truncator.truncate(TREE, max_tokens) == TREE[:max_tokens]
+    assert truncator.truncate(TREE, len(TREE) + 10) == TREE
+
+
+def test_stops_tokenizing_and_caches_lines() -> None:
+    tokenizer = CharTokenizer()
+    truncator = ObservationTruncator(tokenizer)  # type: ignore[arg-type]
+    truncator.truncate(TREE, 100)
+    assert tokenizer.encoded < 200
+
+    # the lines that were counted at the previous step are not tokenized
+    tokenizer.encoded = 0
+    page = "\tRootWebArea 'new page'\n" + TREE
+    assert truncator.truncate(page, 100) == page[:100]
+    assert tokenizer.encoded < 2 * len(page.splitlines()[0]) + 50
+
+
+PAGE = (
+    "Tab 0 (current): Orders\n\n"
+    "[1] RootWebArea 'Orders' focused: True\n"
+    + "".join(f"\t[{i}] StaticText 'news {i}'\n" for i in range(10, 40))
+    + "\t[2] main ''\n"
+    "\t\t[3] heading 'My Orders'\n"
+    "\t\t\t[4] StaticText 'order 000178 total 65.32'\n"
+    "\t\t[5] link 'View order'"
+)
+
+
+def test_pack_keeps_relevant_nodes() -> None:
+    tokenizer = CharTokenizer()
+    truncator = ObservationTruncator(tokenizer)  # type: ignore[arg-type]
+    budgeter = TreeBudgeter(truncator)
+    obs_nodes_info = {
+        "1": {"union_bound": [0, 0, 1280, 720]},
+        "5": {"union_bound": [600, 300, 80, 20]},
+    }
+    packed = budgeter.pack(
+        PAGE, 250, "What is my latest order?", obs_nodes_info
+    )
+    lines = packed.splitlines()
+    assert len(packed) <= 250
+    assert lines[:3] == PAGE.splitlines()[:3]
+    # the section about the orders is kept with its ancestors, in order
+    assert lines[-4:] == PAGE.splitlines()[-4:]
+    assert "news 39" not in packed
+    assert budgeter.pack(PAGE, len(PAGE), "", {}) == PAGE
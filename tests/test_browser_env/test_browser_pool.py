@@ -0,0 +1,90 @@
+import json
+from pathlib import Path
+from typing import Any
+
+from browser_env.browser_pool import BrowserPool
+
+
+class FakeContext:
+    def __init__(self, **kwargs: Any) -> None:
+        self.kwargs = kwargs
+        self.added_cookies: list[Any] = []
+        self.geolocation: Any = None
+        self.closed = False
+
+    def add_cookies(self, cookies: list[Any]) -> None:
+        self.added_cookies.extend(cookies)
+
+    def set_geolocation(self, geolocation: Any) -> None:
+        self.geolocation = geolocation
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self) -> None:
+        self.contexts: list[FakeContext] = []
+
+    def is_connected(self) -> bool:
+        return True
+
+    def new_context(self, **kwargs: Any) -> FakeContext:
+        context = FakeContext(**kwargs)
+        self.contexts.append(context)
+        return context
+
+
+class FakeBrowserPool(BrowserPool):
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.launches = 0
+
+    def launch(self) -> Any:
+        self.launches += 1
+        self.browser = FakeBrowser()  # type: ignore[assignment]
+        self.served_tasks = 0
+        self.fill()
+        return self.browser
+
+    def close(self) -> None:
+        self.warm_contexts = []
+        self.browser = None
+
+
+def test_warm_context_per_task(tmp_path: Path) -> None:
+    storage_state = tmp_path / "state.json"
+    storage_state.write_text(
+        json.dumps({"cookies": [{"name": "session"}], "origins": []})
+    )
+    pool = FakeBrowserPool(pool_size=1, recycle_after=0)
+
+    first = pool.new_context(str(storage_state), {"latitude": 1.0})
+    assert pool.launches == 1
+    assert first.added_cookies == [{"name": "session"}]  # type: ignore[attr-defined]
+    assert first.geolocation == {"latitude": 1.0}  # type: ignore[attr-defined]
+
+    pool.release(first)
+    assert first.closed  # type: ignore[attr-defined]
+    second = pool.new_context()
+    assert second is not first
+    assert second.added_cookies == []  # type: ignore[attr-defined]
+    assert pool.launches == 1
+
+
+def test_local_storage_needs_new_context(tmp_path: Path) -> None:
+    storage_state = tmp_path / "state.json"
+    storage_state.write_text(
+        json.dumps({"cookies": [], "origins": [{"origin": "http://a"}]})
+    )
+    pool = FakeBrowserPool(pool_size=1, recycle_after=0)
+    context = pool.new_context(str(storage_state))
+    assert context.kwargs["storage_state"] == str(storage_state)  # type: ignore[attr-defined]
+    assert len(pool.warm_contexts) == 1
+
+
+def test_recycle_after_tasks() -> None:
+    pool = FakeBrowserPool(recycle_after=2)
+    for _ in range(4):
+        pool.release(pool.new_context())
+    assert pool.launches == 2
@@ -0,0 +1,28 @@
+from pathlib import Path
+
+from browser_env.chunk_store import ChunkStore, split_chunks
+
+TREE = "".join(f"\t[{i}] link 'item {i}'\n" for i in range(2000))
+
+
+def test_split_on_lines() -> None:
+    for text in [TREE, TREE + "\t[1] last line", "", "one line"]:
+        chunks = split_chunks(text)
+        assert "".join(chunks) == text
+        assert all(chunk.endswith("\n") for chunk in chunks[:-1])
+    assert 20 < len(split_chunks(TREE)) < 200
+
+
+def test_dedup_across_steps(tmp_path: Path) -> None:
+    store = ChunkStore(tmp_path / "chunks.sqlite")
+    steps = [TREE.replace("'item 1000'", f"'item {i}'") for i in range(10)]
+    hashes = store.put_many(steps)
+    assert [store.join(h) for h in hashes] == steps
+    one_step = store.size()
+    assert one_step < len(TREE) / 2
+
+    # an edit only adds the chunk around it
+    store.put_many([step.replace("item 5'", "moved'") for step in steps])
+    assert store.size() < 2 * one_step
+    found = store.find(["[1000] link 'item 7'"])
+    assert len(found & set(hashes[7])) == 1
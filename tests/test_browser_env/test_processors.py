@@ -0,0 +1,590 @@
+import base64
+import copy
+import importlib.util
+import io
+import random
+from pathlib import Path
+from typing import Any
+
+import pytest
+from PIL import Image
+
+from browser_env import replay
+from browser_env.processors import (
+    BROWSER_STATE_JS,
+    ImageObservationProcessor,
+    ObservationHandler,
+    TextObervationProcessor,
+    get_observation_delta,
+    remove_nodes_from_tree,
+)
+from browser_env.utils import BrowserConfig, BrowserInfo
+
+# the scripts are not a package, the benchmark is loaded from its file
+_spec = importlib.util.spec_from_file_location(
+    "benchmark_processors",
+    Path(__file__).parents[2] / "scripts" / "benchmark_processors.py",
+)
+assert _spec is not None and _spec.loader is not None
+benchmark_processors = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(benchmark_processors)
+legacy_remove_nodes = benchmark_processors.legacy_remove_nodes
+
+
+class FakeCDPSession:
+    """Answer the CDP commands used by the processors from fixed payloads"""
+
+    def __init__(self, responses: dict[str, Any]) -> None:
+        self.responses = responses
+        self.calls: list[str] = []
+        self.handlers: dict[str, list[Any]] = {}
+
+    def send(self, method: str, params: Any = None) -> Any:
+        self.calls.append(method)
+        if method not in self.responses:
+            raise RuntimeError(f"Unexpected CDP command {method}")
+        return self.responses[method]
+
+    def on(self, event: str, handler: Any) -> None:
+        self.handlers.setdefault(event, []).append(handler)
+
+    def emit(self, event: str) -> None:
+        for handler in self.handlers.get(event, []):
+            handler({})
+
+
+def make_config(win_left_bound: float, win_top_bound: float) -> BrowserConfig:
+    return {
+        "win_top_bound": win_top_bound,
+        "win_left_bound": win_left_bound,
+        "win_width": 1280,
+        "win_height": 720,
+        "win_right_bound": win_left_bound + 1280,
+        "win_lower_bound": win_top_bound + 720,
+        "device_pixel_ratio": 1.0,
+    }
+
+
+def make_browser_info(win_top_bound: float = 0.0) -> BrowserInfo:
+    # html > body > (button, hidden div, text)
+    nodes = {
+        "backendNodeId": [1, 2, 3, 4, 5, 6],
+        "parentIndex": [-1, 0, 1, 2, 2, 2],
+        "nodeType": [9, 1, 1, 1, 1, 3],
+        "nodeName": [0, 1, 2, 3, 4, 5],
+        "nodeValue": [-1, -1, -1, -1, -1, 6],
+        "attributes": [[], [], [], [7, 8], [], []],
+    }
+    layout = {
+        "nodeIndex": [0, 2, 3, 5],
+        "bounds": [
+            [0.0, 0.0, 1280.0, 2000.0],
+            [0.0, 0.0, 1280.0, 2000.0],
+            [10.0, 1000.0, 100.0, 20.0],
+            [10.0, 100.0, 50.0, 16.0],
+        ],
+    }
+    return {
+        "DOMTree": {
+            "documents": [
+                {"documentURL": 9, "nodes": nodes, "layout": layout}
+            ],
+            "strings": [
+                "#document",
+                "HTML",
+                "BODY",
+                "BUTTON",
+                "DIV",
+                "#text",
+                "hello",
+                "id",
+                "submit",
+                "http://localhost/",
+            ],
+        },
+        "config": make_config(0.0, win_top_bound),
+    }
+
+
+def make_accessibility_tree() -> list[dict[str, Any]]:
+    return [
+        {
+            "nodeId": "1",
+            "role": {"value": "RootWebArea"},
+            "name": {"value": "page"},
+            "childIds": ["2", "3", "4"],
+            "backendDOMNodeId": 1,
+        },
+        {
+            "nodeId": "2",
+            "parentId": "1",
+            "role": {"value": "button"},
+            "name": {"value": "Submit"},
+            "childIds": [],
+            "backendDOMNodeId": 4,
+        },
+        {
+            "nodeId": "3",
+            "parentId": "1",
+            "role": {"value": "generic"},
+            "name": {"value": "hidden"},
+            "childIds": [],
+            "backendDOMNodeId": 5,
+        },
+        {
+            "nodeId": "4",
+            "parentId": "1",
+            "role": {"value": "StaticText"},
+            "name": {"value": "hello"},
+            "childIds": [],
+            "backendDOMNodeId": 6,
+        },
+    ]
+
+
+def test_accessibility_tree_bounds_from_snapshot() -> None:
+    client = FakeCDPSession(
+        {"Accessibility.getFullAXTree": {"nodes": make_accessibility_tree()}}
+    )
+    processor = TextObervationProcessor(
+        "accessibility_tree", False, {"width": 1280, "height": 720}
+    )
+    tree = processor.fetch_page_accessibility_tree(
+        make_browser_info(win_top_bound=900.0),
+        client,  # type: ignore[arg-type]
+        current_viewport_only=False,
+    )
+    bounds = {node["nodeId"]: node["union_bound"] for node in tree}
+    assert bounds == {
+        "1": [0.0, 0.0, 10.0, 10.0],
+        "2": [10.0, 100.0, 100.0, 20.0],
+        "3": [0.0, 0.0, 0.0, 0.0],
+        "4": [10.0, -800.0, 50.0, 16.0],
+    }
+    assert client.calls == ["Accessibility.getFullAXTree"]
+
+
+def test_bounds_union_of_layout_fragments() -> None:
+    info = make_browser_info(win_top_bound=900.0)
+    layout = info["DOMTree"]["documents"][0]["layout"]
+    # the button wraps over two lines, one layout object per line
+    layout["nodeIndex"].append(3)
+    layout["bounds"].append([0.0, 1020.0, 40.0, 20.0])
+    client = FakeCDPSession(
+        {"Accessibility.getFullAXTree": {"nodes": make_accessibility_tree()}}
+    )
+    processor = TextObervationProcessor(
+        "accessibility_tree", False, {"width": 1280, "height": 720}
+    )
+    tree = processor.fetch_page_accessibility_tree(
+        info,
+        client,  # type: ignore[arg-type]
+        current_viewport_only=False,
+    )
+    bounds = {node["nodeId"]: node["union_bound"] for node in tree}
+    assert bounds["2"] == [0.0, 100.0, 110.0, 40.0]
+
+
+def test_accessibility_tree_viewport_with_snapshot_bounds() -> None:
+    client = FakeCDPSession(
+        {"Accessibility.getFullAXTree": {"nodes": make_accessibility_tree()}}
+    )
+    processor = TextObervationProcessor(
+        "accessibility_tree", True, {"width": 1280, "height": 720}
+    )
+    tree = processor.fetch_page_accessibility_tree(
+        make_browser_info(win_top_bound=900.0),
+        client,  # type: ignore[arg-type]
+        current_viewport_only=True,
+    )
+    content, _ = processor.parse_accessibility_tree(tree)
+    assert content == "[1] RootWebArea 'page'\n\t[2] button 'Submit'"
+
+
+def test_html_bounds_from_snapshot() -> None:
+    client = FakeCDPSession({})
+    processor = TextObervationProcessor(
+        "html", False, {"width": 1280, "height": 720}
+    )
+    dom_tree = processor.fetch_page_html(
+        make_browser_info(win_top_bound=900.0),
+        None,  # type: ignore[arg-type]
+        client,  # type: ignore[arg-type]
+        current_viewport_only=False,
+    )
+    bounds = [node["union_bound"] for node in dom_tree]
+    assert bounds == [
+        [0.0, 0.0, 10.0, 10.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [0.0, -900.0, 1280.0, 2000.0],
+        [10.0, 100.0, 100.0, 20.0],
+        [0.0, 0.0, 0.0, 0.0],
+        [10.0, -800.0, 50.0, 16.0],
+    ]
+    assert client.calls == []
+
+    content, _ = processor.parse_html(dom_tree)
+    assert content == '[3] <BUTTON id="submit"> \n[5] <#text> hello\n'
+
+
+def test_incremental_accessibility_tree_reuse() -> None:
+    client = FakeCDPSession(
+        {"Accessibility.getFullAXTree": {"nodes": make_accessibility_tree()}}
+    )
+    processor = TextObervationProcessor(
+        "accessibility_tree",
+        False,
+        {"width": 1280, "height": 720},
+        incremental=True,
+    )
+
+    def fetch(info: BrowserInfo) -> list[dict[str, Any]]:
+        return processor.fetch_page_accessibility_tree(  # type: ignore[return-value]
+            info, client, current_viewport_only=False  # type: ignore[arg-type]
+        )
+
+    first = fetch(make_browser_info())
+    # same page, the cached tree is reused and left untouched
+    second = fetch(make_browser_info())
+    assert second == first
+    assert client.calls == ["Accessibility.getFullAXTree"]
+    assert processor.cached_accessibility_tree == make_accessibility_tree()
+
+    # the browser reported an accessibility change
+    client.emit("Accessibility.nodesUpdated")
+    fetch(make_browser_info())
+    assert client.calls == ["Accessibility.getFullAXTree"] * 2
+
+    # the DOM changed without any accessibility event
+    info = make_browser_info()
+    info["DOMTree"]["strings"][6] = "bye"
+    fetch(info)
+    assert client.calls == ["Accessibility.getFullAXTree"] * 3
+
+
+def test_observation_delta() -> None:
+    prev = "[1] RootWebArea 'page'\n\t[2] button 'Submit'\n\t[3] link 'a'"
+    cur = "[1] RootWebArea 'page'\n\t[2] button 'Sent'\n\t[4] link 'b'"
+    assert get_observation_delta(prev, cur) == (
+        "~ [2] button 'Sent'\n+ [4] link 'b'\n- [3]"
+    )
+    assert get_observation_delta(cur, cur) == ""
+
+
+class FakePage:
+    def __init__(self, url: str, evaluations: dict[str, Any]) -> None:
+        self.url = url
+        self.evaluations = evaluations
+        self.context = self
+        self.pages = [self]
+        self.screenshots = 0
+
+    def evaluate(self, expression: str) -> Any:
+        return self.evaluations[expression]
+
+    def title(self) -> str:
+        return "Page"
+
+    def screenshot(self) -> bytes:
+        self.screenshots += 1
+        image = Image.new("RGB", (4, 2))
+        byte_io = io.BytesIO()
+        image.save(byte_io, format="PNG")
+        return byte_io.getvalue()
+
+
+def make_page_and_client(
+    info: BrowserInfo,
+) -> tuple[FakePage, FakeCDPSession]:
+    config = info["config"]
+    page = FakePage(
+        "http://localhost/",
+        {
+            BROWSER_STATE_JS: {
+                "win_top_bound": config["win_top_bound"],
+                "win_left_bound": config["win_left_bound"],
+                "win_width": config["win_width"],
+                "win_height": config["win_height"],
+                "device_pixel_ratio": config["device_pixel_ratio"],
+                "url": "http://localhost/",
+                "title": "Page",
+                "scroll_width": 1280,
+                "scroll_height": 2000,
+            }
+        },
+    )
+    client = FakeCDPSession(
+        {
+            "DOMSnapshot.captureSnapshot": info["DOMTree"],
+            "Accessibility.getFullAXTree": {
+                "nodes": make_accessibility_tree()
+            },
+        }
+    )
+    return page, client
+
+
+def test_screenshot_only_when_needed() -> None:
+    page, client = make_page_and_client(make_browser_info())
+    handler = ObservationHandler(
+        "text",
+        "accessibility_tree",
+        "",
+        False,
+        {"width": 1280, "height": 720},
+        capture_screenshot=False,
+    )
+    obs = handler.get_observation(page, client)  # type: ignore[arg-type]
+    assert page.screenshots == 0
+    assert obs["image"].size == 0  # type: ignore[union-attr]
+
+    handler.capture_screenshot = True
+    obs = handler.get_observation(page, client)  # type: ignore[arg-type]
+    assert page.screenshots == 1
+    assert obs["image"].shape == (2, 4, 3)  # type: ignore[union-attr]
+
+
+def test_encoded_screenshot_kept() -> None:
+    page, client = make_page_and_client(make_browser_info())
+    byte_io = io.BytesIO()
+    Image.new("RGB", (4, 2)).save(byte_io, format="JPEG")
+    data = base64.b64encode(byte_io.getvalue()).decode("utf-8")
+    client.responses["Page.captureScreenshot"] = {"data": data}
+
+    processor = ImageObservationProcessor(
+        "image", screenshot_format="jpeg", decode=False
+    )
+    screenshot = processor.process(page, client)  # type: ignore[arg-type]
+    assert screenshot.size == 0 and page.screenshots == 0
+    assert processor.meta_data["screenshot"] == (
+        f"data:image/jpeg;base64,{data}"
+    )
+
+    processor.decode = True
+    screenshot = processor.process(page, client)  # type: ignore[arg-type]
+    assert screenshot.shape == (2, 4, 3)
+
+
+class FakeAsyncPage:
+    def __init__(self, page: FakePage) -> None:
+        self.page = page
+        self.url = page.url
+        self.context = self
+        self.pages = [self]
+
+    async def evaluate(self, expression: str) -> Any:
+        return self.page.evaluate(expression)
+
+    async def title(self) -> str:
+        return self.page.title()
+
+
+class FakeAsyncCDPSession:
+    def __init__(self, client: FakeCDPSession) -> None:
+        self.client = client
+        self.calls = client.calls
+
+    async def send(self, method: str, params: Any = None) -> Any:
+        return self.client.send(method, params)
+
+    def on(self, event: str, handler: Any) -> None:
+        self.client.on(event, handler)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("observation_type", ["html", "accessibility_tree"])
+async def test_async_observation_matches_sync(observation_type: str) -> None:
+    info = make_browser_info(win_top_bound=900.0)
+    page, client = make_page_and_client(copy.deepcopy(info))
+    async_page = FakeAsyncPage(FakePage(page.url, page.evaluations))
+    async_client = FakeAsyncCDPSession(
+        FakeCDPSession(copy.deepcopy(client.responses))
+    )
+
+    processor = TextObervationProcessor(
+        observation_type, True, {"width": 1280, "height": 720}
+    )
+    content = processor.process(page, client)  # type: ignore[arg-type]
+    meta_data = copy.deepcopy(processor.meta_data)
+    async_content = await processor.aprocess(
+        async_page, async_client  # type: ignore[arg-type]
+    )
+    assert async_content == content
+    assert processor.meta_data == meta_data
+    assert async_client.calls == client.calls
+
+
+def test_record_and_replay(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(replay, "get_page_type", lambda url: "shopping")
+    page, client = make_page_and_client(make_browser_info(900.0))
+    processor = TextObervationProcessor(
+        "accessibility_tree", True, {"width": 1280, "height": 720}
+    )
+    recorder = replay.ObservationRecorder(tmp_path)
+    content = recorder.record(
+        processor, page, client  # type: ignore[arg-type]
+    )
+    assert content == (
+        "Tab 0 (current): Page\n\n"
+        "[1] RootWebArea 'page'\n\t[2] button 'Submit'"
+    )
+    assert processor.meta_data["round_trips"] == {
+        "DOMSnapshot.captureSnapshot": 1,
+        "page.evaluate": 1,
+        "Accessibility.getFullAXTree": 1,
+    }
+
+    corpus = replay.load_corpus(tmp_path)
+    assert list(corpus) == ["shopping"]
+    (step,) = corpus["shopping"]
+    replayed = processor.process(
+        replay.ReplayPage(step),  # type: ignore[arg-type]
+        replay.ReplayCDPSession(step),  # type: ignore[arg-type]
+    )
+    assert replayed == content
+
+
+def make_random_tree(rng: random.Random, size: int) -> list[dict[str, Any]]:
+    tree: list[dict[str, Any]] = [
+        {"nodeId": "0", "parentId": "-1", "childIds": []}
+    ]
+    for idx in range(1, size):
+        # favour recent nodes to get both deep and wide subtrees
+        parent = tree[rng.randint(max(0, idx - 20), idx - 1)]
+        tree.append(
+            {"nodeId": str(idx), "parentId": parent["nodeId"], "childIds": []}
+        )
+        parent["childIds"].append(str(idx))
+    # the order of the nodes should not matter
+    root, rest = tree[0], tree[1:]
+    rng.shuffle(rest)
+    return [root] + rest
+
+
+def test_remove_nodes_from_tree_matches_splicing() -> None:
+    rng = random.Random(0)
+    for _ in range(50):
+        tree = make_random_tree(rng, rng.randint(1, 300))
+        removed_ids = {
+            node["nodeId"]
+            for node in tree[1:]
+            if rng.random() < rng.choice([0.1, 0.5, 0.9])
+        }
+        expected = legacy_remove_nodes(copy.deepcopy(tree), removed_ids)
+        pruned = remove_nodes_from_tree(
+            copy.deepcopy(tree), removed_ids  # type: ignore[type-var]
+        )
+        assert pruned == expected
+
+
+def test_parse_accessibility_tree_layout() -> None:
+    tree: list[dict[str, Any]] = [
+        {
+            "nodeId": "1",
+            "role": {"value": "RootWebArea"},
+            "name": {"value": "page"},
+            "childIds": ["2", "5", "404"],
+            "backendDOMNodeId": 1,
+            "union_bound": None,
+        },
+        # empty generic node, its children keep the depth of the parent
+        {
+            "nodeId": "2",
+            "role": {"value": "generic"},
+            "name": {"value": ""},
+            "childIds": ["3", "4"],
+            "backendDOMNodeId": 2,
+            "union_bound": None,
+        },
+        {
+            "nodeId": "3",
+            "role": {"value": "link"},
+            "name": {"value": "Home"},
+            "properties": [
+                {"name": "focusable", "value": {"value": True}},
+                {"name": "expanded", "value": {"value": False}},
+            ],
+            "childIds": [],
+            "backendDOMNodeId": 3,
+            "union_bound": None,
+        },
+        # no backend node, the line is kept but not the node info
+        {
+            "nodeId": "4",
+            "role": {"value": "button"},
+            "name": {"value": "Go"},
+            "childIds": ["6"],
+            "union_bound": None,
+        },
+        {
+            "nodeId": "5",
+            "role": {"value": "StaticText"},
+            "name": {"value": "bye"},
+            "childIds": [],
+            "backendDOMNodeId": 5,
+            "union_bound": None,
+        },
+        {
+            "nodeId": "6",
+            "role": {"value": "StaticText"},
+            "name": {"value": "Go"},
+            "childIds": [],
+            "backendDOMNodeId": 6,
+            "union_bound": None,
+        },
+    ]
+    content, obs_nodes_info = TextObervationProcessor.parse_accessibility_tree(
+        tree  # type: ignore[arg-type]
+    )
+    assert content == (
+        "[1] RootWebArea 'page'\n"
+        "\t[3] link 'Home' expanded: False\n"
+        "\t[4] button 'Go'\n"
+        "\t[6] StaticText 'Go'\n"
+        "\t[5] StaticText 'bye'"
+    )
+    assert list(obs_nodes_info) == ["1", "3", "6", "5"]
+
+
+def test_parse_deep_trees() -> None:
+    depth = 5000
+    accessibility_tree = [
+        {
+            "nodeId": str(idx),
+            "role": {"value": "group"},
+            "name": {"value": f"g{idx}"},
+            "childIds": [str(idx + 1)] if idx + 1 < depth else [],
+            "backendDOMNodeId": idx,
+            "union_bound": None,
+        }
+        for idx in range(depth)
+    ]
+    content, obs_nodes_info = TextObervationProcessor.parse_accessibility_tree(
+        accessibility_tree  # type: ignore[arg-type]
+    )
+    lines = content.split("\n")
+    assert len(lines) == depth == len(obs_nodes_info)
+    assert (
+        lines[-1] == "\t" * (depth - 1) + f"[{depth - 1}] group 'g{depth - 1}'"
+    )
+
+    dom_tree = [
+        {
+            "nodeId": str(idx),
+            "nodeName": "DIV",
+            "nodeValue": "",
+            "attributes": f'id="d{idx}"',
+            "backendNodeId": str(idx),
+            "childIds": [str(idx + 1)] if idx + 1 < depth else [],
+            "union_bound": None,
+        }
+        for idx in range(depth)
+    ]
+    html, obs_nodes_info = TextObervationProcessor.parse_html(
+        dom_tree  # type: ignore[arg-type]
+    )
+    lines = html.split("\n")
+    assert len(lines) == depth + 1 and lines[-1] == ""
+    assert len(obs_nodes_info) == depth
@@ -0,0 +1,102 @@
+"""Benchmark the text observation processor on the recorded replay corpus.
+
+The corpus is recorded with `ScriptBrowserEnv(observation_record_dir=...)`
+and read from $WEBARENA_REPLAY_CORPUS (default: tests/replay_corpus), the
+page types without recorded steps are skipped.
+
+pytest tests/test_browser_env/test_processors_benchmark.py \
+    --benchmark-columns=median,mean,rounds
+"""
+import itertools
+import os
+import tracemalloc
+from pathlib import Path
+from typing import Any, Sequence
+
+import pytest
+
+from browser_env.processors import TextObervationProcessor
+from browser_env.replay import (
+    PAGE_TYPES,
+    ReplayCDPSession,
+    ReplayPage,
+    ReplayStep,
+    load_corpus,
+)
+
+pytest.importorskip("pytest_benchmark")
+
+CORPUS_DIR = Path(
+    os.environ.get("WEBARENA_REPLAY_CORPUS", "tests/replay_corpus")
+)
+ROUNDS_PER_STEP = 5
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(q * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def make_processor(step: ReplayStep) -> TextObervationProcessor:
+    return TextObervationProcessor(
+        step["observation_type"],
+        step["current_viewport_only"],
+        step["viewport_size"],
+    )
+
+
+def measure_peak_memory(step: ReplayStep) -> int:
+    processor = make_processor(step)
+    page, client = ReplayPage(step), ReplayCDPSession(step)
+    tracemalloc.start()
+    processor.process(page, client)  # type: ignore[arg-type]
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+@pytest.fixture(scope="module")
+def corpus() -> dict[str, list[ReplayStep]]:
+    if not CORPUS_DIR.is_dir():
+        pytest.skip(f"No replay corpus at {CORPUS_DIR}")
+    return load_corpus(CORPUS_DIR)
+
+
+@pytest.mark.parametrize("page_type", PAGE_TYPES)
+def test_text_observation(
+    benchmark: Any, corpus: dict[str, list[ReplayStep]], page_type: str
+) -> None:
+    steps = corpus.get(page_type, [])
+    if not steps:
+        pytest.skip(f"No recorded {page_type} steps")
+
+    # the replays are prepared outside of the timed calls
+    replays = itertools.cycle(steps)
+
+    def setup() -> tuple[tuple[Any, ...], dict[str, Any]]:
+        step = next(replays)
+        return (
+            make_processor(step),
+            ReplayPage(step),
+            ReplayCDPSession(step),
+        ), {}
+
+    benchmark.pedantic(
+        lambda processor, page, client: processor.process(page, client),
+        setup=setup,
+        rounds=len(steps) * ROUNDS_PER_STEP,
+    )
+
+    timings = benchmark.stats.stats.data
+    peaks = [measure_peak_memory(step) for step in steps]
+    benchmark.extra_info.update(
+        {
+            "steps": len(steps),
+            "p50_ms": percentile(timings, 0.5) * 1000,
+            "p95_ms": percentile(timings, 0.95) * 1000,
+            "peak_memory_p50_mb": percentile(peaks, 0.5) / 2**20,
+            "peak_memory_p95_mb": percentile(peaks, 0.95) / 2**20,
+        }
+    )
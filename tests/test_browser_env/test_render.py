@@ -0,0 +1,85 @@
+import base64
+import json
+from pathlib import Path
+
+import numpy as np
+
+from browser_env import DetachedPage, create_id_based_action
+from browser_env.helper_functions import RenderHelper
+
+
+def test_render_appends_steps(tmp_path: Path) -> None:
+    config_file = tmp_path / "0.json"
+    config_file.write_text(json.dumps({"task_id": 0, "intent": "buy"}))
+    render_helper = RenderHelper(
+        str(config_file),
+        str(tmp_path),
+        "id_accessibility_tree",
+        screenshot_files=True,
+    )
+    render_file = tmp_path / "render_0.html"
+    screenshot = base64.b64encode(b"fake png").decode()
+    sizes = []
+    for step in range(3):
+        state_info = {
+            "observation": {"text": f"[1] RootWebArea 'step {step}'"},
+            "info": {
+                "page": DetachedPage("http://localhost", ""),
+                "observation_metadata": {
+                    "text": {"obs_nodes_info": {}},
+                    "image": {
+                        "screenshot": f"data:image/png;base64,{screenshot}"
+                    },
+                },
+            },
+        }
+        render_helper.render(
+            create_id_based_action("click [1]"),
+            state_info,  # type: ignore[arg-type]
+            {"action_history": ["None"]},
+            render_screenshot=True,
+        )
+        sizes.append(render_file.stat().st_size)
+    render_helper.close()
+
+    # every step adds about as much as the previous one
+    assert sizes[2] - sizes[1] == sizes[1] - sizes[0]
+    html = render_file.read_text()
+    assert html.count("<h2>New Page</h2>") == 3
+    assert html.rstrip().endswith("</html>")
+    assert "base64" not in html
+    assert "src='render_0/step_2.png'" in html
+    assert (tmp_path / "render_0" / "step_2.png").read_bytes() == b"fake png"
+
+
+def test_render_inlines_screenshots(tmp_path: Path) -> None:
+    config_file = tmp_path / "0.json"
+    config_file.write_text(json.dumps({"task_id": 0, "intent": "buy"}))
+    render_helper = RenderHelper(
+        str(config_file), str(tmp_path), "id_accessibility_tree"
+    )
+    state_info = {
+        "observation": {
+            "text": "[1] RootWebArea 'page'",
+            "image": np.zeros((2, 2, 3), dtype=np.uint8),
+        },
+        "info": {
+            "page": DetachedPage("http://localhost", ""),
+            "observation_metadata": {
+                "text": {"obs_nodes_info": {}},
+                "image": {"screenshot": ""},
+            },
+        },
+    }
+    image_path = render_helper.render(
+        create_id_based_action("click [1]"),
+        state_info,  # type: ignore[arg-type]
+        {"action_history": ["None"]},
+        render_screenshot=True,
+    )
+    render_helper.close()
+
+    assert image_path is None
+    assert not (tmp_path / "render_0").exists()
+    html = (tmp_path / "render_0.html").read_text()
+    assert "<img src='data:image/png;base64," in html
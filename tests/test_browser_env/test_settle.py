@@ -0,0 +1,119 @@
+import asyncio
+from typing import Any, Callable
+
+import pytest
+
+from browser_env import settle
+from browser_env.settle import (
+    NetworkTracker,
+    async_wait_for_settled,
+    wait_for_settled,
+)
+
+
+class FakeContext:
+    def __init__(self) -> None:
+        self.handlers: dict[str, Callable[[Any], None]] = {}
+
+    def on(self, event: str, handler: Callable[[Any], None]) -> None:
+        self.handlers[event] = handler
+
+
+class FakeRequest:
+    def __init__(self, resource_type: str = "xhr") -> None:
+        self.resource_type = resource_type
+
+
+class FakePage:
+    """Finish the pending request after a few polls"""
+
+    def __init__(self, context: FakeContext, request: FakeRequest) -> None:
+        self.context = context
+        self.request = request
+        self.polls = 0
+        self.dom_waits: list[Any] = []
+
+    def wait_for_load_state(self, state: str, timeout: float) -> None:
+        pass
+
+    def wait_for_timeout(self, timeout: float) -> None:
+        self.polls += 1
+        if self.polls == 3:
+            self.context.handlers["requestfinished"](self.request)
+
+    def evaluate(self, expression: str, arg: Any) -> float:
+        self.dom_waits.append(arg)
+        return 0.0
+
+
+class FakeAsyncPage:
+    def __init__(self) -> None:
+        self.dom_waits: list[Any] = []
+
+    async def wait_for_load_state(self, state: str, timeout: float) -> None:
+        pass
+
+    async def evaluate(self, expression: str, arg: Any) -> float:
+        self.dom_waits.append(arg)
+        return 0.0
+
+
+def test_network_tracker_idle() -> None:
+    context = FakeContext()
+    tracker = NetworkTracker(context)  # type: ignore[arg-type]
+    request = FakeRequest()
+    context.handlers["request"](request)
+    context.handlers["request"](FakeRequest("websocket"))
+    assert not tracker.is_idle(0.0)
+    context.handlers["requestfailed"](request)
+    assert tracker.is_idle(0.0)
+    assert not tracker.is_idle(60.0)
+
+
+def test_wait_for_settled() -> None:
+    context = FakeContext()
+    tracker = NetworkTracker(context)  # type: ignore[arg-type]
+    request = FakeRequest()
+    context.handlers["request"](request)
+    page = FakePage(context, request)
+
+    timings = wait_for_settled(
+        page, tracker, timeout=5.0, quiet_window=0.0  # type: ignore[arg-type]
+    )
+    assert page.polls == 3
+    assert len(page.dom_waits) == 1 and page.dom_waits[0][0] == 0.0
+    assert timings["total"] < 5.0
+    assert timings["total"] >= timings["network"]
+
+
+def test_wait_for_settled_cap(monkeypatch: Any) -> None:
+    monkeypatch.setattr(settle, "STALE_REQUEST_AGE", 60.0)
+    context = FakeContext()
+    tracker = NetworkTracker(context)  # type: ignore[arg-type]
+    # the request never finishes
+    context.handlers["request"](FakeRequest())
+    page = FakePage(context, FakeRequest())
+
+    timings = wait_for_settled(
+        page, tracker, timeout=0.2, quiet_window=0.0  # type: ignore[arg-type]
+    )
+    assert 0.2 <= timings["total"] < 1.0
+
+
+@pytest.mark.asyncio
+async def test_async_wait_for_settled() -> None:
+    context = FakeContext()
+    tracker = NetworkTracker(context)  # type: ignore[arg-type]
+    request = FakeRequest()
+    context.handlers["request"](request)
+    page = FakeAsyncPage()
+
+    # the request finishes while the env is waiting
+    asyncio.get_running_loop().call_later(
+        0.1, context.handlers["requestfinished"], request
+    )
+    timings = await async_wait_for_settled(
+        page, tracker, timeout=5.0, quiet_window=0.0  # type: ignore[arg-type]
+    )
+    assert 0.1 <= timings["network"] < 5.0
+    assert len(page.dom_waits) == 1
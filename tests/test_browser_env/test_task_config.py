@@ -0,0 +1,61 @@
+import dataclasses
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from browser_env import (
+    TaskCatalog,
+    TaskConfig,
+    load_task_config,
+    open_catalog,
+)
+
+RAW_CONFIGS = "config_files/test.raw.json"
+
+
+def test_parse_once_and_frozen(tmp_path: Path) -> None:
+    with open(RAW_CONFIGS, "r") as f:
+        raw = json.load(f)[0]
+    config_file = tmp_path / "0.json"
+    config_file.write_text(json.dumps(raw))
+
+    config = load_task_config(config_file)
+    assert load_task_config(str(config_file)) is config
+    assert load_task_config(config) is config
+    assert config.task_id == 0
+    assert config.sites == ("shopping_admin",)
+    assert config["eval"]["eval_types"] == ("string_match",)
+    assert config.to_dict() == raw
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.intent = "other"  # type: ignore[misc]
+    with pytest.raises(TypeError):
+        config.eval["eval_types"] = ()  # type: ignore[index]
+
+    # parsed again once the file changes
+    config_file.write_text(json.dumps(raw | {"intent": "changed"}))
+    os.utime(config_file, ns=(0, 0))
+    assert load_task_config(config_file).intent == "changed"
+    renewed = config.with_storage_state("/tmp/state.json")
+    assert renewed.storage_state == "/tmp/state.json"
+    assert config.storage_state == "./.auth/shopping_admin_state.json"
+
+
+def test_catalog_lookup(tmp_path: Path) -> None:
+    catalog = TaskCatalog.from_json(RAW_CONFIGS, tmp_path / "test.catalog")
+    with open(RAW_CONFIGS, "r") as f:
+        raw = {config["task_id"]: config for config in json.load(f)}
+    assert len(catalog) == len(raw)
+    assert catalog.task_ids() == sorted(raw)
+    for task_id in [0, 1, 417, max(raw)]:
+        assert catalog.get(task_id) == TaskConfig.from_dict(raw[task_id])
+    assert catalog.get(417) is catalog.get(417)
+    assert -1 not in catalog
+    with pytest.raises(KeyError):
+        catalog.get(max(raw) + 1)
+    catalog.close()
+    # opened once per process, then shared
+    shared = open_catalog(tmp_path / "test.catalog")
+    assert open_catalog(str(tmp_path / "test.catalog")) is shared
+    assert shared.get(0) == TaskConfig.from_dict(raw[0])
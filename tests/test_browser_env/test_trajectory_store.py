@@ -0,0 +1,63 @@
+from pathlib import Path
+
+from browser_env import DetachedPage, create_id_based_action
+from browser_env.trajectory_store import (
+    TrajectoryRecorder,
+    TrajectoryStore,
+)
+
+
+def run_task(store: TrajectoryStore, task_id: int, score: float) -> None:
+    recorder = TrajectoryRecorder(
+        store, task_id, f"config_files/{task_id}.json"
+    )
+    for step in range(2):
+        state_info = {
+            "observation": {"text": f"[1] RootWebArea 'task {task_id}'"},
+            "info": {
+                "page": DetachedPage(f"http://localhost/{step}", ""),
+                "fail_error": "",
+                "settle_timings": None,
+            },
+        }
+        recorder.record(
+            create_id_based_action("click [1]"),
+            "click [1] where [1] is RootWebArea",
+            state_info,  # type: ignore[arg-type]
+            {"action_history": ["None"]},
+            llm_seconds=1.5,
+            env_seconds=0.5,
+        )
+    recorder.finish(score)
+
+
+def test_write_and_query(tmp_path: Path) -> None:
+    store = TrajectoryStore(tmp_path)
+    assert not store.exists()
+    assert store.scan(columns=["task_id"]).num_rows == 0
+    run_task(store, 3, 1.0)
+    run_task(store, 7, 0.0)
+    # the line of a worker killed while writing the index
+    with open(store.index_path, "a") as f:
+        f.write('{"task_id": 9, "conf')
+
+    store = TrajectoryStore(tmp_path)
+    assert store.finished_task_ids() == {3, 7}
+    rows = store.read(3)
+    assert [row["step"] for row in rows] == [0, 1]
+    assert rows[1]["url"] == "http://localhost/1"
+    assert rows[0]["action_type"] == "CLICK"
+    assert rows[0]["element_id"] == "1"
+    assert rows[0]["score"] == 1.0
+
+    table = store.scan(columns=["task_id", "score"], task_ids=[7])
+    assert table.column_names == ["task_id", "score"]
+    assert table.to_pylist() == [{"task_id": 7, "score": 0.0}] * 2
+
+    assert store.find(["task 7"]) == {7}
+    assert store.find(["task 7"], task_ids=[3]) == set()
+    assert store.scan(columns=["observation"]).num_rows == 4
+
+    store.remove([3])
+    assert store.finished_task_ids() == {7}
+    assert not (store.root / "task_3.parquet").exists()
@@ -9,7 +9,11 @@ import pytest
 from py import test
 
 from agent import Agent, TeacherForcingAgent
-from browser_env import ActionTypes, ScriptBrowserEnv
+from browser_env import (
+    ActionTypes,
+    AsyncScriptBrowserEnv,
+    ScriptBrowserEnv,
+)
 from browser_env.env_config import *
 from evaluation_harness import (
     HTMLContentEvaluator,
@@ -345,3 +349,39 @@ def test_func_url_func_page_success(
     )
     assert score == 1.0
     os.remove(tmp_config)
+
+
+@pytest.mark.asyncio
+async def test_html_content_url_comb_async_success(
+    async_script_browser_env: AsyncScriptBrowserEnv,
+) -> None:
+    """The async evaluation sees the form filled in the episode's page"""
+    config_file = f"{config_file_folder}/html_content_url_comb.json"
+
+    agent = TeacherForcingAgent()
+    agent.set_action_set_tag(tag="playwright")
+    action_seq = f"""page.goto("https://russmaxdesign.github.io/exercise/")
+    page.get_by_label("Full name").fill("Hello World")
+    page.get_by_label("Email").click()
+    page.get_by_label("Email").fill("alexisxy@hotmail.com")
+    page.stop()"""
+    agent.set_actions(action_seq)
+
+    env = async_script_browser_env
+    obs, info = await env.areset(options={"config_file": config_file})
+    trajectory: list[Any] = [{"observation": obs, "info": info}]
+    while True:
+        action = agent.next_action(
+            trajectory=trajectory, intent="", meta_data={}
+        )
+        trajectory.append(action)
+        if action["action_type"] == ActionTypes.STOP:
+            break
+        obs, _, _, _, info = await env.astep(action)
+        trajectory.append({"observation": obs, "info": info})
+
+    evaluators = EvaluatorComb([URLEvaluator(), HTMLContentEvaluator()])
+    score = await evaluators.acall(
+        trajectory, config_file, env.page, env.get_page_client(env.page)
+    )
+    assert score == 1.0
@@ -0,0 +1,77 @@
+import subprocess
+import sys
+from pathlib import Path
+
+from inference.ledger import TaskLedger
+from inference.utils import create_test_file_list
+
+
+def test_claim_and_finish(tmp_path: Path) -> None:
+    ledger = TaskLedger(tmp_path)
+    tasks = [f"config_files/{i}.json" for i in range(4)]
+    ledger.add(tasks)
+    assert ledger.claim(tasks[0])
+    # a task runs once at a time
+    assert not TaskLedger(tmp_path).claim(tasks[0])
+    assert ledger.finish(tasks[0], 1.0) == "done"
+    assert ledger.claim(tasks[1])
+    assert ledger.finish(tasks[1], None, "ValueError('boom')") == "errored"
+    assert ledger.claim(tasks[2])
+    assert (
+        ledger.finish(tasks[2], None, "openai.error.RateLimitError()")
+        == "rate_limited"
+    )
+    ledger.close()
+
+    ledger = TaskLedger(tmp_path)
+    ledger.add(tasks)
+    assert ledger.unfinished(tasks) == tasks[1:]
+    assert ledger.counts() == {
+        "done": 1,
+        "errored": 1,
+        "rate_limited": 1,
+        "pending": 1,
+    }
+    assert ledger.claim(tasks[1])
+    assert ledger.attempts(tasks[1]) == 2
+    ledger.reset([tasks[0]])
+    assert ledger.unfinished(tasks) == tasks
+
+
+def test_done_is_not_claimed(tmp_path: Path) -> None:
+    ledger = TaskLedger(tmp_path)
+    assert ledger.claim("config_files/0.json")
+    ledger.finish("config_files/0.json", 1.0)
+    assert not ledger.claim("config_files/0.json")
+    assert not TaskLedger(tmp_path).claim("config_files/0.json")
+    assert ledger.attempts("config_files/0.json") == 1
+    # until the task is marked to run again
+    ledger.reset(["config_files/0.json"])
+    assert ledger.claim("config_files/0.json")
+
+
+def test_claim_from_dead_process(tmp_path: Path) -> None:
+    script = (
+        "from inference.ledger import TaskLedger; "
+        f"TaskLedger({str(tmp_path)!r}).claim('config_files/0.json')"
+    )
+    subprocess.run([sys.executable, "-c", script], check=True)
+    ledger = TaskLedger(tmp_path)
+    assert ledger.counts() == {"running": 1}
+    assert ledger.claim("config_files/0.json")
+    assert ledger.attempts("config_files/0.json") == 2
+
+
+def test_resume_from_renders(tmp_path: Path) -> None:
+    (tmp_path / "render_1.html").write_text("")
+    result_dir = str(tmp_path)
+    assert create_test_file_list(0, 3, result_dir) == [
+        "config_files/0.json",
+        "config_files/2.json",
+    ]
+    ledger = TaskLedger(tmp_path)
+    ledger.claim("config_files/0.json")
+    ledger.finish("config_files/0.json", 0.0)
+    # the ledger is the record once it exists
+    (tmp_path / "render_1.html").unlink()
+    assert create_test_file_list(0, 3, result_dir) == ["config_files/2.json"]
@@ -0,0 +1,65 @@
+import json
+import os
+from multiprocessing.connection import Connection
+from pathlib import Path
+from types import SimpleNamespace
+from typing import cast
+
+from inference.config import WebArenaConfig
+from inference.ledger import TaskLedger
+from inference.runner import _serve, run_parallel
+
+
+def crashing_worker(
+    worker_id: int, config: WebArenaConfig, conn: Connection
+) -> None:
+    """Dies in the middle of the first run of the `crash` task"""
+    result_dir = Path(config.logging.result_dir)
+
+    def run(config_file: str) -> float:
+        marker = result_dir / f"{Path(config_file).stem}.crashed"
+        if "crash" in config_file and not marker.exists():
+            marker.touch()
+            os._exit(1)
+        return 1.0
+
+    _serve(worker_id, conn, run, str(result_dir))
+
+
+def test_task_of_killed_worker_runs_again(tmp_path: Path) -> None:
+    config_files = []
+    for task_id, name in enumerate(["first", "crash", "last"]):
+        config_file = tmp_path / f"{name}.json"
+        config_file.write_text(
+            json.dumps(
+                {
+                    "task_id": task_id,
+                    "intent": name,
+                    "sites": [name],
+                    "eval": {"eval_types": ["string_match"]},
+                }
+            )
+        )
+        config_files.append(str(config_file))
+    result_dir = tmp_path / "results"
+    result_dir.mkdir()
+    config = cast(
+        WebArenaConfig,
+        SimpleNamespace(
+            logging=SimpleNamespace(result_dir=str(result_dir)),
+            example=SimpleNamespace(task_catalog=""),
+            site_reset_command="",
+        ),
+    )
+
+    results = run_parallel(
+        config, config_files, num_workers=2, worker=crashing_worker
+    )
+
+    assert sorted(r.config_file for r in results) == sorted(config_files)
+    assert all(r.score == 1.0 for r in results)
+    (crashed,) = [r for r in results if "crash" in r.config_file]
+    assert crashed.attempts == 2
+    ledger = TaskLedger(result_dir)
+    assert ledger.counts() == {"done": 3}
+    assert ledger.attempts(config_files[1]) == 2
@@ -0,0 +1,94 @@
+import json
+from pathlib import Path
+
+from browser_env import TaskCatalog
+from inference.scheduler import SiteScheduler
+
+
+def write_task(
+    tmp_path: Path,
+    name: str,
+    sites: list[str],
+    eval_types: list[str],
+    require_reset: bool = False,
+) -> str:
+    config_file = tmp_path / f"{name}.json"
+    config_file.write_text(
+        json.dumps(
+            {
+                "task_id": len(list(tmp_path.iterdir())),
+                "intent": name,
+                "sites": sites,
+                "require_reset": require_reset,
+                "eval": {"eval_types": eval_types},
+            }
+        )
+    )
+    return str(config_file)
+
+
+def test_readers_share_and_go_first(tmp_path: Path) -> None:
+    edit = write_task(tmp_path, "edit", ["gitlab"], ["program_html"])
+    read = write_task(tmp_path, "read", ["gitlab"], ["string_match"])
+    other = write_task(tmp_path, "other", ["reddit"], ["url_match"])
+    read_again = write_task(tmp_path, "again", ["gitlab"], ["string_match"])
+    scheduler = SiteScheduler([edit, read, other, read_again])
+
+    assert scheduler.next_task() == read
+    assert scheduler.next_task() == other
+    assert scheduler.next_task() == read_again
+    # the edit waits for the reads of its site
+    assert scheduler.next_task() is None
+    scheduler.finish(read)
+    scheduler.finish(read_again)
+    assert scheduler.next_task() == edit
+    scheduler.finish(other)
+    scheduler.finish(edit)
+    assert scheduler.finished
+
+
+def test_writers_are_serialized_and_reset(tmp_path: Path) -> None:
+    first = write_task(
+        tmp_path, "first", ["shopping_admin"], ["program_html"], True
+    )
+    second = write_task(
+        tmp_path, "second", ["shopping_admin", "map"], ["program_html"]
+    )
+    read_map = write_task(tmp_path, "map", ["map"], ["string_match"])
+    resets: list[str] = []
+    scheduler = SiteScheduler([first, second, read_map], resets.append)
+
+    assert scheduler.next_task() == first
+    assert scheduler.next_task() == read_map
+    assert scheduler.next_task() is None
+    scheduler.finish(read_map)
+    assert scheduler.next_task() is None
+    scheduler.finish(first)
+    assert resets == ["shopping_admin"]
+    assert scheduler.next_task() == second
+    scheduler.finish(second)
+    assert resets == ["shopping_admin"]
+    assert scheduler.finished
+
+
+def test_load_from_catalog(tmp_path: Path) -> None:
+    configs = {
+        "0.json": {"task_id": 0, "sites": ["gitlab"], "eval": {}},
+        "1.json": {
+            "task_id": 1,
+            "sites": ["gitlab"],
+            "eval": {"eval_types": ["program_html"]},
+        },
+    }
+    catalog = TaskCatalog.compile(configs.values(), tmp_path / "catalog")
+    # the config files are never read
+    scheduler = SiteScheduler(
+        list(configs), load=lambda c: catalog.get(int(Path(c).stem))
+    )
+
+    assert scheduler.next_task() == "0.json"
+    assert scheduler.next_task() is None
+    scheduler.finish("0.json")
+    assert scheduler.next_task() == "1.json"
+    scheduler.finish("1.json")
+    assert scheduler.finished
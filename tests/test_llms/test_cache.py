@@ -0,0 +1,66 @@
+from pathlib import Path
+
+from llms import PromptCache, lm_config
+
+
+def make_config(temperature: float = 0) -> lm_config.LMConfig:
+    config = lm_config.LMConfig(
+        provider="openai", model="gpt-3.5-turbo", mode="chat"
+    )
+    config.gen_config.update(
+        {"temperature": temperature, "top_p": 1.0, "max_retry": 3}
+    )
+    return config
+
+
+def messages(content: str) -> list[dict[str, str]]:
+    return [{"role": "user", "content": content}]
+
+
+def test_hit_after_normalization(tmp_path: Path) -> None:
+    config = make_config()
+    cache = PromptCache(tmp_path / "cache.sqlite")
+    assert cache.get(config, messages("click it")) is None
+    cache.put(config, messages("click it"), "```click [1]```")
+    cache.close()
+
+    cache = PromptCache(tmp_path / "cache.sqlite")
+    assert cache.get(config, messages("click it \r\n")) == "```click [1]```"
+    assert cache.get(config, messages("click that")) is None
+    # the whitespace inside the prompt is part of it
+    assert cache.get(config, messages("click  it")) is None
+    # the retries do not change the response, the model does
+    retries = make_config()
+    retries.gen_config["max_retry"] = 1
+    retries.gen_config["obs_truncation"] = "structure"
+    assert cache.get(retries, messages("click it")) is not None
+    other_model = lm_config.LMConfig(
+        provider="openai",
+        model="gpt-4",
+        mode="chat",
+        gen_config=dict(config.gen_config),
+    )
+    assert cache.get(other_model, messages("click it")) is None
+    assert (cache.stats.hits, cache.stats.misses) == (2, 3)
+
+
+def test_sampled_calls_bypass(tmp_path: Path) -> None:
+    config = make_config(temperature=1.0)
+    cache = PromptCache(tmp_path / "cache.sqlite")
+    cache.put(config, "prompt", "response")
+    assert cache.get(config, "prompt") is None
+    assert len(cache) == 0
+    assert cache.stats.bypassed == 1
+
+
+def test_lru_eviction(tmp_path: Path) -> None:
+    config = make_config()
+    cache = PromptCache(tmp_path / "cache.sqlite", max_size_mb=25 / 2**20)
+    cache.put(config, "a", "x" * 10)
+    cache.put(config, "b", "x" * 10)
+    assert cache.get(config, "a") is not None
+    cache.put(config, "c", "x" * 10)
+    assert cache.get(config, "b") is None
+    assert cache.get(config, "a") is not None
+    assert cache.get(config, "c") is not None
+    assert cache.stats.evictions == 1
@@ -0,0 +1,89 @@
+import asyncio
+import time
+from typing import Any, AsyncGenerator, Callable
+
+import aiolimiter
+import openai.error
+import pytest
+
+from llms import LLMGateway, lm_config
+from llms.gateway import APIInput, TokenBucket
+
+# the openai errors have untyped constructors
+RateLimitError: Callable[[str], Exception] = openai.error.RateLimitError
+
+
+class CountingLimiter(aiolimiter.AsyncLimiter):
+    acquired = 0
+
+    async def acquire(self, amount: float = 1) -> None:
+        self.acquired += 1
+        await super().acquire(amount)
+
+
+class FakeTokenizer:
+    def encode(self, text: str) -> list[int]:
+        return [0] * len(text.split())
+
+
+class FakeGateway(LLMGateway):
+    def __init__(self, failures: int = 0, **kwargs: Any) -> None:
+        config = lm_config.LMConfig(
+            provider="openai", model="gpt-3.5-turbo", mode="chat"
+        )
+        config.gen_config["max_tokens"] = 10
+        super().__init__(config, FakeTokenizer(), **kwargs)  # type: ignore[arg-type]
+        self.failures = failures
+        self.requests = 0
+
+    def open(self) -> None:
+        if self.in_flight is None:
+            self.in_flight = asyncio.Semaphore(self.max_in_flight)
+
+    async def request(self, prompt: APIInput) -> AsyncGenerator[str, None]:
+        self.requests += 1
+        if self.requests <= self.failures:
+            raise RateLimitError("slow down")
+
+        async def chunks() -> AsyncGenerator[str, None]:
+            for chunk in ["click ", "[12] ", "done"]:
+                yield chunk
+
+        return chunks()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_waits_for_refill() -> None:
+    bucket = TokenBucket(per_minute=600)
+    await bucket.acquire(600)
+    start = time.monotonic()
+    await bucket.acquire(2)
+    assert time.monotonic() - start >= 0.15
+    bucket.give_back(10_000)
+    assert bucket.level == bucket.capacity
+
+
+@pytest.mark.asyncio
+async def test_gateway_streams_and_gives_back_tokens(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def no_sleep(delay: float) -> None:
+        pass
+
+    gateway = FakeGateway(failures=2, tokens_per_minute=1000)
+    limiter = gateway.limiter = CountingLimiter(1000)
+    monkeypatch.setattr("llms.gateway.asyncio.sleep", no_sleep)
+    assert await gateway.agenerate("hello there") == "click [12] done"
+    assert gateway.requests == 3
+    # each attempt is a request against the quotas
+    assert limiter.acquired == 3
+    # the 2 prompt tokens of each attempt and 3 completion tokens of the
+    # 10 reserved are spent
+    assert gateway.token_bucket is not None
+    assert 991 <= gateway.token_bucket.level < 994
+
+    # the consumer stops early, the reservation is still returned
+    stream = gateway.astream("hello")
+    assert await anext(stream) == "click "
+    await stream.aclose()
+    assert 988 <= gateway.token_bucket.level < 991
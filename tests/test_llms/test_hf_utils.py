@@ -0,0 +1,111 @@
+import json
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import pytest
+
+from llms.providers.hf_utils import TGIPool, make_parameters
+
+DETAILS = {
+    "finish_reason": "length",
+    "generated_tokens": 2,
+    "prefill": [],
+    "tokens": [],
+}
+
+
+class FakeTGIServer(ThreadingHTTPServer):
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), FakeTGIHandler)
+        self.prompts: list[str] = []
+
+
+class FakeTGIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: FakeTGIServer
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+    def send_body(self, body: bytes, content_type: str) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        self.send_body(b"", "text/plain")
+
+    def do_POST(self) -> None:
+        request = json.loads(
+            self.rfile.read(int(self.headers["Content-Length"]))
+        )
+        self.server.prompts.append(request["inputs"])
+        if not request["stream"]:
+            response = [{"generated_text": "done", "details": DETAILS}]
+            self.send_body(json.dumps(response).encode(), "application/json")
+            return
+        events = []
+        for idx, text in enumerate(["click ", "[12]", "</s>"]):
+            token = {
+                "id": idx,
+                "text": text,
+                "logprob": 0.0,
+                "special": text == "</s>",
+            }
+            events.append(f"data:{json.dumps({'token': token})}\n\n")
+        self.send_body("".join(events).encode(), "text/event-stream")
+
+
+@pytest.fixture
+def fake_tgi() -> Iterator[FakeTGIServer]:
+    server = FakeTGIServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def unused_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def test_failover_and_health_check(fake_tgi: FakeTGIServer) -> None:
+    url = f"http://127.0.0.1:{fake_tgi.server_address[1]}"
+    pool = TGIPool([unused_url(), url], retry_interval=0)
+    down, up = pool.endpoints
+    parameters = make_parameters(0.5, 0.9, 10)
+
+    assert pool.generate("a", parameters) == "done"
+    assert not down.healthy and up.healthy
+    # the healthy endpoint takes the requests, and the least busy one
+    up.outstanding = 5
+    assert pool.pick(set()) is up
+    up.outstanding = 0
+
+    down.url = url
+    assert pool.generate("b", parameters) == "done"
+    assert down.healthy
+    assert fake_tgi.prompts == ["a", "b"]
+
+    up.outstanding = 1
+    assert pool.pick(set()) is down
+
+
+@pytest.mark.asyncio
+async def test_async_stream(fake_tgi: FakeTGIServer) -> None:
+    url = f"http://127.0.0.1:{fake_tgi.server_address[1]}"
+    pool = TGIPool([url, unused_url()])
+    pool.endpoints[1].outstanding = 1
+    try:
+        text = await pool.agenerate("a", make_parameters(0.5, 0.9, 10))
+    finally:
+        await pool.aclose()
+    assert text == "click [12]"
+    assert pool.endpoints[0].outstanding == 0